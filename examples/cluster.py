@@ -156,6 +156,9 @@ class RemoteMixin( object ):
                 '-o', 'BatchMode=yes',
                 '-o', 'ForwardAgent=yes', '-tt' ]
 
+    # Our shell runs on our server, so it can't be shared
+    shareShell = False
+
     def __init__( self, name, server='localhost', user=None, serverIP=None,
                   controlPath=False, splitInit=False, **kwargs):
         """Instantiate a remote node
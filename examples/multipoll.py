@@ -2,53 +2,15 @@
 
 """
 Simple example of sending output to multiple files and
-monitoring them
+monitoring them with util.monitorFiles(), which watches all of
+them with a single inotify fd
 """
 
 
-from time import time
-from select import poll, POLLIN
-from subprocess import Popen, PIPE
-
 from mininet.topo import SingleSwitchTopo
 from mininet.net import Mininet
 from mininet.log import info, setLogLevel
-from mininet.util import decode
-
-
-def monitorFiles( outfiles, seconds, timeoutms ):
-    "Monitor set of files and return [(host, line)...]"
-    devnull = open( '/dev/null', 'w' )  # pylint: disable=consider-using-with
-    tails, fdToFile, fdToHost = {}, {}, {}
-    for h, outfile in outfiles.items():
-        tail = Popen(  # pylint: disable=consider-using-with
-            [ 'tail', '-f', outfile ],
-            stdout=PIPE, stderr=devnull )
-        fd = tail.stdout.fileno()
-        tails[ h ] = tail
-        fdToFile[ fd ] = tail.stdout
-        fdToHost[ fd ] = h
-    # Prepare to poll output files
-    readable = poll()
-    for t in tails.values():
-        readable.register( t.stdout.fileno(), POLLIN )
-    # Run until a set number of seconds have elapsed
-    endTime = time() + seconds
-    while time() < endTime:
-        fdlist = readable.poll(timeoutms)
-        if fdlist:
-            for fd, _flags in fdlist:
-                f = fdToFile[ fd ]
-                host = fdToHost[ fd ]
-                # Wait for a line of output
-                line = f.readline().strip()
-                yield host, decode( line )
-        else:
-            # If we timed out, return nothing
-            yield None, ''
-    for t in tails.values():
-        t.terminate()
-    devnull.close()  # Not really necessary
+from mininet.util import monitorFiles
 
 
 def monitorTest( N=3, seconds=3 ):
@@ -0,0 +1,273 @@
+"""
+Exec agents for Mininet nodes
+
+An agent is a small server which runs in a node's namespaces and
+listens on a unix socket, so that external programs (in any language)
+can run commands and read files in the node directly, without going
+through the Python CLI or starting mnexec for every command. Each
+connection is handled by its own thread, so many clients can use an
+agent at once, and commands are started with a plain fork and exec
+from inside the namespaces.
+
+Agents are started by Node.startAgent(), or for every node by
+Mininet( agents=True ) or mn --agents, in which case their sockets are
+Mininet.runDir/<node name>.sock, and nodes in the root namespace share
+the agent of the first of them:
+
+    net = Mininet( topo, agents=True )
+    net.start()
+    client = AgentClient( net[ 'h1' ].agentPath )
+    out, err, code = client.run( 'ip addr' )
+
+This module only uses the standard library, so that it can be run
+directly as an agent: python agent.py <socket path>
+
+Protocol: requests and responses are frames, each of which is an
+8-byte header containing two big-endian 32-bit lengths, followed by a
+JSON object (UTF-8) and a payload (bytes) of those lengths. Each
+request gets one response, in order.
+
+exec: { "op": "exec", "args": [ argv... ] } or { "op": "exec",
+      "cmd": "shell command" }, with optional "timeout" (seconds) and
+      "cwd"; the payload is the command's stdin.
+      Response: { "code": exit status (negative for signals),
+      "outSize": n, "timedOut": bool }, with stdout (n bytes) followed
+      by stderr as the payload. Commands which time out are killed,
+      along with anything they started.
+read: { "op": "read", "path": path, "offset": 0, "size": -1 }
+      Response: { "size": n }, with n bytes of data as the payload.
+ping: { "op": "ping" }
+      Response: { "pid": agent pid }
+Errors: { "error": message }, with an empty payload.
+"""
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+from subprocess import Popen, PIPE
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver  # Python 2
+
+try:
+    from subprocess import TimeoutExpired  # Python 3
+except ImportError:
+    TimeoutExpired = None
+
+
+frameHeader = struct.Struct( '!II' )
+
+
+def readExactly( sock, size ):
+    "Read size bytes from sock, or return None on EOF"
+    chunks = []
+    while size > 0:
+        data = sock.recv( min( size, 1 << 20 ) )
+        if not data:
+            return None
+        chunks.append( data )
+        size -= len( data )
+    return b''.join( chunks )
+
+
+def sendFrame( sock, header, payload=b'' ):
+    "Send a frame with JSON header and payload (bytes)"
+    header = json.dumps( header ).encode( 'utf-8' )
+    sock.sendall( frameHeader.pack( len( header ), len( payload ) ) +
+                  header + payload )
+
+
+def recvFrame( sock ):
+    """Receive a frame
+       returns: ( header, payload ), or None on EOF"""
+    sizes = readExactly( sock, frameHeader.size )
+    if sizes is None:
+        return None
+    headerSize, payloadSize = frameHeader.unpack( sizes )
+    header = readExactly( sock, headerSize )
+    payload = readExactly( sock, payloadSize )
+    if header is None or payload is None:
+        return None
+    return json.loads( header.decode( 'utf-8' ) ), payload
+
+
+def execRequest( request, payload ):
+    "Run a command for an exec request"
+    if 'args' in request:
+        args = [ str( arg ) for arg in request[ 'args' ] ]
+    else:
+        args = [ 'bash', '-c', request[ 'cmd' ] ]
+    timeout = request.get( 'timeout' )
+    # Each command runs in its own session, so that we can kill
+    # anything it starts if it times out
+    session = ( { 'start_new_session': True } if sys.version_info[ 0 ] > 2
+                else { 'preexec_fn': os.setsid } )
+    popen = Popen( args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                   cwd=request.get( 'cwd' ), **session )
+    timedOut = False
+    if timeout is None or TimeoutExpired is None:
+        out, err = popen.communicate( payload )
+    else:
+        try:
+            out, err = popen.communicate( payload, timeout=timeout )
+        except TimeoutExpired:
+            timedOut = True
+            try:
+                os.killpg( popen.pid, signal.SIGKILL )
+            except OSError:
+                pass
+            out, err = popen.communicate()
+    return ( { 'code': popen.wait(), 'outSize': len( out ),
+               'timedOut': timedOut }, out + err )
+
+
+def readRequest( request, _payload ):
+    "Read part of a file for a read request"
+    with open( request[ 'path' ], 'rb' ) as f:
+        f.seek( request.get( 'offset', 0 ) )
+        data = f.read( request.get( 'size', -1 ) )
+    return { 'size': len( data ) }, data
+
+
+def pingRequest( _request, _payload ):
+    "Reply to a ping request"
+    return { 'pid': os.getpid() }, b''
+
+
+class AgentHandler( socketserver.BaseRequestHandler ):
+    "Handle requests from one client connection"
+
+    ops = { 'exec': execRequest, 'read': readRequest, 'ping': pingRequest }
+
+    def handle( self ):
+        "Reply to requests until our client hangs up"
+        while True:
+            try:
+                frame = recvFrame( self.request )
+            except ( ValueError, socket.error ):
+                return
+            if frame is None:
+                return
+            request, payload = frame
+            op = self.ops.get( request.get( 'op' ) )
+            try:
+                if op is None:
+                    raise ValueError( 'unknown op %r' % request.get( 'op' ) )
+                response, data = op( request, payload )
+            except Exception as e:  # pylint: disable=broad-except
+                response, data = { 'error': str( e ) }, b''
+            try:
+                sendFrame( self.request, response, data )
+            except socket.error:
+                return
+
+
+class AgentServer( socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer ):
+    "Threaded unix socket server for AgentHandler"
+    daemon_threads = True
+
+
+def serve( path ):
+    """Run an agent listening on unix socket path until we receive
+       SIGTERM or SIGINT, and then remove path"""
+    # Listen before our socket appears, so clients can connect at once
+    server = AgentServer( path + '.new', AgentHandler )
+    os.rename( path + '.new', path )
+
+    def stop( _signum, _frame ):
+        "Exit cleanly"
+        raise SystemExit( 0 )
+
+    signal.signal( signal.SIGTERM, stop )
+    signal.signal( signal.SIGINT, stop )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink( path )
+        except OSError:
+            pass
+
+
+class AgentClient( object ):
+    "Connection to an agent, which may be shared by several threads"
+
+    def __init__( self, path, timeout=None ):
+        """path: agent's unix socket path
+           timeout: socket timeout in seconds (None: no timeout)"""
+        self.path = path
+        self.sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        self.sock.settimeout( timeout )
+        self.sock.connect( path )
+        self.lock = threading.Lock()  # serializes requests
+
+    def request( self, header, payload=b'' ):
+        """Send a request, and return its response
+           header: request object
+           payload: request payload (bytes)
+           returns: response object, response payload"""
+        with self.lock:
+            sendFrame( self.sock, header, payload )
+            frame = recvFrame( self.sock )
+        if frame is None:
+            raise Exception( 'agent %s hung up' % self.path )
+        if 'error' in frame[ 0 ]:
+            raise Exception( 'agent %s: %s' % ( self.path,
+                                                frame[ 0 ][ 'error' ] ) )
+        return frame
+
+    def run( self, *args, **kwargs ):
+        """Run a command in the agent's namespaces, like Node.run()
+           args: command and arguments (list), or shell command string
+           stdin: command input (string)
+           timeout: timeout in seconds
+           cwd: working directory
+           returns: stdout, stderr, exit status (None if timed out)"""
+        if len( args ) == 1:
+            args = args[ 0 ]
+        request = { 'op': 'exec' }
+        if isinstance( args, ( list, tuple ) ):
+            request[ 'args' ] = [ str( arg ) for arg in args ]
+        else:
+            request[ 'cmd' ] = args
+        for key in 'timeout', 'cwd':
+            if kwargs.get( key ) is not None:
+                request[ key ] = kwargs[ key ]
+        stdin = kwargs.get( 'stdin' ) or ''
+        response, data = self.request( request, stdin.encode( 'utf-8' ) )
+        split = response[ 'outSize' ]
+        return ( data[ :split ].decode( 'utf-8', 'replace' ),
+                 data[ split: ].decode( 'utf-8', 'replace' ),
+                 None if response[ 'timedOut' ] else response[ 'code' ] )
+
+    def read( self, path, offset=0, size=-1 ):
+        """Read a file in the agent's mount namespace
+           path: file path
+           offset: offset to start reading at
+           size: bytes to read (default: all)
+           returns: data (bytes)"""
+        return self.request( { 'op': 'read', 'path': path,
+                               'offset': offset, 'size': size } )[ 1 ]
+
+    def ping( self ):
+        "Return the agent's pid"
+        return self.request( { 'op': 'ping' } )[ 0 ][ 'pid' ]
+
+    def close( self ):
+        "Close our connection"
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    if len( sys.argv ) != 2:
+        sys.stderr.write( 'usage: %s socket-path\n' % sys.argv[ 0 ] )
+        sys.exit( 1 )
+    serve( sys.argv[ 1 ] )
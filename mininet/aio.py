@@ -0,0 +1,138 @@
+"""
+asyncio support for Mininet (Python 3 only)
+
+Node.acmd() and Node.apopen() are asynchronous versions of cmd() and
+popen(), and Mininet.gatherCmd() runs a command on many nodes at once.
+Node shells are registered with the event loop using add_reader(), so a
+single thread can overlap commands on thousands of nodes:
+
+    async def test( net ):
+        outputs = await net.gatherCmd( 'ip -br addr' )
+        iperf = await h1.apopen( 'iperf -s' )
+        await h2.acmd( 'iperf -c', h1.IP(), timeout=30 )
+        iperf.terminate()
+
+    asyncio.run( test( net ) )
+"""
+
+import asyncio
+
+# Seconds to wait for an interrupted command to return to the prompt
+interruptTimeout = 1
+
+
+async def lockShell( shell, deadline ):
+    """Acquire shell's lock without blocking the event loop, once no
+       other command is using it (the lock is reentrant, so it doesn't
+       keep out other coroutines in our thread)
+       deadline: loop time to give up at (None to wait indefinitely)"""
+    loop = asyncio.get_event_loop()
+    while True:
+        # Ask to be woken before we look, so that we can't miss it
+        idle = shell.whenIdle( loop )
+        if shell.lock.acquire( False ):
+            if not shell.waiting:
+                idle.cancel()
+                return
+            shell.lock.release()
+        timeout = None if deadline is None else deadline - loop.time()
+        if timeout is not None and timeout <= 0:
+            idle.cancel()
+            raise asyncio.TimeoutError()
+        await asyncio.wait_for( idle, timeout )
+
+
+async def acmd( node, *args, timeout=None, **kwargs ):
+    """Send a command to node, and return its output once it completes.
+       As for cmd(), if node's shell is busy, an auxiliary shell is
+       used, and root namespace nodes may use a shared shell.
+       node: Node
+       args, kwargs: as for Node.cmd()
+       timeout: timeout in seconds (None to wait indefinitely)
+       returns: output
+       On timeout or cancellation, the command is interrupted."""
+    shell, args = node.shellFor( args, kwargs )
+    loop = asyncio.get_event_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    await lockShell( shell, deadline )
+    try:
+        return await lockedCmd( shell, args, kwargs, deadline )
+    finally:
+        shell.lock.release()
+
+
+async def lockedCmd( shell, args, kwargs, deadline ):
+    "Internal function: run a command for acmd() once shell is ours"
+    loop = asyncio.get_event_loop()
+    done = loop.create_future()
+    chunks = []
+    shell.sendCmd( *args, **kwargs )
+    stdout = shell.stdout
+    fd = stdout.fileno()
+
+    def stop():
+        "Stop watching our shell, while fd is still its output"
+        if not stdout.closed:
+            loop.remove_reader( fd )
+
+    def readable():
+        "Read available output, and check for the sentinel"
+        # We only read what is there, and leave PID markers (which
+        # may be split across reads) until the end, so we never block
+        try:
+            chunks.append( shell.monitorBytes( timeoutms=0,
+                                               findPid=False ) )
+        except OSError as e:
+            # e.g. our shell has exited
+            stop()
+            if not done.done():
+                done.set_exception( e )
+            return
+        if not shell.waiting:
+            stop()
+            if not done.done():
+                done.set_result( None )
+
+    loop.add_reader( fd, readable )
+    try:
+        # shield(): keep waiting for the sentinel if we are interrupted
+        await asyncio.wait_for( asyncio.shield( done ), None if deadline
+                                is None else deadline - loop.time() )
+    except ( asyncio.TimeoutError, asyncio.CancelledError ):
+        shell.sendInt()
+        try:
+            await asyncio.wait_for( asyncio.shield( done ),
+                                    interruptTimeout )
+        except ( asyncio.TimeoutError, asyncio.CancelledError ):
+            if not done.done():
+                # As for waitOutput(): escalate until it stops (this
+                # blocks, but only for a command which ignores SIGINT)
+                stop()
+                steps = list( kwargs.get( 'escalation' ) or
+                              shell.escalation )
+                if 'interrupt' in steps:
+                    steps = steps[ steps.index( 'interrupt' ) + 1: ]
+                shell.stopCmd( steps, chunks, findPid=False )
+        raise
+    finally:
+        if not done.done():
+            stop()
+    return shell.decoder.decode( shell.stripPid( b''.join( chunks ) ) )
+
+
+async def apopen( node, *args, **kwargs ):
+    """Start a process in node's namespaces
+       node: Node
+       args, kwargs: as for Node.popen()
+       returns: asyncio.subprocess.Process"""
+    cmd, params = node.popenArgs( args, kwargs )
+    return await asyncio.create_subprocess_exec( *cmd, **params )
+
+
+async def gatherCmd( nodes, *args, **kwargs ):
+    """Run a command on nodes concurrently
+       nodes: list of Nodes
+       args, kwargs: as for acmd()
+       returns: list of outputs, in the order of nodes"""
+    return await asyncio.gather( *[ acmd( node, *args, **kwargs )
+                                    for node in nodes ] )
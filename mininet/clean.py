@@ -8,15 +8,27 @@
 code), this script may be used to get rid of unwanted garbage.
 It may also get rid of 'false positives', but hopefully
 nothing irreplaceable!
+
+Mininet now records the resources it creates in a journal (see
+mininet.journal), so if journals are present we simply remove the
+resources they list, which is both faster and more precise. The old
+search for anything that looks like Mininet's (sweep()) is only used
+if there was nothing to replay, or if asked for, and it leaves alone
+everything listed in the journals of Mininet processes which are
+still running.
 """
 
 from subprocess import ( Popen, PIPE, check_output as co,
                          CalledProcessError )
+import os
+import signal
 import time
+from glob import glob
 
 from mininet.log import info
 from mininet.term import cleanUpScreens
-from mininet.util import decode
+from mininet.util import decode, pwait, runMany
+from mininet.journal import Journal, journal, procStat
 
 def sh( cmd ):
     "Print a command and send it to the shell"
@@ -26,20 +38,245 @@ def sh( cmd ):
     result = p.communicate()[ 0 ]
     return decode( result )
 
-def killprocs( pattern ):
-    "Reliably terminate processes matching a pattern (including args)"
-    sh( 'pkill -9 -f %s' % pattern )
+def shMany( cmds ):
+    "Print independent commands and send them to the shell concurrently"
+    for cmd in cmds:
+        info( cmd + '\n' )
+    return [ result.out for result in runMany( cmds, shell=True ) ]
+
+def kill( pids, sig=signal.SIGKILL ):
+    "Send sig to pids, which may already have exited"
+    for pid in pids:
+        try:
+            os.kill( pid, sig )
+        except OSError:
+            pass
+
+def killprocs( pattern, keep=() ):
+    """Reliably terminate processes matching a pattern (including args)
+       keep: pids to leave alone"""
     # Make sure they are gone
     while True:
         try:
-            pids = co( [ 'pgrep', '-f', pattern ] )
+            pids = decode( co( [ 'pgrep', '-f', pattern ] ) ).split()
         except CalledProcessError:
-            pids = ''
-        if pids:
-            sh( 'pkill -9 -f %s' % pattern )
-            time.sleep( .5 )
-        else:
+            pids = []
+        pids = [ int( pid ) for pid in pids if int( pid ) not in keep ]
+        if not pids:
             break
+        info( 'kill -9 %s\n' % ' '.join( str( pid ) for pid in pids ) )
+        kill( pids )
+        time.sleep( .1 )
+
+def killall( names, sig, keep=() ):
+    """Send sig to processes with any of the given names
+       keep: pids to leave alone"""
+    # The kernel truncates process names to 15 characters
+    comms = set( name[ :15 ] for name in names )
+    pids = []
+    for entry in os.listdir( '/proc' ):
+        if not entry.isdigit() or int( entry ) in keep:
+            continue
+        try:
+            with open( '/proc/%s/comm' % entry ) as f:
+                if f.read().strip() in comms:
+                    pids.append( int( entry ) )
+        except ( IOError, OSError ):
+            pass
+    kill( pids, sig )
+
+def procGone( pid ):
+    "Has process pid exited (or become a zombie)?"
+    stat = procStat( pid )
+    return not stat or stat[ 0 ] == 'Z'
+
+def isShell( pid, name ):
+    "Is pid still the shell of Mininet node name?"
+    try:
+        with open( '/proc/%d/cmdline' % pid ) as f:
+            args = f.read().split( '\0' )
+    except ( IOError, OSError ):
+        return False
+    return 'mininet:' + name in args
+
+def isJob( pid, start ):
+    "Is pid still the Node.startJob() job which started at start?"
+    stat = procStat( pid )
+    return bool( stat ) and start is not None and stat[ 19 ] == start
+
+def bootTime():
+    "Return system boot time in seconds since the epoch"
+    with open( '/proc/stat' ) as f:
+        for line in f:
+            if line.startswith( 'btime' ):
+                return int( line.split()[ 1 ] )
+    return 0
+
+def nodeProcs( records ):
+    """Return the pids of the shells (and background jobs) of journaled
+       nodes, along with everything else running in their sessions or
+       network namespaces
+       records: 'node' journal records"""
+    # Node shells are session leaders (mnexec -d), and Linux doesn't
+    # reuse a pid while it is still in use as a session id, so a
+    # shell's session is ours if the shell is still running, or if
+    # it has exited. Otherwise its pid has been reused.
+    sessions = {}
+    for record in records:
+        pid = int( record[ 'name' ] )
+        if ( procGone( pid ) or isShell( pid, record[ 'node' ] ) or
+             isJob( pid, record.get( 'start' ) ) ):
+            sessions[ pid ] = record.get( 'netns' )
+    procs = []
+    for entry in os.listdir( '/proc' ):
+        stat = procStat( entry ) if entry.isdigit() else None
+        if not stat:
+            continue
+        try:
+            netns = os.readlink( '/proc/%s/ns/net' % entry )
+        except OSError:
+            netns = None
+        procs.append( ( int( entry ), int( stat[ 3 ] ), netns ) )
+    # A namespace is ours if one of our sessions is still running in it
+    netnses = set( netns for _pid, sid, netns in procs
+                   if sid in sessions and sessions[ sid ] == netns )
+    netnses.discard( None )
+    return [ pid for pid, sid, netns in procs
+             if sid in sessions or netns in netnses ]
+
+def killNodes( records ):
+    """Kill the processes of journaled nodes (see nodeProcs())
+       records: 'node' journal records"""
+    pids = nodeProcs( records )
+    info( '*** Killing %d processes of %d nodes\n'
+          % ( len( pids ), len( records ) ) )
+    kill( pids )
+    # Wait for them to exit; namespaces and their interfaces
+    # go away along with their last process
+    delay = .001
+    for _ in range( 100 ):
+        pids = [ pid for pid in pids if not procGone( pid ) ]
+        if not pids:
+            break
+        time.sleep( delay )
+        delay = min( delay * 2, .1 )
+
+def runConcurrently( cmds ):
+    """Run shell commands concurrently and wait for them to finish
+       cmds: list of ( command, input ) where input is None or
+             a string to send to the command's stdin"""
+    popens = []
+    with open( os.devnull, 'w' ) as devnull:
+        for cmd, data in cmds:
+            info( cmd + '\n' )
+            popen = Popen(  # pylint: disable=consider-using-with
+                [ '/bin/sh', '-c', cmd ], stdin=PIPE,
+                stdout=devnull, stderr=devnull )
+            popens.append( ( popen, data ) )
+        for popen, data in popens:
+            try:
+                if data:
+                    popen.stdin.write( data.encode() )
+                popen.stdin.close()
+            except ( IOError, OSError ):
+                pass
+        pwait( [ popen for popen, _data in popens ] )
+
+def liveResources():
+    """Return the resources listed in the journals of other Mininet
+       processes which are still running
+       returns: pids, names (of intfs, bridges, files etc.) and nodes"""
+    ours = journal.filename()
+    records = []
+    for path in Journal.paths():
+        if path != ours and Journal.isLive( path ):
+            try:
+                records += Journal.read( path )
+            except ( IOError, OSError ):
+                # Its network has just been stopped
+                pass
+    nodes = [ record for record in records if record[ 'kind' ] == 'node' ]
+    pids = set( nodeProcs( nodes ) )
+    pids.update( int( record[ 'name' ] ) for record in nodes )
+    names = set( record[ 'name' ] for record in records
+                 if record[ 'kind' ] != 'node' )
+    return pids, names, set( record[ 'node' ] for record in nodes )
+
+def replayJournals():
+    """Remove all resources which Mininet journals list as outstanding,
+       and then the journals themselves. Journals of other Mininet
+       processes which are still running are left alone, along with
+       their networks.
+       returns: number of journals replayed"""
+    ours = journal.filename()
+    paths = [ path for path in Journal.paths()
+              if path == ours or not Journal.isLive( path ) ]
+    if not paths:
+        return 0
+    info( '*** Replaying %d resource journal(s)\n' % len( paths ) )
+    kinds = {}
+    boot = bootTime()
+    for path in paths:
+        try:
+            records = Journal.read( path )
+            # Processes from before a reboot are long gone
+            stale = os.path.getmtime( path ) < boot
+        except ( IOError, OSError ):
+            continue
+        for record in records:
+            if stale and record[ 'kind' ] == 'node':
+                continue
+            kinds.setdefault( record[ 'kind' ], [] ).append( record )
+
+    def names( *kindList ):
+        "Return names of outstanding resources of the given kinds"
+        return [ record[ 'name' ] for kind in kindList
+                 for record in kinds.get( kind, [] ) ]
+
+    # Processes first, since they may be holding on to the rest
+    killNodes( kinds.get( 'node', [] ) )
+    # Everything else is independent and can be removed concurrently
+    cmds = []
+    links = names( 'intf', 'bridge' )
+    if links:
+        cmds.append( ( 'ip -force -batch -',
+                       ''.join( 'link del %s\n' % link
+                                for link in links ) ) )
+    bridges = names( 'ovs' )
+    if bridges:
+        cmds.append( ( 'ovs-vsctl --timeout=5 ' +
+                       ' -- '.join( '--if-exists del-br %s' % b
+                                    for b in bridges ), None ) )
+    cgroups = names( 'cgroup' )
+    if cgroups:
+        cmds.append( ( 'cgdelete -r ' + ' '.join( cgroups ), None ) )
+    intfs = names( 'tc' )
+    if intfs:
+        cmds.append( ( 'tc -force -batch -',
+                       ''.join( 'qdisc del dev %s root\n' % i
+                                for i in intfs ) ) )
+    rules = names( 'iptables' )
+    if rules:
+        cmds.append( ( '; '.join( rules ), None ) )
+    runConcurrently( cmds )
+    for path in names( 'file' ):
+        try:
+            os.unlink( path )
+        except OSError:
+            pass
+    for path in names( 'dir' ):
+        try:
+            os.rmdir( path )
+        except OSError:
+            pass
+    for path in paths:
+        try:
+            os.unlink( path )
+        except OSError:
+            pass
+    # In case we just replayed our own journal
+    journal.reset()
+    return len( paths )
 
 class Cleanup( object ):
     "Wrapper for cleanup()"
@@ -47,28 +284,62 @@ class Cleanup( object ):
     callbacks = []
 
     @classmethod
-    def cleanup( cls):
-        """Clean up junk which might be left over from old runs;
-           do fast stuff before slow dp and link removal!"""
+    def cleanup( cls, sweep=None ):
+        """Clean up junk which might be left over from old runs
+           sweep: after replaying journals, also search for anything
+                  that looks like Mininet's (which may have been left
+                  by a version without journals), other than that of
+                  running Mininet processes (default: only if there
+                  were no journals to replay)"""
+        replayed = replayJournals()
+        if sweep is None:
+            sweep = not replayed
+        if sweep:
+            cls.sweep( liveResources() )
+        else:
+            info( "*** Removing old X11 tunnels\n" )
+            cleanUpScreens()
+
+        # Call any additional cleanup code if necessary
+        for callback in cls.callbacks:
+            callback()
+
+        info( "*** Cleanup complete.\n" )
+
+    @staticmethod
+    def sweep( keep=None ):
+        """Search for and remove junk which might be left over from old
+           runs; do fast stuff before slow dp and link removal!
+           keep: pids, names and nodes to leave alone (see
+                 liveResources())"""
+        pids, names, nodes = keep or ( (), (), () )
 
         info( "*** Removing excess controllers/ofprotocols/ofdatapaths/"
               "pings/noxes\n" )
         zombies = ( 'controller ofprotocol ofdatapath ping nox_core '
                     'lt-nox_core ovs-openflowd ovs-controller '
-                    'ovs-testcontroller udpbwtest mnexec ivs ryu-manager ' )
+                    'ovs-testcontroller udpbwtest mnexec ivs ryu-manager '
+                    ).split()
         # Note: real zombie processes can't actually be killed, since they
         # are already (un)dead. Then again,
         # you can't connect to them either, so they're mostly harmless.
         # Send SIGTERM first to give processes a chance to shutdown cleanly.
-        sh( 'killall ' + zombies + ' 2> /dev/null' )
+        killall( zombies, signal.SIGTERM, pids )
         time.sleep( 1 )
-        sh( 'killall -9 ' + zombies + ' 2> /dev/null' )
+        killall( zombies, signal.SIGKILL, pids )
 
         # And kill off sudo mnexec
-        sh( 'pkill -9 -f "sudo mnexec"')
+        killprocs( 'sudo mnexec', pids )
 
         info( "*** Removing junk from /tmp\n" )
-        sh( 'rm -f /tmp/vconn* /tmp/vlogs* /tmp/*.out /tmp/*.log' )
+        for pattern in ( '/tmp/vconn*', '/tmp/vlogs*', '/tmp/*.out',
+                         '/tmp/*.log' ):
+            for path in glob( pattern ):
+                if path not in names:
+                    try:
+                        os.unlink( path )
+                    except OSError:
+                        pass
 
         info( "*** Removing old X11 tunnels\n" )
         cleanUpScreens()
@@ -76,48 +347,46 @@ def cleanup( cls):
         info( "*** Removing excess kernel datapaths\n" )
         dps = sh( "ps ax | egrep -o 'dp[0-9]+' | sed 's/dp/nl:/'"
                   ).splitlines()
-        for dp in dps:
-            if dp:
-                sh( 'dpctl deldp ' + dp )
+        shMany( [ 'dpctl deldp ' + dp for dp in dps if dp ] )
         info( "***  Removing OVS datapaths\n" )
-        dps = sh("ovs-vsctl --timeout=1 list-br").strip().splitlines()
+        dps = [ dp for dp in
+                sh( "ovs-vsctl --timeout=1 list-br" ).strip().splitlines()
+                if dp not in names ]
         if dps:
             sh( "ovs-vsctl " + " -- ".join( "--if-exists del-br " + dp
                                             for dp in dps if dp ) )
         # And in case the above didn't work...
         dps = sh( "ovs-vsctl --timeout=1 list-br" ).strip().splitlines()
-        for dp in dps:
-            sh( 'ovs-vsctl del-br ' + dp )
+        shMany( [ 'ovs-vsctl del-br ' + dp for dp in dps
+                  if dp and dp not in names ] )
 
         info( "*** Removing all links of the pattern foo-ethX\n" )
         links = sh( "ip link show | "
                     "egrep -o '([-_.[:alnum:]]+-eth[[:digit:]]+)'"
                     ).splitlines()
+        # Interfaces which may belong to running nodes are named after
+        # them, and the other ends of their links may not be journaled
+        links = [ link for link in links if link not in names and
+                  link.rsplit( '-', 1 )[ 0 ] not in nodes ]
         # Delete blocks of links
         n = 1000  # chunk size
-        for i in range( 0, len( links ), n ):
-            cmd = ';'.join( 'ip link del %s' % link
-                             for link in links[ i : i + n ] )
-            sh( '( %s ) 2> /dev/null' % cmd )
+        shMany( [ '( %s ) 2> /dev/null' %
+                  ';'.join( 'ip link del %s' % link
+                            for link in links[ i : i + n ] )
+                  for i in range( 0, len( links ), n ) ] )
 
         if 'tap9' in sh( 'ip link show' ):
             info( "*** Removing tap9 - assuming it's from cluster edition\n" )
             sh( 'ip link del tap9' )
 
         info( "*** Killing stale mininet node processes\n" )
-        killprocs( 'mininet:' )
+        killprocs( 'mininet:', pids )
 
         info( "*** Shutting down stale tunnels\n" )
-        killprocs( 'Tunnel=Ethernet' )
-        killprocs( '.ssh/mn')
+        killprocs( 'Tunnel=Ethernet', pids )
+        killprocs( '.ssh/mn', pids )
         sh( 'rm -f ~/.ssh/mn/*' )
 
-        # Call any additional cleanup code if necessary
-        for callback in cls.callbacks:
-            callback()
-
-        info( "*** Cleanup complete.\n" )
-
     @classmethod
     def addCleanupCallback( cls, callback ):
         "Add cleanup callback"
@@ -28,9 +28,7 @@
 from subprocess import call
 from cmd import Cmd
 from os import isatty
-from select import poll, POLLIN
-import select
-import errno
+from select import POLLIN
 import sys
 import time
 import os
@@ -38,7 +36,7 @@
 
 from mininet.log import info, output, error
 from mininet.term import makeTerms, runX11
-from mininet.util import ( quietRun, dumpNodeConnections,
+from mininet.util import ( quietRun, dumpNodeConnections, Reactor,
                            dumpPorts )
 
 class CLI( Cmd ):
@@ -55,9 +53,10 @@ def __init__( self, mininet, stdin=sys.stdin, script=None,
         self.mn = mininet
         # Local variable bindings for py command
         self.locals = { 'net': mininet }
-        # Attempt to handle input
-        self.inPoller = poll()
-        self.inPoller.register( stdin )
+        # Attempt to handle input; nodes are added to our
+        # reactor while we wait for them (see waitForNode())
+        self.reactor = Reactor()
+        self.reactor.register( stdin )
         self.inputFile = script
         Cmd.__init__( self, stdin=stdin, **kwargs )
         info( '*** Starting CLI:\n' )
@@ -384,8 +383,9 @@ def do_time( self, line ):
 
     def do_links( self, _line ):
         "Report on links"
+        states = self.mn.linkStatus()
         for link in self.mn.links:
-            output( link, link.status(), '\n' )
+            output( link, link.status( states[ link ] ), '\n' )
 
     def do_switch( self, line ):
         "Starts or stops a switch"
@@ -442,48 +442,39 @@ def default( self, line ):
 
     def waitForNode( self, node ):
         "Wait for a node to finish, and print its output."
-        # Pollers
-        nodePoller = poll()
-        nodePoller.register( node.stdout )
-        bothPoller = poll()
-        bothPoller.register( self.stdin, POLLIN )
-        bothPoller.register( node.stdout, POLLIN )
+        fd = self.reactor.register( node.stdout, node )
         if self.isatty():
             # Buffer by character, so that interactive
             # commands sort of work
             quietRun( 'stty -icanon min 1' )
-        while True:
-            try:
-                bothPoller.poll()
-                # XXX BL: this doesn't quite do what we want.
-                # pylint: disable=condition-evals-to-constant
-                if False and self.inputFile:
-                    key = self.inputFile.read( 1 )
-                    if key != '':
+        try:
+            while True:
+                try:
+                    ready = dict( self.reactor.poll() )
+                    # XXX BL: this doesn't quite do what we want.
+                    # pylint: disable=condition-evals-to-constant
+                    if False and self.inputFile:
+                        key = self.inputFile.read( 1 )
+                        if key != '':
+                            node.write( key )
+                        else:
+                            self.inputFile = None
+                    # pylint: enable=condition-evals-to-constant
+                    if self.stdin in ready:
+                        key = self.stdin.read( 1 )
                         node.write( key )
-                    else:
-                        self.inputFile = None
-                # pylint: enable=condition-evals-to-constant
-                if isReadable( self.inPoller ):
-                    key = self.stdin.read( 1 )
-                    node.write( key )
-                if isReadable( nodePoller ):
-                    data = node.monitor()
-                    output( data )
-                if not node.waiting:
-                    break
-            except KeyboardInterrupt:
-                # There is an at least one race condition here, since
-                # it's possible to interrupt ourselves after we've
-                # read data but before it has been printed.
-                node.sendInt()
-            except select.error as e:
-                # pylint: disable=unpacking-non-sequence
-                # pylint: disable=unbalanced-tuple-unpacking
-                errno_, errmsg = e.args
-                if errno_ != errno.EINTR:
-                    error( "select.error: %s, %s" % (errno_, errmsg) )
+                    if node in ready:
+                        data = node.monitor()
+                        output( data )
+                    if not node.waiting:
+                        break
+                except KeyboardInterrupt:
+                    # There is an at least one race condition here, since
+                    # it's possible to interrupt ourselves after we've
+                    # read data but before it has been printed.
                     node.sendInt()
+        finally:
+            self.reactor.unregister( fd )
 
     def precmd( self, line ):
         "allow for comments in the cli"
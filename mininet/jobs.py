@@ -0,0 +1,152 @@
+"""
+Background jobs for Mininet nodes
+
+Node.startJob() runs a command in the background in a node's
+namespaces (and cgroup, for CPULimitedHost), with its output going to
+a log file, and returns a Job which can be polled, waited for and
+stopped:
+
+    server = h1.startJob( 'iperf -s' )
+    h2.cmd( 'iperf -c', h1.IP() )
+    server.stop()
+    print( server.output() )
+
+Jobs started with ring=size capture their output in a fixed-size
+ring file instead (see mininet.ring), which is cheap to read for
+jobs which run for a long time.
+
+Jobs are our own children, so their exit status is always collected.
+Each job runs in its own session, so stopping it also stops anything
+it has started, and the journal lets cleanup() find it if we exit
+without stopping it.
+
+waitJobs() and stopJobs() handle any number of jobs at once, waiting
+on their pidfds with epoll where available (see util.pwait()).
+"""
+
+import os
+import signal
+
+from mininet.log import debug
+from mininet.journal import journal, procStat
+from mininet.util import pwait
+from mininet.ring import capture
+
+# Seconds to wait after SIGTERM before escalating to SIGKILL
+stopTimeout = 5
+
+
+class Job( object ):
+    "A command running in the background on a node"
+
+    def __init__( self, node, name, popen, log, managed=False, ring=None ):
+        """node: Node which started us
+           name: job name, unique for node
+           popen: Popen object for our command
+           log: path of our output log (or ring file)
+           managed: is log a temporary file, owned by node?
+           ring: RingFile capturing our output from popen.stdout"""
+        self.node, self.name, self.popen, self.log = node, name, popen, log
+        self.managed, self.ring = managed, ring
+        if ring:
+            capture.add( popen.stdout, ring )
+        self.pid = popen.pid
+        self.exitcode = None
+        try:
+            self.pidfd = os.pidfd_open( self.pid )
+        except ( AttributeError, OSError ):
+            self.pidfd = None
+        # Our start time distinguishes us from a process which
+        # reuses our pid, and which cleanup() shouldn't kill
+        stat = procStat( self.pid )
+        journal.add( 'node', self.pid, node=node.name, job=name,
+                     netns=node.netns, start=stat and stat[ 19 ] )
+        debug( '*** %s: started job %s (pid %d)\n' %
+               ( node.name, name, self.pid ) )
+
+    def __repr__( self ):
+        return '<Job %s:%s pid=%d exitcode=%s>' % (
+            self.node.name, self.name, self.pid, self.exitcode )
+
+    def poll( self ):
+        """Check whether we have exited
+           returns: exit code, or None if we are still running"""
+        if self.exitcode is None and self.popen.poll() is not None:
+            self.finished()
+        return self.exitcode
+
+    def running( self ):
+        "Are we still running?"
+        return self.poll() is None
+
+    def finished( self ):
+        "Internal method: record our exit status and release our pidfd"
+        self.exitcode = self.popen.returncode
+        if self.pidfd is not None:
+            os.close( self.pidfd )
+            self.pidfd = None
+        journal.remove( 'node', self.pid )
+
+    def kill( self, sig=signal.SIGTERM ):
+        "Send sig to our session's process group, if we are running"
+        if self.running():
+            try:
+                os.killpg( self.pid, sig )
+            except OSError:
+                pass
+
+    def wait( self, timeout=None ):
+        """Wait for us to exit
+           timeout: timeout in seconds (None: wait indefinitely)
+           returns: exit code, or None if we are still running"""
+        waitJobs( [ self ], timeout )
+        return self.poll()
+
+    def stop( self, timeout=stopTimeout ):
+        """Stop us, escalating from SIGTERM to SIGKILL
+           timeout: seconds to wait before sending SIGKILL
+           returns: exit code"""
+        stopJobs( [ self ], timeout )
+        return self.exitcode
+
+    def output( self ):
+        "Return our output so far (or our recent output, for ring files)"
+        if self.ring:
+            capture.flush( self )
+            return self.ring.recent()
+        with open( self.log ) as f:
+            return f.read()
+
+    def close( self ):
+        "Stop capturing our output, and unmap our ring file, if any"
+        if self.ring:
+            capture.flush( self, done=True )
+            self.ring.close()
+
+
+def waitJobs( jobs, timeout=None ):
+    """Wait for jobs to exit, concurrently
+       jobs: iterable of Jobs
+       timeout: overall timeout in seconds (None: wait indefinitely)
+       returns: list of Jobs which are still running"""
+    jobs = [ job for job in jobs if job.running() ]
+    pidfds = { job.popen: job.pidfd for job in jobs
+               if job.pidfd is not None }
+    pwait( [ job.popen for job in jobs ], timeout, pidfds=pidfds )
+    return [ job for job in jobs if job.running() ]
+
+
+def stopJobs( jobs, timeout=stopTimeout ):
+    """Stop jobs, sending SIGTERM to all of them and then SIGKILL to
+       any which are still running after timeout
+       jobs: iterable of Jobs
+       timeout: seconds to wait before sending SIGKILL
+       returns: list of Jobs which needed SIGKILL"""
+    jobs = [ job for job in jobs if job.running() ]
+    for job in jobs:
+        job.kill( signal.SIGTERM )
+    killed = waitJobs( jobs, timeout )
+    for job in killed:
+        job.kill( signal.SIGKILL )
+    waitJobs( killed )
+    return killed
@@ -0,0 +1,206 @@
+"""
+Resource journal for Mininet
+
+As Mininet creates resources outside of Python (node shells and their
+network namespaces, root-namespace veth pairs, bridges, cgroups, tc
+configurations, iptables rules and tmp files), it appends a record for
+each one to an on-disk journal, and a matching record when it removes
+the resource again.
+
+If Mininet exits without cleaning up after itself, mininet.clean can
+replay the journals and remove exactly the resources which are still
+outstanding, rather than searching for anything that looks like it
+might belong to Mininet.
+
+Each process has its own journal file, named after its pid and start
+time (so that mininet.clean can tell whether it is still running),
+which is removed as soon as all of the resources it records have been
+released.
+
+Records are JSON objects, one per line, with the following fields:
+
+op: 'add' or 'del'
+kind: resource type, e.g. 'node', 'intf', 'ovs', 'bridge', 'cgroup',
+      'tc', 'iptables', 'file' or 'dir' (an empty directory)
+name: resource name (unique for each kind)
+other fields: kind-specific details (e.g. the namespace of a node)
+"""
+
+import json
+import os
+import threading
+
+from mininet.log import debug
+
+
+def procStat( pid ):
+    """Return the fields of /proc/pid/stat which follow the command name,
+       or None if pid has exited"""
+    try:
+        with open( '/proc/%s/stat' % pid ) as f:
+            # Format is: pid (comm) state ppid pgrp session ...
+            return f.read().rsplit( ')', 1 )[ 1 ].split()
+    except ( IOError, OSError, IndexError ):
+        return None
+
+def procRunning( pid, start=None ):
+    """Is process pid running (and not a zombie)?
+       start: start time from procStat(), to make sure that pid
+              hasn't been reused by another process"""
+    stat = procStat( pid )
+    return ( bool( stat ) and stat[ 0 ] != 'Z' and
+             ( start is None or stat[ 19 ] == start ) )
+
+
+class Journal( object ):
+    "On-disk journal of resources created by this process"
+
+    journalDir = '/tmp/mininet-journal'
+
+    def __init__( self, path=None ):
+        """path: journal file (default: journalDir/<pid>-<start>.journal)"""
+        self.path = path
+        self.fd = None
+        self.outstanding = {}  # ( kind, name ) -> record
+        self.lock = threading.RLock()  # nodes may be used from threads
+
+    def filename( self ):
+        "Return the path of our journal file"
+        if self.path:
+            return self.path
+        pid = os.getpid()
+        stat = procStat( pid )
+        return os.path.join( self.journalDir, '%d-%s.journal' % (
+            pid, stat[ 19 ] if stat else 0 ) )
+
+    @staticmethod
+    def owner( path ):
+        """Return the pid and start time of the process which wrote a
+           journal file, or None if its name doesn't tell us
+           path: journal file"""
+        name = os.path.basename( path ).split( '.' )[ 0 ]
+        pid, _, start = name.partition( '-' )
+        if not pid.isdigit():
+            return None
+        return int( pid ), start or None
+
+    @classmethod
+    def isLive( cls, path ):
+        """Is the process which wrote a journal file still running?
+           path: journal file"""
+        owner = cls.owner( path )
+        if not owner:
+            return False
+        return procRunning( *owner )
+
+    def write( self, record ):
+        "Internal method: append a record to our journal file"
+        if self.fd is None:
+            path = self.filename()
+            if not os.path.isdir( os.path.dirname( path ) ):
+                os.makedirs( os.path.dirname( path ) )
+            flags = ( os.O_WRONLY | os.O_APPEND | os.O_CREAT |
+                      getattr( os, 'O_CLOEXEC', 0 ) )
+            self.fd = os.open( path, flags, 0o600 )
+        # A single write() per record, so records are never interleaved
+        line = json.dumps( record, sort_keys=True ) + '\n'
+        os.write( self.fd, line.encode( 'utf-8' ) )
+
+    def add( self, kind, name, **details ):
+        """Record that a resource has been created
+           kind: resource type
+           name: resource name
+           details: additional information needed to remove it"""
+        record = dict( details, op='add', kind=kind, name=str( name ) )
+        debug( '*** journal:', record, '\n' )
+        with self.lock:
+            self.outstanding[ ( kind, str( name ) ) ] = record
+            self.write( record )
+
+    def remove( self, kind, name ):
+        """Record that a resource has been removed
+           kind: resource type
+           name: resource name"""
+        key = ( kind, str( name ) )
+        with self.lock:
+            if self.outstanding.pop( key, None ) is None:
+                return
+            if self.outstanding:
+                self.write( { 'op': 'del', 'kind': kind,
+                              'name': str( name ) } )
+            else:
+                # Nothing left to clean up
+                self.reset( unlink=True )
+
+    def reset( self, unlink=False ):
+        """Forget all outstanding resources
+           unlink: also remove our journal file"""
+        with self.lock:
+            if self.fd is not None:
+                os.close( self.fd )
+                self.fd = None
+            if unlink:
+                try:
+                    os.unlink( self.filename() )
+                except OSError:
+                    pass
+            self.outstanding = {}
+
+    def adopt( self, path ):
+        """Take over the outstanding resources listed in the journal
+           of another process, which has exited
+           path: journal file"""
+        if path == self.filename() or not os.path.exists( path ):
+            return
+        for record in self.read( path ):
+            kind, name = record.pop( 'kind' ), record.pop( 'name' )
+            record.pop( 'op' )
+            if kind == 'node' and not ( record.get( 'holder' ) or
+                                        record.get( 'job' ) ):
+                # Shells are hung up when their owner exits
+                continue
+            self.add( kind, name, **record )
+        os.unlink( path )
+
+    @staticmethod
+    def read( path ):
+        """Read a journal file
+           path: journal file
+           returns: list of outstanding records, oldest first"""
+        records, order = {}, []
+        with open( path ) as f:
+            for line in f:
+                try:
+                    record = json.loads( line )
+                    key = ( record[ 'kind' ], record[ 'name' ] )
+                except ( ValueError, KeyError, TypeError ):
+                    # Probably a partial write
+                    continue
+                if record.get( 'op' ) == 'add':
+                    records[ key ] = record
+                    order.append( key )
+                else:
+                    records.pop( key, None )
+        # Keep the position of the latest 'add' for each resource
+        seen = set()
+        result = []
+        for key in reversed( order ):
+            if key in records and key not in seen:
+                seen.add( key )
+                result.append( records[ key ] )
+        result.reverse()
+        return result
+
+    @classmethod
+    def paths( cls ):
+        "Return the paths of all journal files"
+        try:
+            names = os.listdir( cls.journalDir )
+        except OSError:
+            return []
+        return sorted( os.path.join( cls.journalDir, name )
+                       for name in names if name.endswith( '.journal' ) )
+
+
+# Journal for this process
+journal = Journal()
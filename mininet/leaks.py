@@ -0,0 +1,189 @@
+"""
+Leak tracking for Mininet
+
+Programs which build and stop networks many times can run out of file
+descriptors (or processes, ptys, etc.) if anything is leaked along the
+way. LeakTracker takes a snapshot of the resources that Mininet uses
+(open fds, ptys, descendant processes, cgroups and root namespace
+interfaces) and later reports anything new which is still around,
+attributed where possible to the Node or Link which created it:
+
+    tracker = LeakTracker()
+    net = Mininet( topo )
+    net.start()
+    net.stop()
+    assert not tracker.leaks( net ), tracker.report( net )
+"""
+
+import os
+
+from mininet.util import spawner
+
+
+def readlink( path ):
+    "Return target of symbolic link path, or None"
+    try:
+        return os.readlink( path )
+    except OSError:
+        return None
+
+def openFds():
+    "Return dict of our open fds to what they refer to"
+    fds = {}
+    for entry in os.listdir( '/proc/self/fd' ):
+        target = readlink( '/proc/self/fd/' + entry )
+        if target is not None:
+            fds[ int( entry ) ] = target
+    # Ignore the fd used by listdir(), and the spawner's own
+    # namespace fds, which are opened once and kept
+    return { fd: target for fd, target in fds.items()
+             if os.path.exists( '/proc/self/fd/%d' % fd ) and
+             fd not in ( spawner.homeFds or () ) }
+
+def procTable():
+    "Return dict of pid to ( ppid, cmdline, netns ) for all processes"
+    procs = {}
+    for entry in os.listdir( '/proc' ):
+        if not entry.isdigit():
+            continue
+        try:
+            with open( '/proc/%s/stat' % entry ) as f:
+                # Format is: pid (comm) state ppid ...
+                stat = f.read().rsplit( ')', 1 )[ 1 ].split()
+            with open( '/proc/%s/cmdline' % entry ) as f:
+                cmdline = f.read().replace( '\0', ' ' ).strip()
+        except ( IOError, OSError, IndexError ):
+            continue
+        netns = readlink( '/proc/%s/ns/net' % entry )
+        procs[ int( entry ) ] = ( int( stat[ 1 ] ), cmdline, netns )
+    return procs
+
+def descendants( procs, pid ):
+    "Return dict of the descendants of pid to their ppids"
+    result, parents = {}, { pid }
+    while parents:
+        children = { child: proc[ 0 ] for child, proc in procs.items()
+                     if proc[ 0 ] in parents and child not in result }
+        result.update( children )
+        parents = set( children )
+    return result
+
+def cgroupDir():
+    "Return the directory containing Mininet's cpu cgroups"
+    for path in '/sys/fs/cgroup/cpu', '/sys/fs/cgroup':
+        if os.path.isdir( path ):
+            return path
+    return None
+
+
+class LeakTracker( object ):
+    "Report resources which have appeared since a snapshot"
+
+    kinds = ( 'fd', 'pty', 'process', 'cgroup', 'intf' )
+
+    def __init__( self ):
+        self.before = None
+        self.start()
+
+    def start( self ):
+        "(Re)take our initial snapshot"
+        self.before = self.snapshot()
+
+    @staticmethod
+    def snapshot( netnses=(), pids=() ):
+        """Return current resources as a dict of kind to a dict of
+           resource ids to descriptions
+           netnses: also include processes in these network namespaces
+           pids: also include these processes"""
+        fds = openFds()
+        procs = procTable()
+        ours = descendants( procs, os.getpid() )
+        # Namespace holders (see Node.hold()) of attached nodes and
+        # daemons which have detached from node shells are not our
+        # descendants; other Mininet processes are none of our business
+        ours.update( { pid: ppid for pid, ( ppid, _cmd, netns )
+                       in procs.items() if pid in pids
+                       or netns in netnses } )
+        cgroups = cgroupDir()
+        return {
+            'fd': { fd: target for fd, target in fds.items()
+                    if not target.startswith( '/dev/pts/' ) and
+                    target != '/dev/ptmx' },
+            'pty': { fd: target for fd, target in fds.items()
+                     if target.startswith( '/dev/pts/' ) or
+                     target == '/dev/ptmx' },
+            'process': { pid: '%s (ppid %d)' % ( procs[ pid ][ 1 ], ppid )
+                         for pid, ppid in ours.items() },
+            'cgroup': { name: os.path.join( cgroups, name )
+                        for name in ( os.listdir( cgroups )
+                                      if cgroups else [] )
+                        if os.path.isdir( os.path.join( cgroups, name ) ) },
+            'intf': { name: 'root namespace interface'
+                      for name in os.listdir( '/sys/class/net' ) } }
+
+    @staticmethod
+    def owners( nets ):
+        """Return dict of ( kind, id ) to the Node or Link which is the
+           likely creator of that resource
+           nets: Mininet objects whose nodes and links to check"""
+        owners = {}
+        for net in nets:
+            for node in net.hosts + net.switches + net.controllers:
+                for fd in node.master, node.slave:
+                    if fd is not None:
+                        owners[ 'pty', fd ] = node
+                for pid in node.pid, node.holder:
+                    if pid:
+                        owners[ 'process', pid ] = node
+                if node.netns:
+                    owners[ 'netns', node.netns ] = node
+                owners[ 'cgroup', node.name ] = node
+                for intf in node.intfList():
+                    owners[ 'intf', intf.name ] = node
+            for link in net.links:
+                for intf in link.intf1, link.intf2:
+                    if intf:
+                        owners[ 'intf', intf.name ] = link
+        return owners
+
+    def leaks( self, *nets ):
+        """Return list of ( kind, id, description, owner ) for resources
+           which have appeared since our snapshot and are still around
+           nets: Mininet objects used to attribute resources"""
+        owners = self.owners( nets )
+        netnses = set( key for kind, key in owners if kind == 'netns' )
+        pids = set( key for kind, key in owners if kind == 'process' )
+        after = self.snapshot( netnses, pids )
+        nodes = [ node for net in nets
+                  for node in net.hosts + net.switches + net.controllers ]
+        procs = procTable()
+        result = []
+        for kind in self.kinds:
+            for key in sorted( set( after[ kind ] ) -
+                               set( self.before[ kind ] ) ):
+                owner = owners.get( ( kind, key ) )
+                if owner is None and kind == 'intf':
+                    # Interfaces are named after their nodes
+                    owner = next( ( node for node in nodes
+                                    if key.startswith( node.name + '-' ) ),
+                                  None )
+                if owner is None and kind == 'process' and key in procs:
+                    # Processes started by node shells
+                    owner = owners.get( ( 'netns', procs[ key ][ 2 ] ) )
+                    owner = owner or next(
+                        ( node for node in nodes if node.pid and
+                          key in descendants( procs, node.pid ) ), None )
+                result.append( ( kind, key, after[ kind ][ key ], owner ) )
+        return result
+
+    def report( self, *nets ):
+        "Return a readable report of leaks( *nets )"
+        lines = []
+        for kind, key, description, owner in self.leaks( *nets ):
+            created = ''
+            if owner is not None:
+                created = ' from %s %s' % ( type( owner ).__name__,
+                                            getattr( owner, 'name', owner ) )
+            lines.append( '%s %s: %s%s' % ( kind, key, description,
+                                            created ) )
+        return '\n'.join( lines )
@@ -20,19 +20,52 @@
 
 Intf: basic interface object that can configure itself
 TCIntf: interface with bandwidth limiting and delay via tc
+TCBatch: runs the tc commands of many TCIntfs with tc -batch
 
 Link: basic link class for creating veth pairs
 """
 
+import json
 import re
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from subprocess import PIPE, STDOUT
 
 from mininet.log import info, error, debug
-from mininet.util import makeIntfPair, isPrefixValid, isIpValid, isMACValid
+from mininet.journal import journal
+from mininet.util import ( makeIntfPair, isPrefixValid, isIpValid, isMACValid,
+                           isIp6Valid, isPrefix6Valid, decode, encode )
 
 # Make pylint happy:
 # pylint: disable=too-many-arguments
 
 
+# Interface state and counters, as reported by ip -s -j link
+IntfState = namedtuple( 'IntfState', 'operstate carrier mtu rxBytes rxPackets '
+                        'rxErrors rxDropped txBytes txPackets txErrors '
+                        'txDropped' )
+
+def parseIpLink( text ):
+    """Parse the output of ip -s -j link show
+       returns: dict of intf names to IntfStates"""
+    try:
+        entries = json.loads( text )
+    except ValueError:
+        # e.g. a missing device
+        return {}
+    states = {}
+    for entry in entries:
+        stats = entry.get( 'stats64', entry.get( 'stats', {} ) )
+        rx, tx = stats.get( 'rx', {} ), stats.get( 'tx', {} )
+        states[ entry[ 'ifname' ] ] = IntfState(
+            entry.get( 'operstate' ), 'LOWER_UP' in entry.get( 'flags', [] ),
+            entry.get( 'mtu' ),
+            *( counters.get( name ) for counters in ( rx, tx )
+               for name in ( 'bytes', 'packets', 'errors', 'dropped' ) ) )
+    return states
+
+
 class Intf( object ):
 
     "Basic interface object that can configure itself."
@@ -48,6 +81,7 @@ def __init__( self, name, node=None, port=None, link=None,
         self.link = link
         self.mac = mac
         self.ip, self.prefixLen = None, None
+        self.ip6, self.prefixLen6 = None, None
 
         # if interface is lo, we know the ip is 127.0.0.1.
         # This saves an ifconfig command per node
@@ -108,6 +142,28 @@ def setIP( self, ipstr, prefixLen=None ):
         else:
             raise Exception( 'IP address and prefix values cannot set to: %s/%s' % (ip, pref))
 
+    def setIP6( self, ipstr, prefixLen=None ):
+        """Set our (global) IPv6 address
+           ipstr: IPv6 address, optionally with /prefixLen
+           prefixLen: prefix length if not given in ipstr (64)
+           The address is added with nodad, so that it is usable
+           immediately rather than after duplicate address detection."""
+        if '/' in ipstr:
+            ip, pref = ipstr.split( '/' )
+        else:
+            ip, pref = ipstr, prefixLen if prefixLen is not None else 64
+        if isIp6Valid( ip ) and isPrefix6Valid( pref ):
+            oldip, oldpref = self.ip6, self.prefixLen6
+            self.ip6, self.prefixLen6 = ip, pref
+            if oldip is not None and oldpref is not None:
+                self.cmd( 'ip -6 addr del %s/%s' % ( oldip, oldpref ),
+                          'dev', self.name )
+            return self.cmd( 'ip -6 addr add %s/%s' % ( ip, pref ),
+                             'dev', self.name, 'nodad' )
+        else:
+            raise Exception( 'IPv6 address and prefix values cannot set to: '
+                             '%s/%s' % ( ip, pref ) )
+
     def setMAC( self, macstr ):
         """Set the MAC address for an interface.
            macstr: MAC address as string"""
@@ -121,6 +177,7 @@ def setMAC( self, macstr ):
 
     _ipMatchRegex = re.compile( r'\d+\.\d+\.\d+\.\d+\/\d+' )
     _macMatchRegex = re.compile( r'..:..:..:..:..:..' )
+    _ip6MatchRegex = re.compile( r'inet6 ([0-9a-fA-F:]+/\d+) scope global' )
 
     def updateIP( self ):
         "Return updated IP address based on ip addr show dev"
@@ -132,6 +189,15 @@ def updateIP( self ):
         self.ip, self.prefixLen = ips[ 0 ].split( '/' ) if ips else (None, None)
         return self.ip
 
+    def updateIP6( self ):
+        "Return updated (global) IPv6 address based on ip addr show dev"
+        ipaddr, _err, _exitCode = self.node.pexec(
+            'ip -6 addr show dev %s' % self.name )
+        ips = self._ip6MatchRegex.findall( ipaddr )
+        self.ip6, self.prefixLen6 = ( ips[ 0 ].split( '/' ) if ips
+                                      else ( None, None ) )
+        return self.ip6
+
     def updateMAC( self ):
         "Return updated MAC address based on ip link show dev"
         macaddr = self.cmd( 'ip link show dev', self.name )
@@ -144,11 +210,15 @@ def updateMAC( self ):
     # This saves an ip command, which improves performance.
 
     def updateAddr( self ):
-        "Return IP address and MAC address based on ip addr show dev."
+        """Return IP address and MAC address based on ip addr show dev.
+           Also updates the (global) IPv6 address, see IP6()."""
         macandip = self.cmd( 'ip addr show dev', self.name )
         ips = self._ipMatchRegex.findall( macandip )
+        ip6s = self._ip6MatchRegex.findall( macandip )
         macs = self._macMatchRegex.findall( macandip )
         self.ip, self.prefixLen = ips[ 0 ].split( '/' ) if ips else (None, None)
+        self.ip6, self.prefixLen6 = ( ip6s[ 0 ].split( '/' ) if ip6s
+                                      else ( None, None ) )
         self.mac = macs[ 0 ] if macs else None
         return self.ip, self.mac
 
@@ -156,6 +226,10 @@ def IP( self, update=False ):
         "Return IP address"
         return self.updateIP() if update else self.ip
 
+    def IP6( self, update=False ):
+        "Return (global) IPv6 address"
+        return self.updateIP6() if update else self.ip6
+
     def MAC( self, update=False ):
         "Return MAC address"
         return self.updateMAC() if update else self.mac
@@ -163,10 +237,10 @@ def MAC( self, update=False ):
     def isUp( self, setUp=False ):
         "Return whether interface is up"
         if setUp:
-            cmdOutput = self.cmd( 'ip link set', self.name, 'up' )
-            # no output indicates success
-            if cmdOutput:
-                error( "Error setting %s up: %s " % ( self.name, cmdOutput ) )
+            out, err, exitcode = self.node.run( 'ip link set', self.name,
+                                                'up' )
+            if exitcode:
+                error( "Error setting %s up: %s " % ( self.name, out + err ) )
                 return False
             else:
                 return True
@@ -218,10 +292,11 @@ def setParam( self, results, method, **param ):
         return result
 
     def config( self, mac=None, ip=None, ipLink=None, ipAddress=None,
-                up=True, **_params ):
+                up=True, ip6=None, **_params ):
         """Configure Node according to (optional) parameters:
            mac: MAC address
            ip: IP address
+           ip6: IPv6 address
            ipLink and ipAddress: arbitrary interface configuration
            Subclasses should override this method and call
            the parent class's config(**params)"""
@@ -231,6 +306,7 @@ def config( self, mac=None, ip=None, ipLink=None, ipAddress=None,
         r = {}
         self.setParam( r, 'setMAC', mac=mac )
         self.setParam( r, 'setIP', ip=ip )
+        self.setParam( r, 'setIP6', ip6=ip6 )
         self.setParam( r, 'isUp', up=up )
         self.setParam( r, 'ipLink', ipLink=ipLink )
         self.setParam( r, 'ipAddress', ipAddress=ipAddress )
@@ -243,16 +319,24 @@ def delete( self ):
         # if self.node.inNamespace:
         # Link may have been dumped into root NS
         # quietRun( 'ip link del ' + self.name )
+        journal.remove( 'intf', self.name )
+        journal.remove( 'tc', self.name )
         self.node.delIntf( self )
         self.link = None
 
-    def status( self ):
-        "Return intf status as a string"
-        links, _err, _result = self.node.pexec( 'ip link show' )
-        if self.name in links:
-            return "OK"
-        else:
-            return "MISSING"
+    def state( self ):
+        "Return our IntfState, or None if we are missing"
+        out, _err, _code = self.node.pexec(
+            [ 'ip', '-s', '-j', 'link', 'show', 'dev', self.name ] )
+        return parseIpLink( out ).get( self.name )
+
+    def status( self, state=False ):
+        """Return intf status as a string
+           state: our IntfState (or None) if known, e.g. from
+                  Mininet.linkStatus()"""
+        if state is False:
+            state = self.state()
+        return "OK" if state else "MISSING"
 
     def __repr__( self ):
         return '<%s %s>' % ( self.__class__.__name__, self.name )
@@ -270,6 +354,8 @@ class TCIntf( Intf ):
     # For higher data rates, we will probably need to change them.
     bwParamMax = 1000
 
+    hasQdisc = False  # have we configured our root qdisc?
+
     def bwCmds( self, bw=None, speedup=0, use_hfsc=False, use_tbf=False,
                 latency_ms=None, enable_ecn=False, enable_red=False ):
         "Return tc commands to set bandwidth"
@@ -289,17 +375,19 @@ def bwCmds( self, bw=None, speedup=0, use_hfsc=False, use_tbf=False,
             # are specifying the correct sizes. For now I have used
             # the same settings we had in the mininet-hifi code.
             if use_hfsc:
-                cmds += [ '%s qdisc add dev %s root handle 5:0 hfsc default 1',
+                cmds += [ '%s qdisc replace dev %s root handle 5:0 hfsc '
+                          'default 1',
                           '%s class add dev %s parent 5:0 classid 5:1 hfsc sc '
                           + 'rate %fMbit ul rate %fMbit' % ( bw, bw ) ]
             elif use_tbf:
                 if latency_ms is None:
                     latency_ms = 15.0 * 8 / bw
-                cmds += [ '%s qdisc add dev %s root handle 5: tbf ' +
+                cmds += [ '%s qdisc replace dev %s root handle 5: tbf ' +
                           'rate %fMbit burst 15000 latency %fms' %
                           ( bw, latency_ms ) ]
             else:
-                cmds += [ '%s qdisc add dev %s root handle 5:0 htb default 1',
+                cmds += [ '%s qdisc replace dev %s root handle 5:0 htb '
+                          'default 1',
                           '%s class add dev %s parent 5:0 classid 5:1 htb ' +
                           'rate %fMbit burst 15k' % bw ]
             parent = ' parent 5:1 '
@@ -337,8 +425,10 @@ def delayCmds( parent, delay=None, jitter=None,
                 'limit %d' % max_queue_size if max_queue_size is not None
                 else '' )
             if netemargs:
-                cmds = [ '%s qdisc add dev %s ' + parent +
-                         ' handle 10: netem ' +
+                # A root qdisc replaces the default one
+                cmds = [ '%s qdisc ' +
+                         ( 'replace' if 'root' in parent else 'add' ) +
+                         ' dev %s ' + parent + ' handle 10: netem ' +
                          netemargs ]
                 parent = ' parent 10:1 '
         return cmds, parent
@@ -370,7 +460,9 @@ def config(  # pylint: disable=arguments-renamed,arguments-differ
            latency_ms: TBF latency parameter
            enable_ecn: enable ECN (False)
            enable_red: enable RED (False)
-           max_queue_size: queue limit parameter for netem"""
+           max_queue_size: queue limit parameter for netem
+           tc commands are run with tc -batch, or added to the active
+           TCBatch, in which case result[ 'tcoutputs' ] is None"""
 
         # Support old names for parameters
         gro = not params.pop( 'disable_gro', not gro )
@@ -381,24 +473,26 @@ def on( isOn ):
             "Helper method: bool -> 'on'/'off'"
             return 'on' if isOn else 'off'
 
-        # Set offload parameters with ethool
-        self.cmd( 'ethtool -K', self,
-                  'gro', on( gro ),
-                  'tx', on( txo ),
-                  'rx', on( rxo ) )
+        # Set offload parameters with ethtool
+        ethtool = 'ethtool -K %s gro %s tx %s rx %s' % (
+            self, on( gro ), on( txo ), on( rxo ) )
+        batch = TCBatch.active()
 
         # Optimization: return if nothing else to configure
         # Question: what happens if we want to reset things?
         if ( bw is None and not delay and not loss
              and max_queue_size is None ):
+            if batch:
+                batch.add( self, [], ethtool )
+            else:
+                self.cmd( ethtool )
             return None
 
-        # Clear existing configuration
-        tcoutput = self.tc( '%s qdisc show dev %s' )
-        if "priomap" not in tcoutput and "noqueue" not in tcoutput:
-            cmds = [ '%s qdisc del dev %s root' ]
-        else:
-            cmds = []
+        # Our root qdisc replaces any existing one, but one of the same
+        # kind is changed in place, keeping its children; so if we have
+        # configured it before, we replace it with another kind first
+        cmds = ( [ '%s qdisc replace dev %s root pfifo' ] if self.hasQdisc
+                 else [] )
 
         # Bandwidth limits via various methods
         bwcmds, parent = self.bwCmds( bw=bw, speedup=speedup,
@@ -424,20 +518,138 @@ def on( isOn ):
                     if enable_red else [] ) )
         info( '(' + ' '.join( stuff ) + ') ' )
 
-        # Execute all the commands in our node
-        debug("at map stage w/cmds: %s\n" % cmds)
-        tcoutputs = [ self.tc(cmd) for cmd in cmds ]
-        for output in tcoutputs:
-            if output != '':
-                error( "*** Error: %s" % output )
-        debug( "cmds:", cmds, '\n' )
-        debug( "outputs:", tcoutputs, '\n' )
+        # Execute all the commands in one tc -batch, now or later
+        debug( "at map stage w/cmds: %s\n" % cmds )
+        lines = [ ' '.join( ( cmd % ( '', self ) ).split() )
+                  for cmd in cmds ]
+        tcoutputs = None
+        if batch:
+            batch.add( self, lines, ethtool )
+        else:
+            batch = TCBatch()
+            batch.add( self, lines, ethtool )
+            # We have no outputs if bwCmds/delayCmds rejected everything
+            tcoutputs = batch.run().get( self, [] )
+            debug( "outputs:", tcoutputs, '\n' )
+        self.hasQdisc = self.hasQdisc or bool( lines )
+        # Veth pairs take their tc config with them, but a stand-alone
+        # root namespace interface would keep it after a crash
+        if not self.link and not self.node.inNamespace:
+            journal.add( 'tc', self.name )
         result[ 'tcoutputs'] = tcoutputs
         result[ 'parent' ] = parent
 
         return result
 
 
+class TCBatch( object ):
+    """Run the tc commands of many TCIntfs with one tc -batch per
+       network namespace, rather than one tc (and a shell round trip)
+       per command. While a batch is active in a thread, TCIntf.config()
+       adds its commands to it; they are run when the batch exits:
+
+           with TCBatch():
+               for ...: net.addLink( ..., cls=TCLink, bw=10 )
+
+       tc reports the line number of each failed command, which we use
+       to report errors for the intf which owns it."""
+
+    local = threading.local()  # active batch of each thread
+    failed = re.compile( r'^Command failed -:(\d+)$', re.MULTILINE )
+
+    def __init__( self ):
+        self.entries = {}  # namespace key to [ node, ethtool, lines ]
+        self.owners = {}  # namespace key to list of ( intf, index )
+        self.previous = None
+
+    @staticmethod
+    def active():
+        "Return the active batch in this thread, or None"
+        return getattr( TCBatch.local, 'batch', None )
+
+    def __enter__( self ):
+        self.previous = self.active()
+        TCBatch.local.batch = self
+        return self
+
+    def __exit__( self, excType, *_args ):
+        TCBatch.local.batch = self.previous
+        if excType is None:
+            self.run()
+
+    @staticmethod
+    def nsKey( node ):
+        "Return the namespace of node (root namespaces by server)"
+        return node.netns or ( 'root', getattr( node, 'server', None ) )
+
+    def add( self, intf, lines, ethtool=None ):
+        """Add commands for intf
+           intf: TCIntf
+           lines: tc commands, without the leading tc
+           ethtool: ethtool command to run first (optional)"""
+        key = self.nsKey( intf.node )
+        entry = self.entries.setdefault( key, [ intf.node, [], [] ] )
+        owners = self.owners.setdefault( key, [] )
+        if ethtool:
+            entry[ 1 ].append( ethtool )
+        for index, line in enumerate( lines ):
+            entry[ 2 ].append( line )
+            owners.append( ( intf, index ) )
+
+    def runNamespace( self, key ):
+        """Run the commands for namespace key
+           returns: output of tc"""
+        node, ethtools, lines = self.entries[ key ]
+        # ethtool failures (e.g. for unsupported offloads) are ignored,
+        # as they always have been
+        script = ''.join( '%s >/dev/null 2>&1; ' % cmd for cmd in ethtools )
+        if lines:
+            script += 'exec tc -force -batch -'
+        if not script:
+            return ''
+        popen = node.popen( [ 'sh', '-c', script ], stdin=PIPE,
+                            stdout=PIPE, stderr=STDOUT )
+        out, _err = popen.communicate(
+            encode( ''.join( line + '\n' for line in lines ) ) )
+        return decode( out )
+
+    def run( self ):
+        """Run all of our commands, one namespace per thread, and
+           report any errors
+           returns: dict of intf to list of outputs, one per command
+                    ('' if it succeeded)"""
+        keys = list( self.entries )
+        outputs = {}
+        for key in keys:
+            for intf, _index in self.owners.get( key, () ):
+                outputs.setdefault( intf, [] ).append( '' )
+        if len( keys ) < 2:
+            results = [ self.runNamespace( key ) for key in keys ]
+        else:
+            pool = ThreadPool( min( len( keys ), 64 ) )
+            try:
+                results = pool.map( self.runNamespace, keys )
+            finally:
+                pool.close()
+                pool.join()
+        for key, out in zip( keys, results ):
+            owners, start = self.owners.get( key, [] ), 0
+            # Each failed command's messages are followed by
+            # Command failed -:<line number>
+            for match in self.failed.finditer( out ):
+                msg = out[ start:match.start() ].strip()
+                start = match.end()
+                line = int( match.group( 1 ) ) - 1
+                if not 0 <= line < len( owners ):
+                    continue
+                intf, index = owners[ line ]
+                outputs[ intf ][ index ] = msg or 'failed'
+                error( '*** Error: %s: tc %s: %s\n' % (
+                    intf, self.entries[ key ][ 2 ][ line ], msg ) )
+        self.entries, self.owners = {}, {}
+        return outputs
+
+
 class Link( object ):
 
     """A basic link is just a veth pair.
@@ -471,9 +683,9 @@ def __init__( self, node1, node2, port1=None, port2=None,
         if port2 is not None:
             params2[ 'port' ] = port2
         if 'port' not in params1:
-            params1[ 'port' ] = node1.newPort()
+            params1[ 'port' ] = node1.reservePort()
         if 'port' not in params2:
-            params2[ 'port' ] = node2.newPort()
+            params2[ 'port' ] = node2.reservePort()
         if not intfName1:
             intfName1 = self.intfName( node1, params1[ 'port' ] )
         if not intfName2:
@@ -497,13 +709,16 @@ def __init__( self, node1, node2, port1=None, port2=None,
         if not cls2:
             cls2 = intf
 
-        intf1 = cls1( name=intfName1, node=node1,
-                      link=self, mac=addr1, **params1  )
+        # intf1 is set before intf2 is created so that node2 can
+        # index the new link when intf2 is added to it
+        self.intf1, self.intf2 = None, None
+        self.intf1 = cls1( name=intfName1, node=node1,
+                           link=self, mac=addr1, **params1  )
         intf2 = cls2( name=intfName2, node=node2,
                       link=self, mac=addr2, **params2 )
 
         # All we are is dust in the wind, and our two interfaces
-        self.intf1, self.intf2 = intf1, intf2
+        self.intf2 = intf2
 
     # pylint: enable=too-many-branches
 
@@ -546,9 +761,13 @@ def stop( self ):
         "Override to stop and clean up link as needed"
         self.delete()
 
-    def status( self ):
-        "Return link status as a string"
-        return "(%s %s)" % ( self.intf1.status(), self.intf2.status() )
+    def status( self, states=None ):
+        """Return link status as a string
+           states: IntfStates (or None) of intf1 and intf2 if known,
+                   e.g. from Mininet.linkStatus()"""
+        states = states or ( False, False )
+        return "(%s %s)" % ( self.intf1.status( states[ 0 ] ),
+                             self.intf2.status( states[ 1 ] ) )
 
     def __str__( self ):
         return '%s<->%s' % ( self.intf1, self.intf2 )
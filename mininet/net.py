@@ -84,29 +84,45 @@
 After all desired tests or activities have been completed, the stop()
 method may be called to shut down the network.
 
+Nodes may be created and commands run from multiple threads: address
+and port allocation is atomic, and each node serializes access to its
+shell (see Node). parallel() runs a function on many nodes using a
+pool of worker threads, e.g. net.parallel( lambda h: h.cmd( 'ping
+-c1 10.1' ) ).
+
 """
 
+import json
 import os
 import re
 import select
 import signal
 import random
+import threading
+
+from importlib import import_module
 
 from sys import exit  # pylint: disable=redefined-builtin
-from time import sleep
+from tempfile import mkdtemp
+from time import sleep, time as now
 from itertools import chain, groupby
 from math import ceil
+from multiprocessing.pool import ThreadPool
 
 from mininet.cli import CLI
 from mininet.log import info, error, output, warn
 from mininet.node import ( Node, Host, OVSKernelSwitch, DefaultController,
-                           Controller )
+                           Controller, CmdTimeout )
 from mininet.nodelib import NAT
-from mininet.link import Link, Intf
+from mininet.link import Link, Intf, TCBatch, parseIpLink
 from mininet.util import ( quietRun, fixLimits, numCores, ensureRoot,
                            macColonHex, ipStr, ipParse, netParse, ipAdd,
-                           waitListening, BaseString, fmtBps )
+                           net6Parse, ip6Add, pwait, Reactor,
+                           waitListening, BaseString, fmtBps, listRemove )
 from mininet.term import cleanUpScreens, makeTerms
+from mininet.journal import journal, procStat, procRunning
+from mininet.jobs import stopJobs
+from mininet.netlink import LinkMonitor
 
 # Mininet version: should be consistent with README and LICENSE
 VERSION = "2.3.1b4"
@@ -118,9 +134,10 @@ class Mininet( object ):
     def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
                   controller=DefaultController, link=Link, intf=Intf,
                   build=True, xterms=False, cleanup=False, ipBase='10.0.0.0/8',
-                  inNamespace=False,
+                  ip6Base=None, inNamespace=False,
                   autoSetMacs=False, autoStaticArp=False, autoPinCpus=False,
-                  listenPort=None, waitConnected=False ):
+                  listenPort=None, waitConnected=False, fastStop=False,
+                  statefile=None, agents=False ):
         """Create Mininet object.
            topo: Topo (topology) object or None
            switch: default Switch class
@@ -129,6 +146,9 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
            link: default Link class/constructor
            intf: default Intf class/constructor
            ipBase: base IP address for hosts,
+           ip6Base: base IPv6 address for hosts (None: IPv4 only),
+               e.g. 'fc00::/64'; also turns off IPv6 DAD and router
+               solicitations in host namespaces, see Node.configIPv6()
            build: build now from topo?
            xterms: if build now, spawn xterms?
            cleanup: if build now, cleanup before creating?
@@ -139,7 +159,12 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
            listenPort: base listening port to open; will be incremented for
                each additional switch in the net if inNamespace=False
            waitConnected: wait for switches to Connect?
-               (False; True/None=wait indefinitely; time(s)=timed wait)"""
+               (False; True/None=wait indefinitely; time(s)=timed wait)
+           fastStop: use fast teardown in stop() by default?
+           statefile: save runtime state here on start(), so that
+               another process can attach() to the network
+           agents: start an exec agent in each node on start(), listening
+               on runDir/<node name>.sock (see mininet.agent)"""
         self.topo = topo
         self.switch = switch
         self.host = host
@@ -151,6 +176,9 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         hostIP = ( 0xffffffff >> self.prefixLen ) & self.ipBaseNum
         # Start for address allocation
         self.nextIP = hostIP if hostIP > 0 else 1
+        self.ip6Base = ip6Base
+        if ip6Base:
+            self.ip6BaseNum, self.prefixLen6 = net6Parse( self.ip6Base )
         self.inNamespace = inNamespace
         self.xterms = xterms
         self.cleanup = cleanup
@@ -161,6 +189,11 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         self.nextCore = 0  # next core for pinning hosts to CPUs
         self.listenPort = listenPort
         self.waitConn = waitConnected
+        self.fastStop = fastStop
+        self.statefile = statefile
+        self.agents = agents
+        self.runDir = None  # directory for agent sockets
+        self.linkMonitor = None  # see monitorLinks()
 
         self.hosts = []
         self.switches = []
@@ -168,6 +201,10 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         self.links = []
 
         self.nameToNode = {}  # name to Node (Host/Switch) objects
+        self.nodeToList = {}  # Node to the list it is in (e.g. self.hosts)
+        self.linkSet = set()  # self.links, kept by addLink()/delLink()
+        self.nodeParams = {}  # node name to params it was created with
+        self.lock = threading.RLock()  # protects allocators and indexes
 
         self.terms = []  # list of spawned xterm processes
 
@@ -215,23 +252,39 @@ def addHost( self, name, cls=None, **params ):
            cls: custom host class/constructor (optional)
            params: parameters for host
            returns: added host"""
+        # Allocate addresses (and a core) atomically
+        with self.lock:
+            nextIP = self.nextIP
+            self.nextIP += 1
+            if self.autoPinCpus:
+                core = self.nextCore
+                self.nextCore = ( self.nextCore + 1 ) % self.numCores
         # Default IP and MAC addresses
-        defaults = { 'ip': ipAdd( self.nextIP,
+        defaults = { 'ip': ipAdd( nextIP,
                                   ipBaseNum=self.ipBaseNum,
                                   prefixLen=self.prefixLen ) +
                                   '/%s' % self.prefixLen }
+        if self.ip6Base:
+            defaults[ 'ip6' ] = ip6Add( nextIP,
+                                        ip6BaseNum=self.ip6BaseNum,
+                                        prefixLen=self.prefixLen6 ) + (
+                                        '/%s' % self.prefixLen6 )
         if self.autoSetMacs:
-            defaults[ 'mac' ] = macColonHex( self.nextIP )
+            defaults[ 'mac' ] = macColonHex( nextIP )
         if self.autoPinCpus:
-            defaults[ 'cores' ] = self.nextCore
-            self.nextCore = ( self.nextCore + 1 ) % self.numCores
-        self.nextIP += 1
+            defaults[ 'cores' ] = core
         defaults.update( params )
         if not cls:
             cls = self.host
         h = cls( name, **defaults )
-        self.hosts.append( h )
-        self.nameToNode[ name ] = h
+        if defaults.get( 'ip6' ):
+            # Must happen before our links are created
+            h.configIPv6()
+        with self.lock:
+            self.hosts.append( h )
+            self.nameToNode[ name ] = h
+            self.nodeToList[ h ] = self.hosts
+            self.nodeParams[ name ] = defaults
         return h
 
     def delNode( self, node, nodes=None):
@@ -239,14 +292,17 @@ def delNode( self, node, nodes=None):
            node: node to delete
            nodes: optional list to delete from (e.g. self.hosts)"""
         if nodes is None:
-            nodes = ( self.hosts if node in self.hosts else
-                      ( self.switches if node in self.switches else
-                        ( self.controllers if node in self.controllers else
-                          [] ) ) )
+            nodes = self.nodeToList.get( node, [] )
+        if self.linkMonitor:
+            self.linkMonitor.remove( node )
         node.stop( deleteIntfs=True )
         node.terminate()
-        nodes.remove( node )
-        del self.nameToNode[ node.name ]
+        with self.lock:
+            if node in self.nodeToList:
+                del self.nodeToList[ node ]
+            listRemove( nodes, node )
+            del self.nameToNode[ node.name ]
+            self.nodeParams.pop( node.name, None )
 
     def delHost( self, host ):
         "Delete a host"
@@ -258,16 +314,20 @@ def addSwitch( self, name, cls=None, **params ):
            cls: custom switch class/constructor (optional)
            returns: added switch
            side effect: increments listenPort ivar ."""
-        defaults = { 'listenPort': self.listenPort,
-                     'inNamespace': self.inNamespace }
+        with self.lock:
+            defaults = { 'listenPort': self.listenPort,
+                         'inNamespace': self.inNamespace }
+            if not self.inNamespace and self.listenPort:
+                self.listenPort += 1
         defaults.update( params )
         if not cls:
             cls = self.switch
         sw = cls( name, **defaults )
-        if not self.inNamespace and self.listenPort:
-            self.listenPort += 1
-        self.switches.append( sw )
-        self.nameToNode[ name ] = sw
+        with self.lock:
+            self.switches.append( sw )
+            self.nameToNode[ name ] = sw
+            self.nodeToList[ sw ] = self.switches
+            self.nodeParams[ name ] = defaults
         return sw
 
     def delSwitch( self, switch ):
@@ -289,10 +349,13 @@ def addController( self, name='c0', controller=None, **params ):
             # pylint: enable=maybe-no-member
         else:
             controller_new = controller( name, **params )
+            self.nodeParams[ name ] = params
         # Add new controller to net
         if controller_new:  # allow controller-less setups
-            self.controllers.append( controller_new )
-            self.nameToNode[ name ] = controller_new
+            with self.lock:
+                self.controllers.append( controller_new )
+                self.nameToNode[ name ] = controller_new
+                self.nodeToList[ controller_new ] = self.controllers
         return controller_new
 
     def delController( self, controller ):
@@ -404,20 +467,27 @@ def addLink( self, node1, node2, port1=None, port2=None,
         options.setdefault( 'addr2', self.randMac() )
         cls = self.link if cls is None else cls
         link = cls( node1, node2, **options )
-        self.links.append( link )
+        with self.lock:
+            self.links.append( link )
+            self.linkSet.add( link )
         return link
 
     def delLink( self, link ):
         "Remove a link from this network"
+        with self.lock:
+            self.linkSet.discard( link )
+            listRemove( self.links, link )
         link.delete()
-        self.links.remove( link )
 
     def linksBetween( self, node1, node2 ):
         "Return Links between node1 and node2"
-        return [ link for link in self.links
-                 if ( node1, node2 ) in (
-                    ( link.intf1.node, link.intf2.node ),
-                    ( link.intf2.node, link.intf1.node ) ) ]
+        # Nodes index their links by peer (see Node.connectionsTo()),
+        # following intfs which are moved to other nodes
+        links = []
+        for intf, _peer in node1.connectionsTo( node2 ):
+            if intf.link in self.linkSet and intf.link not in links:
+                links.append( intf.link )
+        return links
 
     def delLinkBetween( self, node1, node2, index=0, allLinks=False ):
         """Delete link(s) between node1 and node2
@@ -490,10 +560,12 @@ def buildFromTopo( self, topo=None ):
             info( switchName + ' ' )
 
         info( '\n*** Adding links:\n' )
-        for srcName, dstName, params in topo.links(
-                sort=True, withInfo=True ):
-            self.addLink( **params )
-            info( '(%s, %s) ' % ( srcName, dstName ) )
+        # tc commands for all links are run in one batch per namespace
+        with TCBatch():
+            for srcName, dstName, params in topo.links(
+                    sort=True, withInfo=True ):
+                self.addLink( **params )
+                info( '(%s, %s) ' % ( srcName, dstName ) )
 
         info( '\n' )
 
@@ -564,9 +636,23 @@ def start( self ):
         info( '\n' )
         if self.waitConn:
             self.waitConnected( self.waitConn )
-
-    def stop( self ):
-        "Stop the controller(s), switches and hosts"
+        if self.agents:
+            self.startAgents()
+        if self.statefile:
+            self.saveState( self.statefile )
+
+    def stop( self, fast=None ):
+        """Stop the controller(s), switches and hosts
+           fast: use fast teardown? (None: use fastStop)
+           Fast teardown relies on namespace destruction to remove
+           veth pairs with a namespaced end, hangs up all remaining
+           node shells at once and reaps them concurrently."""
+        if fast is None:
+            fast = self.fastStop
+        if self.linkMonitor:
+            # Our netlink sockets would keep namespaces alive
+            self.linkMonitor.stop()
+            self.linkMonitor = None
         info( '*** Stopping %i controllers\n' % len( self.controllers ) )
         for controller in self.controllers:
             info( controller.name + ' ' )
@@ -580,7 +666,12 @@ def stop( self ):
             info( '*** Stopping %i terms\n' % len( self.terms ) )
             self.stopXterms()
         info( '*** Stopping %i links\n' % len( self.links ) )
+        rootIntfs = []
         for link in self.links:
+            if fast and self.inNamespaceLink( link ):
+                rootIntfs += [ intf.name for intf in ( link.intf1, link.intf2 )
+                               if not intf.node.inNamespace ]
+                continue
             info( '.' )
             link.stop()
         info( '\n' )
@@ -595,16 +686,348 @@ def stop( self ):
                 stopped.update( { s: s for s in success } )
         for switch in self.switches:
             info( switch.name + ' ' )
-            if switch not in stopped:
+            if switch in stopped:
+                pass
+            elif fast:
+                # Namespace destruction will take care of our intfs
+                switch.stop( deleteIntfs=False )
+            else:
                 switch.stop()
-            switch.terminate()
+            if not fast:
+                switch.terminate()
         info( '\n' )
         info( '*** Stopping %i hosts\n' % len( self.hosts ) )
-        for host in self.hosts:
-            info( host.name + ' ' )
-            host.terminate()
+        if fast:
+            self.terminateNodes( self.switches + self.hosts )
+            # Namespaces are destroyed asynchronously, so make sure
+            # that their links are gone before their names are reused
+            self.waitIntfsGone( rootIntfs )
+        else:
+            for host in self.hosts:
+                info( host.name + ' ' )
+                host.terminate()
+        if self.statefile and os.path.exists( self.statefile ):
+            os.unlink( self.statefile )
+        if self.runDir:
+            # Our nodes have removed their agents' sockets
+            try:
+                os.rmdir( self.runDir )
+            except OSError:
+                pass
+            journal.remove( 'dir', self.runDir )
+            self.runDir = None
         info( '\n*** Done\n' )
 
+    def startAgents( self, nodes=None ):
+        """Start an exec agent in each node (see mininet.agent),
+           listening on runDir/<node name>.sock. Nodes in the root
+           namespace share a single agent, run by the first of them.
+           nodes: nodes to start agents in (default: all nodes)"""
+        if not self.runDir:
+            self.runDir = mkdtemp( prefix='mininet-run-' )
+            journal.add( 'dir', self.runDir )
+        allNodes = self.hosts + self.switches + self.controllers
+        if nodes is None:
+            nodes = allNodes
+        nodes = [ node for node in nodes if not node.agentPath ]
+        roots = [ node for node in nodes if not node.inNamespace ]
+        nodes = [ node for node in nodes if node.inNamespace ]
+        rootPath = next( ( node.agentPath for node in allNodes
+                           if not node.inNamespace and node.agentPath ),
+                         None )
+        if roots and not rootPath:
+            owner = roots.pop( 0 )
+            nodes.append( owner )
+            rootPath = os.path.join( self.runDir, owner.name + '.sock' )
+        info( '*** Starting %d agents in %s\n' % ( len( nodes ),
+                                                   self.runDir ) )
+        for node in nodes:
+            node.startAgent( os.path.join( self.runDir, node.name + '.sock' ),
+                             wait=False )
+        for node in nodes:
+            node.waitAgent()
+        for node in roots:
+            node.agentPath = rootPath
+
+    # Mininet() parameters saved by saveState()
+    stateParams = ( 'ipBase', 'ip6Base', 'inNamespace', 'autoSetMacs',
+                    'autoStaticArp', 'autoPinCpus', 'listenPort',
+                    'fastStop' )
+
+    @staticmethod
+    def jsonable( params ):
+        "Return the items of dict params which can be saved as JSON"
+        result = {}
+        for key, value in params.items():
+            try:
+                json.dumps( value )
+            except ( TypeError, ValueError ):
+                continue
+            result[ key ] = value
+        return result
+
+    @staticmethod
+    def className( cls ):
+        "Return importable name of cls"
+        return '%s.%s' % ( cls.__module__, cls.__name__ )
+
+    @staticmethod
+    def findClass( name, classes=None ):
+        """Return class given its importable name
+           classes: optional dict of class names to classes"""
+        classes = classes or {}
+        shortName = name.rsplit( '.', 1 )[ -1 ]
+        if name in classes or shortName in classes:
+            return classes.get( name, classes.get( shortName ) )
+        moduleName = name.rsplit( '.', 1 )[ 0 ]
+        try:
+            return getattr( import_module( moduleName ), shortName )
+        except ( ImportError, AttributeError ):
+            raise Exception( 'Cannot find class %s - try passing it in '
+                             'classes' % name )
+
+    def intfState( self, intf ):
+        "Return saved state of intf"
+        state = self.jsonable( { key: value for key, value
+                                 in vars( intf ).items()
+                                 if key not in ( 'node', 'link' ) } )
+        state.update( cls=self.className( type( intf ) ),
+                      node=intf.node.name, port=intf.node.ports[ intf ] )
+        return state
+
+    def saveState( self, path ):
+        """Save our runtime state, so that another process can attach()
+           to our network after this one exits. Nodes in namespaces are
+           held (see Node.hold()) so that their namespaces survive their
+           shells. Call again if nodes or links change after start().
+           path: state file"""
+        nodes = []
+        for listName in 'hosts', 'switches', 'controllers':
+            for node in getattr( self, listName ):
+                node.hold()
+                params = self.nodeParams.get( node.name, node.params )
+                nodes.append( {
+                    'name': node.name, 'list': listName,
+                    'cls': self.className( type( node ) ),
+                    'nsPid': node.holder,
+                    'params': self.jsonable( params ),
+                    'intfs': [ self.intfState( intf )
+                               for intf in node.intfList()
+                               if not intf.link ] } )
+        links = []
+        for link in self.links:
+            attrs = { key: value for key, value in vars( link ).items()
+                      if key not in ( 'intf1', 'intf2' ) }
+            links.append( { 'cls': self.className( type( link ) ),
+                            'attrs': self.jsonable( attrs ),
+                            'intf1': self.intfState( link.intf1 ),
+                            'intf2': self.intfState( link.intf2 ) } )
+        pid = os.getpid()
+        state = { 'pid': pid, 'start': procStat( pid )[ 19 ],
+                  'journal': journal.filename(),
+                  'params': { param: getattr( self, param )
+                              for param in self.stateParams },
+                  'nextIP': self.nextIP, 'nextCore': self.nextCore,
+                  'nodes': nodes, 'links': links }
+        # Write atomically, in case we're interrupted
+        with open( path + '.tmp', 'w' ) as f:
+            json.dump( state, f )
+        os.rename( path + '.tmp', path )
+
+    @classmethod
+    def restoreIntf( cls, node, state, link=None, classes=None ):
+        "Internal method: reconstruct an existing intf from saved state"
+        state = dict( state )
+        intfClass = cls.findClass( state.pop( 'cls' ), classes )
+        port = state.pop( 'port' )
+        state.pop( 'node' )
+        intf = intfClass.__new__( intfClass )
+        vars( intf ).update( state )
+        intf.node, intf.link = node, link
+        # The interface is already where it belongs
+        node.addIntf( intf, port=port, moveIntfFn=lambda *_args: None )
+        return intf
+
+    @classmethod
+    def attach( cls, statefile, classes=None, **params ):
+        """Reconstruct a network started by another process (with
+           statefile set) which has since exited, without rebuilding
+           it. New shells are started in the existing namespaces.
+           Processes started by the old shells (e.g. controllers or
+           user space switches) exit along with them; controllers
+           are restarted, but UserSwitch or IVSSwitch must be
+           restarted with start() if desired.
+           statefile: state file saved by saveState()
+           classes: optional dict of class names to classes which
+                    can't be imported by name (e.g. from __main__)
+           params: additional parameters for Mininet()
+           returns: Mininet object"""
+        with open( statefile ) as f:
+            state = json.load( f )
+        # (older state files have no start time to check the pid against)
+        if procRunning( state[ 'pid' ], state.get( 'start' ) ):
+            raise Exception( 'Network in %s is still running in process %d'
+                             % ( statefile, state[ 'pid' ] ) )
+        netParams = dict( state[ 'params' ] )
+        netParams.update( params )
+        net = cls( controller=None, build=False, statefile=statefile,
+                   **netParams )
+        # Take over responsibility for cleaning up
+        journal.adopt( state[ 'journal' ] )
+        for nodeState in state[ 'nodes' ]:
+            nodeClass = cls.findClass( nodeState[ 'cls' ], classes )
+            nodes = getattr( net, nodeState[ 'list' ] )
+            nodeParams = dict( nodeState[ 'params' ] )
+            if nodeState[ 'nsPid' ]:
+                nodeParams[ 'nsPid' ] = nodeState[ 'nsPid' ]
+            node = nodeClass( nodeState[ 'name' ], **nodeParams )
+            nodes.append( node )
+            net.nameToNode[ node.name ] = node
+            net.nodeToList[ node ] = nodes
+            net.nodeParams[ node.name ] = nodeState[ 'params' ]
+            for intfState in nodeState[ 'intfs' ]:
+                # (e.g. lo may have been recreated by the constructor)
+                if intfState[ 'name' ] not in node.nameToIntf:
+                    cls.restoreIntf( node, intfState, classes=classes )
+        for linkState in state[ 'links' ]:
+            linkClass = cls.findClass( linkState[ 'cls' ], classes )
+            link = linkClass.__new__( linkClass )
+            vars( link ).update( linkState[ 'attrs' ] )
+            link.intf1, link.intf2 = None, None
+            for attr in 'intf1', 'intf2':
+                intfState = linkState[ attr ]
+                setattr( link, attr, cls.restoreIntf(
+                    net[ intfState[ 'node' ] ], intfState, link, classes ) )
+            net.links.append( link )
+            net.linkSet.add( link )
+        net.nextIP, net.nextCore = state[ 'nextIP' ], state[ 'nextCore' ]
+        net.built = True
+        for controller in net.controllers:
+            controller.start()
+        return net
+
+    @staticmethod
+    def inNamespaceLink( link ):
+        """Will link go away when its nodes' namespaces are destroyed?
+           (i.e. does it have an end in a network namespace?)"""
+        if not link.intf1 or not link.intf2:
+            return False
+        return link.intf1.node.inNamespace or link.intf2.node.inNamespace
+
+    @staticmethod
+    def waitIntfsGone( names, timeout=5 ):
+        """Wait for root namespace interfaces to be deleted, and delete
+           any which are still present after timeout
+           names: interface names
+           timeout: maximum time to wait in seconds"""
+        delay, waited = .001, 0
+        while names and waited < timeout:
+            names = [ name for name in names
+                      if os.path.exists( '/sys/class/net/' + name ) ]
+            if names:
+                sleep( delay )
+                waited += delay
+                delay = min( delay * 2, .1 )
+        if names:
+            # Something (e.g. a process which outlived its node) is
+            # keeping their peers' namespaces alive, so delete them
+            warn( '*** Interfaces still present after %ds: %s - '
+                  'deleting\n' % ( timeout, ' '.join( names ) ) )
+            for name in names:
+                quietRun( [ 'ip', 'link', 'del', 'dev', name ] )
+
+    @staticmethod
+    def terminateNodes( nodes ):
+        """Terminate nodes, hanging up all of their shells at once
+           and then waiting for them to exit concurrently.
+           Nodes which override terminate() are terminated
+           individually, since they may need their shells."""
+        # Stop all background jobs at once
+        stopJobs( [ job for node in nodes for job in node.jobs.values() ] )
+        hungup = []
+        for node in nodes:
+            if type( node ).terminate != Node.terminate:
+                info( node.name + ' ' )
+                node.terminate()
+            elif node.shell or node.sharedShell:
+                node.unmountPrivateDirs()
+                node.hangup()
+                hungup.append( node )
+        pwait( [ node.shell for node in hungup if node.shell ] )
+        for node in hungup:
+            info( node.name + ' ' )
+            node.cleanup()
+
+    def parallel( self, fn, nodes=None, workers=None ):
+        """Call fn( node ) for each node using a pool of threads
+           fn: function to call
+           nodes: list of nodes (default: all hosts)
+           workers: number of threads (default: one per node, up to 64)
+           returns: list of results, in the order of nodes"""
+        nodes = self.hosts if nodes is None else nodes
+        if not nodes:
+            return []
+        workers = workers or min( len( nodes ), 64 )
+        pool = ThreadPool( workers )
+        try:
+            # Exceptions in fn are re-raised here
+            return pool.map( fn, nodes )
+        finally:
+            pool.close()
+            pool.join()
+
+    def linkStatus( self, links=None ):
+        """Return the state of many links at once, listing the intfs in
+           each of their nodes' namespaces once (with ip -s -j link)
+           rather than once per intf
+           links: links to check (default: all links)
+           returns: dict of Link to ( IntfState, IntfState ) for its
+                    intf1 and intf2 (None for a missing intf)"""
+        links = self.links if links is None else links
+
+        def nsKey( node ):
+            "Return the namespace of node (root namespaces by server)"
+            return node.netns or ( 'root', getattr( node, 'server', None ) )
+
+        nodes = {}  # namespace to a node in it
+        for link in links:
+            for intf in link.intf1, link.intf2:
+                nodes.setdefault( nsKey( intf.node ), intf.node )
+        keys = list( nodes )
+        dumps = self.parallel(
+            lambda node: parseIpLink( node.pexec(
+                [ 'ip', '-s', '-j', 'link', 'show' ] )[ 0 ] ),
+            [ nodes[ key ] for key in keys ] )
+        states = dict( zip( keys, dumps ) )
+        return { link: tuple( states[ nsKey( intf.node ) ].get( intf.name )
+                              for intf in ( link.intf1, link.intf2 ) )
+                 for link in links }
+
+    def monitorLinks( self, nodes=None ):
+        """Return a LinkMonitor (see mininet.netlink) which keeps the
+           state of our nodes' interfaces current, and is stopped by
+           stop(); nodes which are added later may be passed in again
+           nodes: nodes to monitor (default: all nodes)
+           returns: LinkMonitor"""
+        if nodes is None:
+            nodes = self.hosts + self.switches + self.controllers
+        if not self.linkMonitor:
+            self.linkMonitor = LinkMonitor()
+        for node in nodes:
+            self.linkMonitor.add( node )
+        return self.linkMonitor
+
+    def gatherCmd( self, *args, **kwargs ):
+        """Run a command concurrently on nodes using asyncio
+           (Python 3 only)
+           nodes: keyword arg: list of nodes (default: all hosts)
+           args, kwargs: as for Node.acmd()
+           returns: coroutine which returns a list of outputs"""
+        from mininet.aio import gatherCmd
+        nodes = kwargs.pop( 'nodes', None )
+        return gatherCmd( self.hosts if nodes is None else nodes,
+                          *args, **kwargs )
+
     def run( self, test, *args, **kwargs ):
         "Perform a complete start/test/stop cycle."
         self.start()
@@ -621,21 +1044,22 @@ def monitor( self, hosts=None, timeoutms=-1 ):
            returns: iterator which returns host, line"""
         if hosts is None:
             hosts = self.hosts
-        poller = select.poll()
-        h1 = hosts[ 0 ]  # so we can call class method fdToNode
+        reactor = Reactor()
         for host in hosts:
-            poller.register( host.stdout )
-        while True:
-            ready = poller.poll( timeoutms )
-            for fd, event in ready:
-                host = h1.fdToNode( fd )
-                if event & select.POLLIN:
-                    line = host.readline()
-                    if line is not None:
-                        yield host, line
-            # Return if non-blocking
-            if not ready and timeoutms >= 0:
-                yield None, None
+            reactor.register( host.stdout, host )
+        try:
+            while True:
+                ready = reactor.poll( timeoutms )
+                for host, events in ready:
+                    if events & select.EPOLLIN:
+                        line = host.readline()
+                        if line is not None:
+                            yield host, line
+                # Return if non-blocking
+                if not ready and timeoutms >= 0:
+                    yield None, None
+        finally:
+            reactor.close()
 
     # XXX These test methods should be moved out of this class.
     # Probably we should create a tests.py for them
@@ -814,7 +1238,7 @@ def _iperfVals( iperfcsv, serverip ):
     # XXX This should be cleaned up
 
     def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', fmt=None,
-               seconds=5, port=5001):
+               seconds=5, port=5001, timeout=None ):
         """Run iperf between two hosts.
            hosts: list of hosts; if None, uses first and last hosts
            l4Type: string, one of [ TCP, UDP ]
@@ -822,6 +1246,8 @@ def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', fmt=None,
            fmt: scale/format argument (e.g. m/M for Mbps)
            seconds: iperf time to transmit
            port: iperf port
+           timeout: seconds to wait for results (default: seconds + 30),
+                    after which CmdTimeout is raised
            returns: two-element array of [ server, client ] speeds
            note: send() is buffered, so client rate can be much higher than
            the actual transmission rate; on an unloaded system, server
@@ -829,6 +1255,8 @@ def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', fmt=None,
         hosts = hosts or [ self.hosts[ 0 ], self.hosts[ -1 ] ]
         assert len( hosts ) == 2
         client, server = hosts
+        timeout = seconds + 30 if timeout is None else timeout
+        deadline = now() + timeout
         output( '*** Iperf: testing', l4Type, 'bandwidth between',
                 client, 'and', server, '\n' )
         server.cmd( 'killall -9 iperf' )
@@ -844,20 +1272,34 @@ def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', fmt=None,
             if not waitListening( client, serverip, port ):
                 raise Exception( 'Could not connect to iperf on port %d'
                                  % port )
-        cliout = client.cmd( iperfArgs + '-t %d -c ' % seconds +
-                             server.IP() + ' ' + bwArgs )
+        try:
+            cliout = client.cmd( iperfArgs + '-t %d -c ' % seconds +
+                                 server.IP() + ' ' + bwArgs,
+                                 timeout=deadline - now() )
+        except CmdTimeout:
+            server.stopCmd()
+            raise
         cvals = self._iperfVals( cliout, serverip )
         serverout = ''
         # Wait for output from the client session
         while True:
-            serverout += server.monitor( timeoutms=5000 )
+            remaining = deadline - now()
+            if remaining <= 0:
+                chunks = []
+                recovery = server.stopCmd( chunks=chunks )
+                raise CmdTimeout( server, server.lastCmd, timeout,
+                                  serverout + server.decoder.decode(
+                                      b''.join( chunks ) ), recovery )
+            serverout += server.monitor(
+                timeoutms=int( min( remaining, 5 ) * 1000 ) )
             svals = self._iperfVals( serverout, serverip )
             # Check for the client's source/output port
             if ( svals and cvals[ 'sport' ] == svals[ 'sport' ]
                  and int( svals[ 'rate' ] ) > 0 ):
                 break
-        server.sendInt()
-        serverout += server.waitOutput()
+        chunks = []
+        server.stopCmd( chunks=chunks )
+        serverout += server.decoder.decode( b''.join( chunks ) )
         result = [ fmtBps( svals[ 'rate'], fmt ),
                    fmtBps( cvals[ 'rate' ], fmt ) ]
         if l4Type == 'UDP':
@@ -877,12 +1319,10 @@ def runCpuLimitTest( self, cpu, duration=5 ):
         cores = int( quietRun( 'nproc' ) )
         # number of processes to run a while loop on per host
         num_procs = int( ceil( cores * cpu ) )
-        pids = {}
+        jobs = []
         for h in hosts:
-            pids[ h ] = []
             for _core in range( num_procs ):
-                h.cmd( 'while true; do a=1; done &' )
-                pids[ h ].append( h.cmd( 'echo $!' ).strip() )
+                jobs.append( h.startJob( 'while true; do a=1; done' ) )
         outputs = {}
         time = {}
         # get the initial cpu time for each host
@@ -900,9 +1340,7 @@ def runCpuLimitTest( self, cpu, duration=5 ):
                 outputs[ host ].append( ( ( readTime - time[ host ] )
                                         / 1000000000 ) / cores * 100 )
                 time[ host ] = readTime
-        for h, pids in pids.items():
-            for pid in pids:
-                h.cmd( 'kill -9 %s' % pid )
+        stopJobs( jobs, timeout=0 )
         cpu_fractions = []
         for _host, outputs in outputs.items():
             for pct in outputs:
@@ -1012,13 +1450,15 @@ def configureRoutedControlNetwork( self, ip='192.168.123.1',
             switch.setHostRoute( cip, sintf )
         info( '\n' )
         info( '*** Testing control network\n' )
-        while not cintf.isUp():
-            info( '*** Waiting for', cintf, 'to come up\n' )
-            sleep( 1 )
+        monitor = LinkMonitor( [ controller ] + self.switches )
+        try:
+            for intf in [ cintf ] + [ switch.controlIntf
+                                      for switch in self.switches ]:
+                while not monitor.waitFor( intf, 'UP', timeout=1 ):
+                    info( '*** Waiting for', intf, 'to come up\n' )
+        finally:
+            monitor.stop()
         for switch in self.switches:
-            while not sintf.isUp():
-                info( '*** Waiting for', sintf, 'to come up\n' )
-                sleep( 1 )
             if self.ping( hosts=[ switch, controller ] ) != 0:
                 error( '*** Error: control network test failed\n' )
                 exit( 1 )
@@ -0,0 +1,291 @@
+"""
+Interface event monitoring for Mininet
+
+LinkMonitor keeps the state of the interfaces in many namespaces
+current without polling. It opens one rtnetlink socket per namespace,
+subscribed to link events, which is created inside the namespace by
+util.spawner (so no ip monitor processes are needed), and reads all
+of them in a single background thread:
+
+    monitor = net.monitorLinks()
+    h1.cmd( 'ip link set h1-eth0 up' )
+    monitor.waitFor( h1.intf(), 'UP', timeout=5 )
+    monitor.addCallback( lambda node, name, state: ... )
+
+Waits complete as soon as the kernel reports the change, rather than
+at the next polling interval. Mininet.monitorLinks() monitors a whole
+network, and Mininet.stop() stops its monitor.
+
+Interface states are IntfStates (see link.IntfState), as returned by
+Mininet.linkStatus(); their counters are as of the interface's last
+event, so use linkStatus() for current counters.
+"""
+
+import errno
+import os
+import socket
+import struct
+import threading
+from time import time as now
+
+from mininet.link import IntfState
+from mininet.util import Reactor, spawner
+
+# rtnetlink constants (see linux/netlink.h, linux/rtnetlink.h)
+NETLINK_ROUTE, RTMGRP_LINK = 0, 1
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+RTM_NEWLINK, RTM_DELLINK, RTM_GETLINK = 16, 17, 18
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+IFLA_IFNAME, IFLA_MTU, IFLA_OPERSTATE, IFLA_STATS64 = 3, 4, 16, 23
+IFF_LOWER_UP = 0x10000
+AF_UNSPEC = 0
+
+# Indexed by IFLA_OPERSTATE, and named as by ip link
+operstates = ( 'UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN',
+               'TESTING', 'DORMANT', 'UP' )
+
+nlmsghdr = struct.Struct( '=IHHII' )  # len, type, flags, seq, pid
+ifinfomsg = struct.Struct( '=BxHiII' )  # family, type, index, flags, change
+rtattr = struct.Struct( '=HH' )  # len, type
+stats64 = struct.Struct( '=8Q' )  # rx/tx packets, bytes, errors, dropped
+
+# Request for the state of every link
+dumpRequest = ( nlmsghdr.pack( nlmsghdr.size + ifinfomsg.size, RTM_GETLINK,
+                               NLM_F_REQUEST | NLM_F_DUMP, 1, 0 ) +
+                ifinfomsg.pack( AF_UNSPEC, 0, 0, 0, 0 ) )
+
+
+def align( size ):
+    "Round size up to a netlink attribute boundary"
+    return ( size + 3 ) & ~3
+
+def parseLinkMessages( data ):
+    """Parse rtnetlink link messages
+       data: bytes received from a netlink socket
+       returns: list of ( intf name, IntfState, or None if deleted ),
+                and whether a dump has finished"""
+    changes, done, offset = [], False, 0
+    while offset + nlmsghdr.size <= len( data ):
+        size, kind, _flags, _seq, _pid = nlmsghdr.unpack_from( data, offset )
+        if size < nlmsghdr.size:
+            break
+        body, end = offset + nlmsghdr.size, offset + size
+        offset += align( size )
+        if kind in ( NLMSG_DONE, NLMSG_ERROR ):
+            done = True
+            continue
+        if kind not in ( RTM_NEWLINK, RTM_DELLINK ):
+            continue
+        family, _type, _index, flags, _change = ifinfomsg.unpack_from(
+            data, body )
+        # Bridge port messages (AF_BRIDGE) describe bridge membership,
+        # not the interface itself
+        if family != AF_UNSPEC:
+            continue
+        attrs, pos = {}, body + ifinfomsg.size
+        while pos + rtattr.size <= end:
+            alen, atype = rtattr.unpack_from( data, pos )
+            if alen < rtattr.size:
+                break
+            attrs[ atype ] = data[ pos + rtattr.size: pos + alen ]
+            pos += align( alen )
+        name = attrs.get( IFLA_IFNAME, b'' ).rstrip( b'\0' ).decode()
+        if not name:
+            continue
+        if kind == RTM_DELLINK:
+            changes.append( ( name, None ) )
+            continue
+        operstate = ord( attrs.get( IFLA_OPERSTATE, b'\0' )[ :1 ] )
+        mtu = attrs.get( IFLA_MTU )
+        stats = attrs.get( IFLA_STATS64 )
+        ( rxPackets, txPackets, rxBytes, txBytes, rxErrors, txErrors,
+          rxDropped, txDropped ) = ( stats64.unpack_from( stats )
+                                     if stats and len( stats ) >=
+                                     stats64.size else ( None, ) * 8 )
+        changes.append( ( name, IntfState(
+            operstates[ operstate ] if operstate < len( operstates )
+            else str( operstate ), bool( flags & IFF_LOWER_UP ),
+            struct.unpack( '=I', mtu[ :4 ] )[ 0 ] if mtu else None,
+            rxBytes, rxPackets, rxErrors, rxDropped,
+            txBytes, txPackets, txErrors, txDropped ) ) )
+    return changes, done
+
+
+class LinkMonitor( object ):
+    "Keep the state of interfaces in many namespaces current"
+
+    dumpTimeout = 5  # seconds to wait for initial states in add()
+
+    def __init__( self, nodes=() ):
+        """nodes: nodes whose namespaces to monitor (see add())"""
+        self.reactor = Reactor()
+        self.sockets = {}  # namespace key to netlink socket
+        self.nodes = {}  # namespace key to set of monitored nodes
+        self.states = {}  # ( namespace key, intf name ) to IntfState
+        self.callbacks = []
+        self.cond = threading.Condition()  # notified after updates
+        self.wakeup = os.pipe()  # written to by stop()
+        self.reactor.register( self.wakeup[ 0 ], key=self )
+        self.thread = None
+        for node in nodes:
+            self.add( node )
+
+    @staticmethod
+    def nsKey( node ):
+        "Return a key for node's network namespace"
+        return node.netns or 'root'
+
+    def netlinkSocket( self, node ):
+        "Return a netlink socket for node's namespace"
+        args = ( socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE )
+        if not node.netns:
+            return socket.socket( *args )
+        return spawner.socket( node.nsFds(), *args )
+
+    def add( self, node ):
+        """Start monitoring node's namespace (if we aren't already),
+           and read the current state of its interfaces
+           node: Node"""
+        key = self.nsKey( node )
+        with self.cond:
+            if key in self.sockets:
+                self.nodes[ key ].add( node )
+                return
+        sock = self.netlinkSocket( node )
+        # Subscribe before asking for the current state, so that we
+        # don't miss any changes
+        sock.bind( ( 0, RTMGRP_LINK ) )
+        sock.settimeout( self.dumpTimeout )
+        sock.send( dumpRequest )
+        done = False
+        while not done:
+            changes, done = parseLinkMessages( sock.recv( 1 << 16 ) )
+            self.update( key, changes )
+        sock.setblocking( False )
+        with self.cond:
+            self.sockets[ key ], self.nodes[ key ] = sock, set( [ node ] )
+            self.reactor.register( sock.fileno(), key )
+            if not self.thread:
+                self.thread = threading.Thread( target=self.run,
+                                                name='LinkMonitor' )
+                self.thread.daemon = True
+                self.thread.start()
+
+    def remove( self, node ):
+        """Stop monitoring node, and its namespace if we aren't
+           monitoring any other nodes in it (our socket would keep
+           the namespace, and its interfaces, from going away)
+           node: Node"""
+        key = self.nsKey( node )
+        with self.cond:
+            nodes = self.nodes.get( key, set() )
+            nodes.discard( node )
+            if nodes or key not in self.sockets:
+                return
+            sock = self.sockets.pop( key )
+            del self.nodes[ key ]
+            self.reactor.unregister( sock.fileno() )
+            sock.close()
+            for state in [ k for k in self.states if k[ 0 ] == key ]:
+                del self.states[ state ]
+
+    def run( self ):
+        "Our thread: read events until stop() is called"
+        while True:
+            for key, _events in self.reactor.poll():
+                if key is self:
+                    return
+                self.read( key )
+
+    def read( self, key ):
+        "Read all waiting events for namespace key"
+        with self.cond:
+            sock = self.sockets.get( key )
+        while sock:
+            try:
+                data = sock.recv( 1 << 16 )
+            except socket.error as e:
+                if e.errno == errno.ENOBUFS:
+                    # We missed some events, so ask for everything again
+                    sock.send( dumpRequest )
+                    continue
+                # EAGAIN, or closed by remove()
+                return
+            self.update( key, parseLinkMessages( data )[ 0 ] )
+
+    def update( self, key, changes ):
+        "Record changes for namespace key, and call our callbacks"
+        changed = []
+        with self.cond:
+            for name, state in changes:
+                old = self.states.get( ( key, name ) )
+                if state is None:
+                    self.states.pop( ( key, name ), None )
+                else:
+                    self.states[ key, name ] = state
+                if state != old:
+                    changed.append( ( name, state ) )
+            self.cond.notify_all()
+            nodes = list( self.nodes.get( key, () ) )
+            callbacks = list( self.callbacks )
+        for name, state in changed:
+            node = next( ( node for node in nodes
+                           if name in node.nameToIntf ), None )
+            for callback in callbacks:
+                callback( node, name, state )
+
+    def addCallback( self, callback ):
+        """Call callback( node, name, state ) from our thread when an
+           interface changes: node is the monitored node with an
+           interface called name (or None), and state is its new
+           IntfState, or None if it has been deleted"""
+        with self.cond:
+            self.callbacks.append( callback )
+
+    def removeCallback( self, callback ):
+        "Stop calling callback"
+        with self.cond:
+            self.callbacks.remove( callback )
+
+    def state( self, intf ):
+        """Return intf's IntfState, or None if it doesn't exist
+           intf: Intf (whose node we are monitoring)"""
+        with self.cond:
+            return self.states.get( ( self.nsKey( intf.node ), intf.name ) )
+
+    def waitFor( self, intf, operstate='UP', timeout=None ):
+        """Wait for intf to reach an operational state
+           intf: Intf (whose node is added if we aren't monitoring it)
+           operstate: e.g. 'UP' or 'DOWN', or None to wait for intf to
+                      be deleted
+           timeout: seconds to wait (None: wait indefinitely)
+           returns: True if intf reached operstate, False on timeout"""
+        key = self.nsKey( intf.node ), intf.name
+        if key[ 0 ] not in self.sockets:
+            self.add( intf.node )
+        deadline = None if timeout is None else now() + timeout
+        with self.cond:
+            while True:
+                state = self.states.get( key )
+                if ( state.operstate == operstate if state else
+                     operstate is None ):
+                    return True
+                remaining = None if deadline is None else deadline - now()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait( remaining )
+
+    def stop( self ):
+        "Stop our thread and close our sockets"
+        if self.thread:
+            os.write( self.wakeup[ 1 ], b'x' )
+            self.thread.join()
+            self.thread = None
+        with self.cond:
+            for sock in self.sockets.values():
+                sock.close()
+            self.sockets, self.nodes, self.states = {}, {}, {}
+        self.reactor.close()
+        for fd in self.wakeup:
+            os.close( fd )
+        self.wakeup = ()
@@ -18,6 +18,9 @@
 CPULimitedHost: a virtual host whose CPU bandwidth is limited by
     RT or CFS bandwidth limiting.
 
+CmdTimeout: exception raised when a command run with a timeout
+    doesn't complete in time.
+
 Switch: superclass for switch nodes.
 
 UserSwitch: a switch using the user-space switch from the OpenFlow
@@ -57,16 +60,27 @@
 import re
 import signal
 import select
+import threading
+from collections import deque
 from re import findall
-from subprocess import Popen, PIPE
-from sys import exit  # pylint: disable=redefined-builtin
-from time import sleep
-
-from mininet.log import info, error, warn, debug
+from subprocess import Popen, PIPE, STDOUT
+from sys import exit, executable  # pylint: disable=redefined-builtin
+from time import sleep, time as now
+
+try:
+    from subprocess import TimeoutExpired  # Python 3
+except ImportError:
+    TimeoutExpired = None
+
+from mininet.log import info, error, warn, debug, lg, LEVELS
+from mininet.journal import journal, procStat
+from mininet.jobs import Job, stopJobs, stopTimeout
+from mininet.ring import RingFile
+from mininet import agent
 from mininet.util import ( quietRun, errRun, errFail, moveIntf, isShellBuiltin,
                            numCores, retry, mountCgroups, BaseString, decode,
                            encode, getincrementaldecoder, Python3, which,
-                           StrictVersion )
+                           StrictVersion, nsOpen, spawner )
 from mininet.moduledeps import moduleDeps, pathCheck, TUN
 from mininet.link import Link, Intf, TCIntf, OVSIntf
 
@@ -74,16 +88,94 @@
 # pylint: disable=too-many-arguments
 
 
+class CmdTimeout( Exception ):
+    "A command which didn't complete within its timeout"
+
+    def __init__( self, node, cmd, timeout, output='', recovery=None ):
+        """node: Node which ran cmd
+           cmd: command string
+           timeout: timeout in seconds
+           output: output received before cmd was stopped
+           recovery: escalation step which stopped cmd (see
+                     Node.stopCmd()), or None if it is still running"""
+        Exception.__init__( self, '%s: %r timed out after %ss (%s)' % (
+            node.name, cmd, timeout, recovery or 'still running' ) )
+        self.node, self.cmd, self.timeout = node, cmd, timeout
+        self.output, self.recovery = output, recovery
+
+
+def wakeFuture( future ):
+    "Resolve future, unless it has been cancelled"
+    if not future.done():
+        future.set_result( None )
+
+
+class ShellLock( object ):
+    """Reentrant lock for a node's shell, which tells the node when it
+       is released (see Node.whenIdle())"""
+
+    def __init__( self, node ):
+        "node: Node whose shell we protect"
+        self.node = node
+        self.rlock = threading.RLock()
+        self.depth = 0  # only changed while rlock is held
+
+    def acquire( self, blocking=True ):
+        "Acquire the lock; returns True if we got it"
+        if not self.rlock.acquire( blocking ):
+            return False
+        self.depth += 1
+        return True
+
+    def release( self ):
+        "Release the lock, waking waiters if our shell is now idle"
+        self.depth -= 1
+        released = not self.depth
+        self.rlock.release()
+        if released and not self.node.waiting:
+            self.node.notifyIdle()
+
+    def __enter__( self ):
+        self.acquire()
+        return self
+
+    def __exit__( self, *args ):
+        self.release()
+
+
 class Node( object ):
     """A virtual network node is simply a shell in a network namespace.
-       We communicate with it using pipes."""
+       We communicate with it using pipes.
+       Nodes may be used from multiple threads: cmd(), run(), cmds(),
+       submit() and collect() hold a per-node lock for the duration of
+       their exchange with the shell, and commands from other threads
+       use an auxiliary shell (see channel()) while our shell is busy.
+       sendCmd() and the functions which read output are not locked,
+       so interactive use of our shell should stick to one thread.
+       Nodes in the root namespace (e.g. most switches) share a single
+       shell for foreground commands, and start their own shell only
+       when they need one (see shareRootShell())."""
 
     portBase = 0  # Nodes always start with eth0/port0, even in OF 1.0
 
+    readSize = 65536  # maximum bytes per read() from our shell
+    # maximum bytes of submitted commands in flight (see pipeline());
+    # this fits in the pty's line discipline buffer
+    pipelineBytes = 4000
+    maxChannels = 8  # maximum auxiliary shells (see channel())
+    shareShell = True  # share a shell if in root namespace?
+    # How to stop a command which times out (see stopCmd())
+    escalation = ( 'interrupt', 'kill', 'restart' )
+    escalationWait = 1  # seconds to wait after each escalation step
+
     def __init__( self, name, inNamespace=True, **params ):
         """name: name of node
            inNamespace: in network namespace?
            privateDirs: list of private directory strings or tuples
+           nsPid: attach to the namespaces of this (holder) process
+                  instead of creating new ones (see hold())
+           shareShell: if not inNamespace, share a shell with other
+                       root namespace nodes? (True)
            params: Node parameters (see config() for details)"""
 
         # Make sure class actually works
@@ -92,10 +184,16 @@ def __init__( self, name, inNamespace=True, **params ):
         self.name = params.get( 'name', name )
         self.privateDirs = params.get( 'privateDirs', [] )
         self.inNamespace = params.get( 'inNamespace', inNamespace )
+        self.shareShell = params.get( 'shareShell', self.shareShell )
 
         # Python 3 complains if we don't wait for shell exit
         self.waitExited = params.get( 'waitExited', Python3 )
 
+        # Process holding on to our namespaces, if any (see hold())
+        self.nsPid = params.pop( 'nsPid', None )
+        self.holder, self.holdProc = self.nsPid, None
+        self.netns = None  # our network namespace, if we have our own
+
         # Stash configuration parameters for future reference
         self.params = params
 
@@ -108,26 +206,57 @@ def __init__( self, name, inNamespace=True, **params ):
 
         self.nameToIntf = {}  # dict of interface names to Intfs
 
+        # dict of peer nodes to { our intf: peer intf } for linked intfs
+        self.peers = {}
+
+        # next port number to allocate (port numbers are not reused)
+        self.nextPort = self.portBase
+
         # Make pylint happy
         ( self.shell, self.execed, self.pid, self.stdin, self.stdout,
             self.lastPid, self.lastCmd, self.pollOut ) = (
                 None, None, None, None, None, None, None, None )
+        self.idleWaiters = []  # see whenIdle()
         self.waiting = False
-        self.readbuf = ''
+        self.readbuf = bytearray()  # raw output which hasn't been read
+        self.scanPos = 0  # readbuf[ :scanPos ] contains no newline
+        self.runCount = 0  # commands sent by run(), for unique frames
+        self.sendTime = None  # when sendCmd() sent our last command
+        self.jobPids = set()  # pids of our earlier background commands
+        self.errFile = None  # file for capturing stderr in run()
+        self.framing = False  # has our shell defined __mnframe?
+        self.pending = deque()  # frames of submitted commands
+        self.inflight = 0  # bytes of submitted commands in flight
+        self.results = []  # results of submitted commands
+        self.channels = []  # auxiliary shells, created on demand
+        self.channelCount = 0  # for sharing out busy channels
+        self.nsfds = None  # cached namespace fds (see nsFds())
+        self.jobs = {}  # job names to background Jobs (see startJob())
+        self.jobCount = 0  # for naming jobs
+        self.agentPath = None  # socket of our exec agent (see startAgent())
+        self.lock = ShellLock( self )  # held while using our shell
+        self.stateLock = threading.RLock()  # protects channels and ports
 
         # Incremental decoder for buffered reading
         self.decoder = getincrementaldecoder()
 
-        # Start command interpreter shell
+        # Start command interpreter shell, or share one
         self.master, self.slave = None, None  # pylint
-        self.startShell()
-        self.mountPrivateDirs()
+        self.sharedShell = None  # shared root namespace shell, if any
+        if self.shareShell and not self.inNamespace and not self.nsPid:
+            self.shareRootShell()
+        else:
+            self.startShell()
+        if not self.nsPid:
+            # (otherwise our mount namespace already has them)
+            self.mountPrivateDirs()
 
     # File descriptor to node mapping support
     # Class variables and methods
 
     inToNode = {}  # mapping of input fds to nodes
     outToNode = {}  # mapping of output fds to nodes
+    fdLock = threading.Lock()  # protects inToNode and outToNode
 
     @classmethod
     def fdToNode( cls, fd ):
@@ -137,6 +266,85 @@ def fdToNode( cls, fd ):
         node = cls.outToNode.get( fd )
         return node or cls.inToNode.get( fd )
 
+    # Shell shared by root namespace nodes (see shareRootShell())
+    rootShell = None
+    rootShellLock = threading.Lock()  # protects rootShell and its users
+
+    def shareRootShell( self ):
+        """Use a single shell, shared by root namespace nodes, for our
+           foreground commands, rather than starting our own. Commands
+           from several nodes (or threads) at once use its auxiliary
+           shells (see channel()). Each command runs in a subshell, so
+           that commands from one node can't change the cwd, variables
+           etc. seen by another. We start our own shell if we need one
+           for background commands, for commands which change shell
+           state (see needsOwnShell()) or for interactive use (see
+           ownShell()). Nodes with shareShell=False always have their
+           own shell."""
+        with Node.rootShellLock:
+            shell = Node.rootShell
+            if not shell or shell.shell.poll() is not None:
+                # (e.g. if cleanup() has killed it)
+                shell = Node( 'root', inNamespace=False, shareShell=False )
+                shell.sharers = set()
+                Node.rootShell = shell
+            shell.sharers.add( self )
+        self.sharedShell = shell
+        self.pid = shell.pid
+
+    def unshareRootShell( self ):
+        """Stop using the shared shell, terminating it if we were its
+           last user"""
+        shell, self.sharedShell = self.sharedShell, None
+        if not shell:
+            return
+        with Node.rootShellLock:
+            shell.sharers.discard( self )
+            if shell.sharers:
+                return
+            if Node.rootShell is shell:
+                Node.rootShell = None
+        shell.terminate()
+
+    def ownShell( self ):
+        """Start our own shell, if we are using the shared one
+           returns: self"""
+        with self.lock:
+            if self.sharedShell and not self.shell:
+                self.startShell()
+                self.unshareRootShell()
+        return self
+
+    # Job spec, e.g. kill %ofdatapath
+    _jobSpecRegex = re.compile( r'(?:^|\s)%\w' )
+    # Commands which change shell state, e.g. cd, export or X=1
+    _shellStateRegex = re.compile(
+        r'(?:^|[;&|(){}\n])\s*(?:(?:cd|pushd|popd|export|unset|alias|'
+        r'unalias|set|shopt|source|\.|umask|ulimit|declare|typeset|'
+        r'readonly|trap|function)(?:\s|$)|[A-Za-z_]\w*(?:\[[^]]*\])?\+?='
+        r'|\w+\s*\(\s*\))' )
+
+    @classmethod
+    def needsOwnShell( cls, args ):
+        """Does a command need our own shell, rather than a shared one,
+           because it runs in the background, refers to a job, or
+           changes shell state (which would persist for us, but not for
+           the other nodes sharing the shell)?
+           args: command and arguments, single list, or string"""
+        cmd = cls.cmdString( args )
+        return ( cmd.rstrip().endswith( '&' ) or
+                 cls._jobSpecRegex.search( cmd ) is not None or
+                 cls._shellStateRegex.search( cmd ) is not None )
+
+    @classmethod
+    def sharedCmd( cls, args ):
+        """Return a command for the shared shell which runs args in a
+           subshell, so that nothing it does (e.g. in an eval) can change
+           the shell's state for other nodes. bash execs simple commands
+           in the subshell, so this costs no extra fork.
+           args: command and arguments, single list, or string"""
+        return '( %s\n)' % cls.cmdString( args )
+
     # Command support via shell process in namespace
     def startShell( self, mnopts=None ):
         "Start a shell process for running commands"
@@ -146,12 +354,19 @@ def startShell( self, mnopts=None ):
         # mnexec: (c)lose descriptors, (d)etach from tty,
         # (p)rint pid, and run in (n)amespace
         opts = '-cd' if mnopts is None else mnopts
-        if self.inNamespace:
+        args = []
+        if self.nsPid:
+            # (a)ttach to existing namespaces
+            opts += 'a'
+            args = [ str( self.nsPid ) ]
+        elif self.inNamespace:
             opts += 'n'
         # bash -i: force interactive
         # -s: pass $* to shell, and make process easy to find in ps
-        # prompt is set to sentinel chr( 127 )
-        cmd = [ 'mnexec', opts, 'env', 'PS1=' + chr( 127 ),
+        # prompt is set to sentinel chr( 127 ), and there is no
+        # continuation prompt to clutter the output of multiline commands
+        cmd = [ 'mnexec', opts ] + args + [
+                'env', 'PS1=' + chr( 127 ), 'PS2=',
                 'bash', '--norc', '--noediting',
                 '-is', 'mininet:' + self.name ]
 
@@ -167,26 +382,75 @@ def startShell( self, mnopts=None ):
         self.stdout = self.stdin
         self.pid = self.shell.pid
         self.pollOut = select.poll()
-        self.pollOut.register( self.stdout )
+        self.pollOut.register( self.stdout, select.POLLIN )
         # Maintain mapping between file descriptors and nodes
         # This is useful for monitoring multiple nodes
         # using select.poll()
-        self.outToNode[ self.stdout.fileno() ] = self
-        self.inToNode[ self.stdin.fileno() ] = self
+        with self.fdLock:
+            self.outToNode[ self.stdout.fileno() ] = self
+            self.inToNode[ self.stdin.fileno() ] = self
         self.execed = False
         self.lastCmd = None
         self.lastPid = None
-        self.readbuf = ''
+        self.jobPids = set()
+        self.readbuf, self.scanPos = bytearray(), 0
+        self.framing, self.pending, self.inflight = False, deque(), 0
+        self.closeNsFds()
         # Wait for prompt
         while True:
             data = self.read( 1024 )
-            if data[ -1 ] == chr( 127 ):
+            if data.endswith( chr( 127 ) ):
                 break
-            self.pollOut.poll()
+            if not self.readbuf:
+                self.pollOut.poll()
         self.waiting = False
+        self.journalShell()
         # +m: disable job control notification
         self.cmd( 'unset HISTFILE; stty -echo; set +m' )
 
+    def journalShell( self ):
+        """Record our shell in the resource journal, along with
+           its network namespace if we have a private one"""
+        if self.inNamespace:
+            try:
+                self.netns = os.readlink( '/proc/%d/ns/net' % self.pid )
+            except OSError:
+                pass
+        journal.add( 'node', self.pid, node=self.name, netns=self.netns )
+
+    def hold( self ):
+        """Start a process which holds on to our namespaces, so that
+           they survive the exit of our shell (e.g. if the process
+           which created us exits) and can be attached to later
+           using nsPid"""
+        if not self.inNamespace or self.holder:
+            return
+        # exec -a: name it so that it can be identified in ps
+        # -p: print pid once attached, so we can wait for it
+        cmd = [ 'mnexec', '-da', str( self.pid ), '-p', 'bash', '-c',
+                'exec -a mininet:%s sleep infinity' % self.name ]
+        with open( os.devnull, 'r+' ) as devnull:
+            self.holdProc = self._popen( cmd, stdin=devnull,
+                                         stdout=PIPE, stderr=devnull )
+        self.holdProc.stdout.readline()
+        self.holdProc.stdout.close()
+        self.holder = self.holdProc.pid
+        journal.add( 'node', self.holder, node=self.name, holder=True,
+                     netns=self.netns )
+
+    def release( self ):
+        "Kill the process holding on to our namespaces, if any"
+        if not self.holder:
+            return
+        try:
+            os.kill( self.holder, signal.SIGKILL )
+        except OSError:
+            pass
+        if self.holdProc:
+            self.holdProc.wait()
+        journal.remove( 'node', self.holder )
+        self.holder, self.holdProc = None, None
+
     def mountPrivateDirs( self ):
         "mount private directories"
         # Avoid expanding a string into a list of chars
@@ -230,42 +494,92 @@ def cleanup( self ):
         # for intfName in self.intfNames():
         # if self.name in intfName:
         # quietRun( 'ip link del ' + intfName )
+        for channel in self.channels:
+            channel.hangup()
+            channel.cleanup()
+        self.channels = []
+        self.stopJobs()
+        # Nodes in the root namespace may share another node's agent
+        ownAgent = 'agent' in self.jobs
+        for job in self.jobs.values():
+            job.close()
+            if job.managed:
+                try:
+                    os.unlink( job.log )
+                except OSError:
+                    pass
+                journal.remove( 'file', job.log )
+        self.jobs = {}
+        if self.agentPath and ownAgent:
+            try:
+                os.unlink( self.agentPath )
+            except OSError:
+                pass
+            journal.remove( 'file', self.agentPath )
+        self.agentPath = None
         if self.shell:
+            # Forget our fds, which may be reused by other nodes
+            with self.fdLock:
+                for fdToNode in self.outToNode, self.inToNode:
+                    if fdToNode.get( self.master ) is self:
+                        del fdToNode[ self.master ]
             # Close ptys
-            self.stdin.close()
-            os.close(self.slave)
+            if self.slave is not None:
+                self.stdin.close()
+                os.close(self.slave)
             if self.waitExited:
                 debug( 'waiting for', self.pid, 'to terminate\n' )
                 self.shell.wait()
+            journal.remove( 'node', self.pid )
+        if self.errFile:
+            try:
+                os.unlink( self.errFile )
+            except OSError:
+                # e.g. in a private /tmp, which is gone already
+                pass
+            journal.remove( 'file', self.errFile )
+            self.errFile = None
         self.shell = None
+        self.closeNsFds()
+        self.release()
+        self.unshareRootShell()
 
     # Subshell I/O, commands and control
 
+    def readBytes( self, size=None ):
+        """Buffered read of raw output from node; blocks only if
+           nothing is buffered.
+           size: maximum number of bytes to return (default: readSize)
+           returns: bytes"""
+        size = size or self.readSize
+        if not self.readbuf:
+            self.readbuf += os.read( self.stdout.fileno(), self.readSize )
+        result = bytes( self.readbuf[ :size ] )
+        del self.readbuf[ :size ]
+        self.scanPos = 0
+        return result
+
     def read( self, size=1024 ):
         """Buffered read from node, potentially blocking.
-           size: maximum number of characters to return"""
-        count = len( self.readbuf )
-        if count < size:
-            data = os.read( self.stdout.fileno(), size - count )
-            self.readbuf += self.decoder.decode( data )
-        if size >= len( self.readbuf ):
-            result = self.readbuf
-            self.readbuf = ''
-        else:
-            result = self.readbuf[ :size ]
-            self.readbuf = self.readbuf[ size: ]
-        return result
+           size: maximum number of bytes to read"""
+        return self.decoder.decode( self.readBytes( size ) )
 
     def readline( self ):
         """Buffered readline from node, potentially blocking.
            returns: line (minus newline) or None"""
-        self.readbuf += self.read( 1024 )
-        if '\n' not in self.readbuf:
-            return None
-        pos = self.readbuf.find( '\n' )
-        line = self.readbuf[ 0: pos ]
-        self.readbuf = self.readbuf[ pos + 1: ]
-        return line
+        # Only scan bytes we haven't already looked at
+        pos = self.readbuf.find( b'\n', self.scanPos )
+        if pos < 0:
+            self.scanPos = len( self.readbuf )
+            self.readbuf += os.read( self.stdout.fileno(), self.readSize )
+            pos = self.readbuf.find( b'\n', self.scanPos )
+            if pos < 0:
+                self.scanPos = len( self.readbuf )
+                return None
+        line = bytes( self.readbuf[ :pos ] )
+        del self.readbuf[ :pos + 1 ]
+        self.scanPos = 0
+        return self.decoder.decode( line )
 
     def write( self, data ):
         """Write data to node.
@@ -275,10 +589,17 @@ def write( self, data ):
     def terminate( self ):
         "Send kill signal to Node and clean up after it."
         self.unmountPrivateDirs()
+        self.hangup()
+        self.cleanup()
+
+    def hangup( self ):
+        """Send SIGHUP to our shell's process group, if it is running,
+           without waiting for it to exit"""
+        for channel in self.channels:
+            channel.hangup()
         if self.shell:
             if self.shell.poll() is None:
                 os.killpg( self.shell.pid, signal.SIGHUP )
-        self.cleanup()
 
     def stop( self, deleteIntfs=False ):
         """Stop node.
@@ -295,13 +616,10 @@ def waitReadable( self, timeoutms=None ):
             return self.pollOut.poll( timeoutms )
         return None
 
-    def sendCmd( self, *args, **kwargs ):
-        """Send a command, followed by a command to echo a sentinel,
-           and return without waiting for the command to complete.
-           args: command and arguments, or string
-           printPid: print command's PID? (False)"""
-        assert self.shell and not self.waiting
-        printPid = kwargs.get( 'printPid', False )
+    @staticmethod
+    def cmdString( args ):
+        """Return command string for sendCmd( *args )
+           args: command and arguments, single list, or string"""
         # Allow sendCmd( [ list ] )
         if len( args ) == 1 and isinstance( args[ 0 ], list ):
             cmd = args[ 0 ]
@@ -314,6 +632,19 @@ def sendCmd( self, *args, **kwargs ):
         if not re.search( r'\w', cmd ):
             # Replace empty commands with something harmless
             cmd = 'echo -n'
+        return cmd
+
+    def sendCmd( self, *args, **kwargs ):
+        """Send a command, followed by a command to echo a sentinel,
+           and return without waiting for the command to complete.
+           args: command and arguments, or string
+           printPid: print command's PID? (False)"""
+        self.ownShell()
+        assert self.shell and not self.waiting
+        printPid = kwargs.get( 'printPid', False )
+        cmd = self.cmdString( args )
+        if self.lastPid and self.lastCmd and self.lastCmd[ -1 ] == '&':
+            self.jobPids.add( self.lastPid )
         self.lastCmd = cmd
         # if a builtin command is backgrounded, it still yields a PID
         if len( cmd ) > 0 and cmd[ -1 ] == '&':
@@ -323,85 +654,527 @@ def sendCmd( self, *args, **kwargs ):
             cmd = 'mnexec -p ' + cmd
         self.write( cmd + '\n' )
         self.lastPid = None
+        self.sendTime = now()
         self.waiting = True
 
+    @property
+    def waiting( self ):
+        "Is our shell running a command?"
+        return self._waiting
+
+    @waiting.setter
+    def waiting( self, waiting ):
+        self._waiting = waiting
+        if not waiting and self.idleWaiters:
+            self.notifyIdle()
+
+    def whenIdle( self, loop ):
+        """Return an asyncio future which is resolved the next time our
+           shell finishes a command or our lock is released while it is
+           idle, so that coroutines needn't poll for it (see mininet.aio)
+           loop: event loop of the calling coroutine"""
+        future = loop.create_future()
+        self.idleWaiters.append( ( loop, future ) )
+        return future
+
+    def notifyIdle( self ):
+        "Wake up coroutines waiting for our shell (may be any thread)"
+        waiters, self.idleWaiters = self.idleWaiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe( wakeFuture, future )
+
     def sendInt( self, intr=chr( 3 ) ):
         "Interrupt running command."
         debug( 'sendInt: writing chr(%d)\n' % ord( intr ) )
         self.write( intr )
 
-    def monitor( self, timeoutms=None, findPid=True ):
-        """Monitor and return the output of a command.
+    # Job and PID of a backgrounded command, e.g. [1] 1234
+    _jobRegex = re.compile( br'\[\d+\] \d+\r\n' )
+    # PID marker from mnexec -p or sendCmd()
+    _pidRegex = re.compile( br'\x01(\d+)\r\n' )
+
+    def monitorBytes( self, timeoutms=None, findPid=True ):
+        """Monitor and return the raw output of a command. Only new
+           output is scanned for PID markers and the sentinel.
            Set self.waiting to False if command has completed.
            timeoutms: timeout in ms or None to wait indefinitely
-           findPid: look for PID from mnexec -p"""
-        ready = self.waitReadable( timeoutms )
-        if not ready:
-            return ''
-        data = self.read( 1024 )
-        pidre = r'\[\d+\] \d+\r\n'
-        # Look for PID
-        marker = chr( 1 ) + r'\d+\r\n'
-        if findPid and chr( 1 ) in data:
-            # suppress the job and PID of a backgrounded command
-            if re.findall( pidre, data ):
-                data = re.sub( pidre, '', data )
+           findPid: look for PID from mnexec -p
+           returns: bytes"""
+        # waitReadable() returns None if output is already buffered
+        if not self.readbuf and not self.waitReadable( timeoutms ):
+            return b''
+        data = self.readBytes()
+        if findPid and b'\x01' in data:
             # Marker can be read in chunks; continue until all of it is read
-            while not re.findall( marker, data ):
-                data += self.read( 1024 )
-            markers = re.findall( marker, data )
-            if markers:
-                self.lastPid = int( markers[ 0 ][ 1: ] )
-                data = re.sub( marker, '', data )
+            start = data.find( b'\x01' )
+            while not self._pidRegex.search( data, start ):
+                data += self.readBytes()
+            data = self.stripPid( data )
         # Look for sentinel/EOF
-        if len( data ) > 0 and data[ -1 ] == chr( 127 ):
-            self.waiting = False
-            data = data[ :-1 ]
-        elif chr( 127 ) in data:
+        if b'\x7f' in data:
             self.waiting = False
-            data = data.replace( chr( 127 ), '' )
+            data = data.replace( b'\x7f', b'' )
+        return data
+
+    def stripPid( self, data ):
+        """Internal method: remove the job and PID markers of a
+           backgrounded command from its output, and set lastPid
+           data: raw output, including any complete PID marker
+           returns: bytes"""
+        data = self._jobRegex.sub( b'', data )
+        match = self._pidRegex.search( data )
+        if match:
+            self.lastPid = int( match.group( 1 ) )
+            data = self._pidRegex.sub( b'', data )
         return data
 
-    def waitOutput( self, verbose=False, findPid=True ):
+    def monitor( self, timeoutms=None, findPid=True ):
+        """Monitor and return the output of a command.
+           Set self.waiting to False if command has completed.
+           timeoutms: timeout in ms or None to wait indefinitely
+           findPid: look for PID from mnexec -p"""
+        return self.decoder.decode( self.monitorBytes( timeoutms, findPid ) )
+
+    def waitOutput( self, verbose=False, findPid=True, timeout=None,
+                    escalation=None ):
         """Wait for a command to complete.
            Completion is signaled by a sentinel character, ASCII(127)
            appearing in the output stream.  Wait for the sentinel and return
            the output, including trailing newline.
-           verbose: print output interactively"""
+           verbose: print output interactively
+           timeout: timeout in seconds (None: wait indefinitely), after
+                    which the command is stopped using stopCmd() and
+                    CmdTimeout is raised
+           escalation: escalation steps for stopCmd()"""
         log = info if verbose else debug
-        output = ''
+        # Don't decode output just to throw it away
+        logDecoder = None
+        if verbose or lg.isEnabledFor( LEVELS[ 'debug' ] ):
+            logDecoder = getincrementaldecoder()
+        deadline = None if timeout is None else now() + timeout
+        chunks = []
         while self.waiting:
-            data = self.monitor( findPid=findPid )
-            output += data
-            log( data )
-        return output
+            timeoutms = None
+            if deadline is not None:
+                timeoutms = int( ( deadline - now() ) * 1000 )
+                if timeoutms <= 0:
+                    recovery = self.stopCmd( escalation, chunks, findPid )
+                    raise CmdTimeout( self, self.lastCmd, timeout,
+                                      self.decoder.decode(
+                                          b''.join( chunks ) ), recovery )
+            data = self.monitorBytes( timeoutms, findPid=findPid )
+            chunks.append( data )
+            if logDecoder:
+                log( logDecoder.decode( data ) )
+        # Decode all of our output at once
+        return self.decoder.decode( b''.join( chunks ) )
+
+    def stopCmd( self, escalation=None, chunks=None, findPid=True ):
+        """Stop our running command, trying each escalation step in
+           turn until it completes:
+           'interrupt': sendInt()
+           'kill': send SIGKILL to its processes (see killCmd())
+           'restart': replace our shell (see restartShell())
+           If none of them does, our shell is restarted anyway, so that
+           it is usable again.
+           escalation: steps to try (default: self.escalation)
+           chunks: list to append raw output to
+           returns: step which stopped it"""
+        chunks = [] if chunks is None else chunks
+        for step in self.escalation if escalation is None else escalation:
+            debug( '*** %s: stopping %r: %s\n' %
+                   ( self.name, self.lastCmd, step ) )
+            if step == 'interrupt':
+                self.sendInt()
+            elif step == 'kill':
+                self.killCmd()
+            elif step == 'restart':
+                self.restartShell()
+                return step
+            else:
+                raise Exception( 'unknown escalation step %s' % step )
+            deadline = now() + self.escalationWait
+            while self.waiting:
+                timeoutms = int( ( deadline - now() ) * 1000 )
+                if timeoutms <= 0:
+                    break
+                chunks.append( self.monitorBytes( timeoutms, findPid ) )
+            if not self.waiting:
+                return step
+        warn( '*** %s: could not stop %r: restarting shell\n' %
+              ( self.name, self.lastCmd ) )
+        self.restartShell()
+        return 'restart'
+
+    def cmdPids( self ):
+        """Return pids of the processes running our current command:
+           children of our shell which were started after it was sent
+           (to the nearest clock tick) and aren't earlier background
+           commands, and lastPid, if any"""
+        pids = set( [ self.lastPid ] if self.lastPid else [] )
+        try:
+            with open( '/proc/%d/task/%d/children' % ( self.pid,
+                                                       self.pid ) ) as f:
+                children = [ int( pid ) for pid in f.read().split() ]
+        except ( IOError, OSError ):
+            children = [ int( pid ) for pid in os.listdir( '/proc' )
+                         if pid.isdigit() and
+                         ( procStat( pid ) or [ 0, 0 ] )[ 1 ] ==
+                         str( self.pid ) ]
+        # Process start times are in clock ticks since boot
+        with open( '/proc/uptime' ) as f:
+            uptime = float( f.read().split()[ 0 ] )
+        ticks = os.sysconf( 'SC_CLK_TCK' )
+        since = ( uptime - ( now() - ( self.sendTime or 0 ) ) ) * ticks - 1
+        self.jobPids = set( pid for pid in self.jobPids if pid in children )
+        for pid in set( children ) - self.jobPids:
+            stat = procStat( pid )
+            if stat and int( stat[ 19 ] ) >= since:
+                pids.add( pid )
+        return pids
+
+    def killCmd( self ):
+        "Send SIGKILL to the processes running our current command"
+        for pid in self.cmdPids():
+            try:
+                os.kill( pid, signal.SIGKILL )
+            except OSError:
+                pass
+
+    def restartShell( self ):
+        """Replace our shell with a new one in the same namespaces,
+           e.g. if it is stuck. Anything else running in our old
+           shell's session is killed."""
+        with self.lock:
+            # Keep our namespaces while we have no shell
+            held = self.inNamespace and not self.holder
+            if held:
+                self.hold()
+            with self.fdLock:
+                for fdToNode in self.outToNode, self.inToNode:
+                    if fdToNode.get( self.master ) is self:
+                        del fdToNode[ self.master ]
+            try:
+                os.killpg( self.shell.pid, signal.SIGKILL )
+            except OSError:
+                pass
+            self.shell.wait()
+            journal.remove( 'node', self.pid )
+            self.stdin.close()
+            os.close( self.slave )
+            self.shell = None
+            nsPid, self.nsPid = self.nsPid, self.holder
+            try:
+                self.startShell()
+            finally:
+                self.nsPid = nsPid
+                if held:
+                    self.release()
+            # Nodes sharing our shell need our new pid
+            for node in getattr( self, 'sharers', () ):
+                node.pid = self.pid
+                node.closeNsFds()
+
+    def channel( self, index=None ):
+        """Return one of our auxiliary shells, which run in our
+           namespaces and can be used while our own shell is busy
+           (e.g. running a server via sendCmd()). Shells are created
+           on demand, up to maxChannels.
+           index: channel number, where 0 is our own shell, or None
+                  for the first auxiliary shell which isn't busy (or
+                  any of them, if they are all busy)
+           returns: Node (self or a Channel)"""
+        if index == 0:
+            return self
+        with self.stateLock:
+            if index is None:
+                for channel in self.channels:
+                    if not channel.waiting:
+                        return channel
+                index = len( self.channels ) + 1
+                if index > self.maxChannels:
+                    # All busy: queue up on one of them (see cmd())
+                    self.channelCount += 1
+                    index = self.channelCount % self.maxChannels + 1
+            if not 0 < index <= self.maxChannels:
+                raise Exception( '%s: no channel %d (maxChannels is %d)' %
+                                 ( self.name, index, self.maxChannels ) )
+            while len( self.channels ) < index:
+                self.channels.append(
+                    Channel( self, len( self.channels ) + 1 ) )
+            return self.channels[ index - 1 ]
+
+    def selectChannel( self, kwargs ):
+        """Internal method: pop channel from kwargs and return the
+           shell to use for a command; if no channel is given, this is
+           our own shell unless it is busy (or we have no channels)
+           kwargs: keyword args of cmd(), run() or cmds()"""
+        index = kwargs.pop( 'channel', None )
+        if index is None and not ( self.maxChannels and self.shell and
+                                   self.waiting ):
+            return self
+        return self.channel( index )
+
+    def shellFor( self, args, kwargs ):
+        """Internal method: return the shell which should run a command
+           for cmd() (our own, an auxiliary or the shared root shell),
+           and the args to send it
+           args: args of cmd()
+           kwargs: keyword args of cmd() (channel is popped)"""
+        if self.sharedShell and not self.shell:
+            if not self.needsOwnShell( args ):
+                return self.sharedShell.shellFor(
+                    ( self.sharedCmd( args ), ), kwargs )
+            self.ownShell()
+        return self.selectChannel( kwargs ), args
 
     def cmd( self, *args, **kwargs ):
         """Send a command, wait for output, and return it.
-           cmd: string"""
+           cmd: string
+           channel: shell to use (see channel()); by default our own
+                    shell, or an auxiliary shell if it is busy
+           timeout, escalation: as for waitOutput()"""
         verbose = kwargs.get( 'verbose', False )
+        shell, args = self.shellFor( args, kwargs )
+        if shell is not self:
+            return shell.cmd( *args, channel=0, **kwargs )
         log = info if verbose else debug
         log( '*** %s : %s\n' % ( self.name, args ) )
         if self.shell:
-            self.sendCmd( *args, **kwargs )
-            return self.waitOutput( verbose )
+            with self.lock:
+                self.sendCmd( *args, **kwargs )
+                return self.waitOutput(
+                    verbose, timeout=kwargs.get( 'timeout' ),
+                    escalation=kwargs.get( 'escalation' ) )
         else:
             warn( '(%s exited - ignoring cmd%s)\n' % ( self, args ) )
         return None
 
+    # Shell function which prints the frame for a command: its token
+    # and exit status, followed by its stderr if it was captured (read
+    # NUL-terminated chunk by chunk, so that NULs are kept)
+    _frameFn = ( "__mnframe() {"
+                 " printf '\\001%s %d\\001' \"$1\" \"$2\";"
+                 " [ -z \"$3\" ] || {"
+                 " while IFS= read -r -d '' __mnerr;"
+                 " do printf '%s\\0' \"$__mnerr\"; done <\"$3\";"
+                 " printf '%s' \"$__mnerr\"; }; }; " )
+
+    def frameCmd( self, cmd, separate=True ):
+        """Internal method: wrap cmd so that its output is framed by a
+           unique marker which carries its exit status
+           cmd: command and arguments (list) or string
+           separate: capture stderr separately?
+           returns: line to send to our shell, frame info for collect()"""
+        if not isinstance( cmd, BaseString ):
+            cmd = ' '.join( str( arg ) for arg in cmd )
+        if not re.search( r'\w', cmd ):
+            cmd = 'true'
+        debug( '*** %s : run %s\n' % ( self.name, cmd ) )
+        self.runCount += 1
+        token = '%d.%d' % ( self.pid, self.runCount )
+        background = cmd.rstrip().endswith( '&' )
+        # Our closing brace goes on its own line, which terminates the
+        # command however it ends (e.g. with &, ; or a comment).
+        # Commands which are queued after cmd are written to our shell's
+        # stdin before it runs, so cmd mustn't read them.
+        if separate:
+            if not self.errFile:
+                self.errFile = '/tmp/mininet-%d.err' % self.pid
+                journal.add( 'file', self.errFile )
+            # read is a builtin, so this doesn't fork
+            line = '{ %s\n} </dev/null 2>%s; __mnframe %s $? %s' % (
+                cmd, self.errFile, token, self.errFile )
+        else:
+            line = '{ %s\n} </dev/null 2>&1; __mnframe %s $?' % (
+                cmd, token )
+        if not self.framing:
+            # Define our frame function along with the command, since
+            # each complete command yields exactly one prompt
+            line = self._frameFn + line
+            self.framing = True
+        line += '\n'
+        return line, ( token, separate, background, len( line ) )
+
+    def pipeline( self, frames ):
+        """Internal method: write framed commands to our shell, batching
+           them into as few writes as possible. At most pipelineBytes of
+           commands are in flight, so that we never block writing to our
+           shell while it is blocked writing output for us to read.
+           frames: list of results of frameCmd()"""
+        batch = []
+        for line, frame in frames:
+            while self.pending and ( self.inflight + len( line ) >
+                                     self.pipelineBytes ):
+                if batch:
+                    self.write( ''.join( batch ) )
+                    batch = []
+                else:
+                    self.results.append( self.collectOne() )
+            batch.append( line )
+            self.pending.append( frame )
+            self.inflight += frame[ -1 ]
+            self.waiting = True
+        if batch:
+            self.write( ''.join( batch ) )
+
+    def readResponse( self ):
+        """Internal method: read the raw output of one command line,
+           up to the sentinel which follows it
+           returns: bytes, minus the sentinel"""
+        start = 0
+        pos = self.readbuf.find( b'\x7f' )
+        while pos < 0:
+            start = len( self.readbuf )
+            self.readbuf += os.read( self.stdout.fileno(), self.readSize )
+            pos = self.readbuf.find( b'\x7f', start )
+        data = bytes( self.readbuf[ :pos ] )
+        del self.readbuf[ :pos + 1 ]
+        self.scanPos = 0
+        return data
+
+    def collectOne( self ):
+        """Internal method: wait for our oldest submitted command
+           returns: out, err, exitcode (None if interrupted)"""
+        token, separate, background, size = self.pending.popleft()
+        output = self.decoder.decode( self.readResponse() )
+        self.inflight -= size
+        self.waiting = bool( self.pending )
+        output = output.replace( '\r\n', '\n' )
+        out, marker, rest = output.rpartition( '\x01%s ' % token )
+        if not marker:
+            return output, '', None
+        code, _, err = rest.partition( '\x01' )
+        if background:
+            # Remove the job notice, but remember its PID
+            job = re.match( r'\[\d+\] (\d+)\n', err if separate else out )
+            if job:
+                self.lastPid = int( job.group( 1 ) )
+                if separate:
+                    err = err[ job.end(): ]
+                else:
+                    out = out[ job.end(): ]
+        return out, err, int( code )
+
+    def submit( self, *args, **kwargs ):
+        """Send a command to our shell without waiting for it. Any
+           number of commands may be submitted; our shell runs them
+           back to back, and collect() returns their results in order.
+           args: command and arguments, or string
+           stderr: return stderr separately? (True; else merge it)"""
+        # Results are ours alone, so we need our own shell
+        self.ownShell()
+        # Don't interleave with sendCmd()
+        assert self.shell and ( self.pending or not self.waiting )
+        if len( args ) == 1 and isinstance( args[ 0 ], list ):
+            args = args[ 0 ]
+        with self.lock:
+            self.pipeline( [ self.frameCmd( args,
+                                            kwargs.get( 'stderr', True ) ) ] )
+
+    def collect( self ):
+        """Wait for all submitted commands to complete.
+           returns: list of ( out, err, exitcode ) in submission order"""
+        with self.lock:
+            while self.pending:
+                self.results.append( self.collectOne() )
+            results, self.results = self.results, []
+        return results
+
+    def cmds( self, cmds, **kwargs ):
+        """Run a list of commands, pipelined so that they take a single
+           round trip to our shell (as long as they fit in pipelineBytes)
+           cmds: list of commands (each a string or list)
+           stderr: return stderr separately? (True; else merge it)
+           channel: shell to use, as for cmd()
+           returns: list of ( out, err, exitcode ), as for run()"""
+        if self.sharedShell and not self.shell:
+            # Each command may be a string, or a list or tuple of args
+            argsList = [ cmd if isinstance( cmd, ( list, tuple ) )
+                         else [ cmd ] for cmd in cmds ]
+            if not any( self.needsOwnShell( args ) for args in argsList ):
+                return self.sharedShell.cmds(
+                    [ self.sharedCmd( args ) for args in argsList ],
+                    **kwargs )
+            self.ownShell()
+        shell = self.selectChannel( kwargs )
+        if shell is not self:
+            return shell.cmds( cmds, channel=0, **kwargs )
+        if not self.shell:
+            warn( '(%s exited - ignoring cmds %s)\n' % ( self, cmds ) )
+            return [ ( None, None, None ) ] * len( cmds )
+        separate = kwargs.get( 'stderr', True )
+        with self.lock:
+            assert not self.waiting and not self.results
+            self.pipeline( [ self.frameCmd( cmd, separate )
+                             for cmd in cmds ] )
+            return self.collect()
+
+    def run( self, *args, **kwargs ):
+        """Run a command in a single round trip to our shell, and return
+           its output and exit status. Output is framed by a unique
+           marker which carries the exit status, and stderr is captured
+           separately, so nothing needs to be inferred from the output.
+           args: command and arguments, or string
+           stderr: return stderr separately? (True; else merge it)
+           channel: shell to use, as for cmd()
+           returns: out, err, exitcode (None if interrupted)
+           Note: unlike cmd(), the pty's \r\n line endings are
+           converted back to \n"""
+        if len( args ) == 1 and isinstance( args[ 0 ], list ):
+            args = args[ 0 ]
+        return self.cmds( [ args ], **kwargs )[ 0 ]
+
+    def acmd( self, *args, **kwargs ):
+        """Asynchronous cmd() for asyncio (Python 3 only)
+           args, kwargs: as for cmd()
+           timeout: timeout in seconds, after which the command is
+                    interrupted and asyncio.TimeoutError is raised
+           returns: coroutine which returns the output"""
+        from mininet.aio import acmd
+        return acmd( self, *args, **kwargs )
+
+    def apopen( self, *args, **kwargs ):
+        """Asynchronous popen() for asyncio (Python 3 only)
+           args, kwargs: as for popen()
+           returns: coroutine which returns an asyncio Process"""
+        from mininet.aio import apopen
+        return apopen( self, *args, **kwargs )
+
     def cmdPrint( self, *args):
         """Call cmd and printing its output
            cmd: string"""
         return self.cmd( *args, **{ 'verbose': True } )
 
-    def popen( self, *args, **kwargs ):
-        """Return a Popen() object in our namespace
-           args: Popen() args, single list, or string
-           kwargs: Popen() keyword args"""
-        defaults = { 'stdout': PIPE, 'stderr': PIPE,
-                     'mncmd':
-                     [ 'mnexec', '-da', str( self.pid ) ] }
+    def mncmd( self ):
+        "Return mnexec command prefix to run a command in our namespaces"
+        return [ 'mnexec', '-da', str( self.pid ) ]
+
+    def nsFds( self ):
+        """Return ( net, mnt ) fds for our namespaces, which are opened
+           once and cached"""
+        if not self.nsfds:
+            self.nsfds = nsOpen( self.pid )
+        return self.nsfds
+
+    def closeNsFds( self ):
+        "Close our cached namespace fds"
+        for fd in self.nsfds or ():
+            os.close( fd )
+        self.nsfds = None
+
+    def spawnParams( self ):
+        """Return cgroup and rtprio parameters for spawner.popen(),
+           equivalent to our mncmd()"""
+        return {}
+
+    def popenArgs( self, args, kwargs ):
+        """Internal method: return the command and Popen() keyword args
+           for popen( *args, **kwargs )"""
+        defaults = { 'stdout': PIPE, 'stderr': PIPE }
         defaults.update( kwargs )
+        mncmd = defaults.pop( 'mncmd', None )
         shell = defaults.pop( 'shell', False )
         if len( args ) == 1:
             if isinstance( args[ 0 ], list ):
@@ -418,19 +1191,129 @@ def popen( self, *args, **kwargs ):
         if shell:
             cmd = [ os.environ[ 'SHELL' ], '-c' ] + [ ' '.join( cmd ) ]
         # Attach to our namespace  using mnexec -a
-        cmd = defaults.pop( 'mncmd' ) + cmd
-        popen = self._popen( cmd, **defaults )
+        cmd = ( self.mncmd() if mncmd is None else mncmd ) + cmd
+        return cmd, defaults
+
+    def popen( self, *args, **kwargs ):
+        """Return a Popen() object in our namespace
+           args: Popen() args, single list, or string
+           kwargs: Popen() keyword args
+           Unless mncmd is given, the process is started in our
+           namespaces by util.spawner, which saves exec'ing mnexec."""
+        if 'mncmd' in kwargs or not spawner.available():
+            cmd, params = self.popenArgs( args, kwargs )
+            return self._popen( cmd, **params )
+        cmd, params = self.popenArgs( args, dict( kwargs, mncmd=[] ) )
+        params.update( self.spawnParams() )
+        popen = spawner.popen( self.nsFds(), cmd, **params )
+        debug( 'spawn', cmd, popen.pid )
         return popen
 
     def pexec( self, *args, **kwargs ):
         """Execute a command using popen
+           timeout: timeout in seconds (None: wait indefinitely), after
+                    which the command's session is sent SIGINT and then
+                    SIGKILL, and CmdTimeout is raised (Python 3 only)
            returns: out, err, exitcode"""
+        timeout = kwargs.pop( 'timeout', None )
         popen = self.popen( *args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
                             **kwargs )
-        # Warning: this can fail with large numbers of fds!
-        out, err = popen.communicate()
-        exitcode = popen.wait()
-        return decode( out ), decode( err ), exitcode
+        if timeout is None:
+            # Warning: this can fail with large numbers of fds!
+            out, err = popen.communicate()
+            exitcode = popen.wait()
+            return decode( out ), decode( err ), exitcode
+        try:
+            out, err = popen.communicate( timeout=timeout )
+        except TimeoutExpired:
+            recovery = None
+            # popen() starts each command in its own session
+            for step, sig in ( ( 'interrupt', signal.SIGINT ),
+                               ( 'kill', signal.SIGKILL ) ):
+                try:
+                    os.killpg( popen.pid, sig )
+                    out, _err = popen.communicate(
+                        timeout=self.escalationWait )
+                    recovery = step
+                    break
+                except ( OSError, TimeoutExpired ):
+                    pass
+            if not recovery:
+                # Don't leak its pipes; it is reaped when it exits
+                for f in popen.stdin, popen.stdout, popen.stderr:
+                    f.close()
+            raise CmdTimeout( self, self.cmdString( args ), timeout,
+                              decode( out ) if recovery else '', recovery )
+        return decode( out ), decode( err ), popen.wait()
+
+    def startJob( self, *args, **kwargs ):
+        """Start a background job in our namespaces (see mininet.jobs)
+           args: command and arguments (list), or shell command string
+           name: job name (default: job1, job2...)
+           log: file for stdout and stderr (default: a temporary file,
+                which is removed by cleanup())
+           ring: capture stdout and stderr in a ring file (log) of this
+                 many bytes, which holds only the most recent output
+                 (see mininet.ring)
+           kwargs: other popen() keyword args
+           returns: Job"""
+        if len( args ) == 1:
+            args = args[ 0 ]
+        cmd = ( [ 'bash', '-c', args ] if isinstance( args, BaseString )
+                else [ str( arg ) for arg in args ] )
+        with self.stateLock:
+            self.jobCount += 1
+            name = kwargs.pop( 'name', None ) or 'job%d' % self.jobCount
+            if name in self.jobs:
+                raise Exception( '%s: job %s already exists' %
+                                 ( self.name, name ) )
+            log, size = kwargs.pop( 'log', None ), kwargs.pop( 'ring', None )
+            managed = log is None
+            if managed:
+                log = '/tmp/mininet-%d-%s-%s.%s' % (
+                    self.pid, self.name, name, 'ring' if size else 'log' )
+                journal.add( 'file', log )
+            ring = RingFile( log, size ) if size else None
+            with open( os.devnull ) as devnull, open(
+                    os.devnull if ring else log, 'w' ) as out:
+                popen = self.popen( cmd, stdin=devnull,
+                                    stdout=PIPE if ring else out,
+                                    stderr=STDOUT, **kwargs )
+            job = Job( self, name, popen, log, managed=managed, ring=ring )
+            self.jobs[ name ] = job
+        return job
+
+    def stopJobs( self, timeout=stopTimeout ):
+        """Stop all of our running jobs, escalating from SIGTERM to
+           SIGKILL (see mininet.jobs.stopJobs())
+           timeout: seconds to wait before sending SIGKILL
+           returns: list of Jobs which needed SIGKILL"""
+        return stopJobs( list( self.jobs.values() ), timeout )
+
+    def startAgent( self, path, wait=True ):
+        """Start an exec agent (see mininet.agent) in our namespaces,
+           as a job named 'agent'
+           path: unix socket for the agent to listen on
+           wait: wait for the agent to start listening (see waitAgent())?
+           returns: Job"""
+        journal.add( 'file', path )
+        self.agentPath = path
+        job = self.startJob( [ executable, agent.__file__, path ],
+                             name='agent' )
+        if wait:
+            self.waitAgent()
+        return job
+
+    def waitAgent( self, timeout=10 ):
+        """Wait for our agent to start listening on agentPath
+           timeout: seconds to wait before giving up"""
+        job, deadline, delay = self.jobs[ 'agent' ], now() + timeout, .001
+        while not os.path.exists( self.agentPath ):
+            if not job.running() or now() > deadline:
+                raise Exception( '%s: agent failed to start: %s' %
+                                 ( self.name, job.output() ) )
+            sleep( delay )
+            delay = min( delay * 2, .05 )
 
     # Interface management, configuration, and routing
 
@@ -441,21 +1324,34 @@ def pexec( self, *args, **kwargs ):
     # make a single interface at a time.
 
     def newPort( self ):
-        "Return the next port number to allocate."
-        if len( self.ports ) > 0:
-            return max( self.ports.values() ) + 1
-        return self.portBase
+        """Return the next port number to allocate.
+           Note: this is a counter rather than max( ports ) + 1, so
+           the numbers of deleted ports are not handed out again."""
+        return self.nextPort
+
+    def reservePort( self ):
+        """Allocate the next port number, so that it won't be returned
+           again (e.g. to a link being created by another thread)
+           returns: port number"""
+        with self.stateLock:
+            port = self.nextPort
+            self.nextPort += 1
+            return port
 
     def addIntf( self, intf, port=None, moveIntfFn=moveIntf ):
         """Add an interface.
            intf: interface
            port: port number (optional, typically OpenFlow port number)
            moveIntfFn: function to move interface (optional)"""
-        if port is None:
-            port = self.newPort()
-        self.intfs[ port ] = intf
-        self.ports[ intf ] = port
-        self.nameToIntf[ intf.name ] = intf
+        with self.stateLock:
+            if port is None:
+                port = self.newPort()
+            self.intfs[ port ] = intf
+            self.ports[ intf ] = port
+            self.nameToIntf[ intf.name ] = intf
+            if port >= self.nextPort:
+                self.nextPort = port + 1
+            self.addPeer( intf )
         debug( '\n' )
         debug( 'added intf %s (%d) to node %s\n' % (
                 intf, port, self.name ) )
@@ -466,11 +1362,42 @@ def addIntf( self, intf, port=None, moveIntfFn=moveIntf ):
     def delIntf( self, intf ):
         """Remove interface from Node's known interfaces
            Note: to fully delete interface, call intf.delete() instead"""
-        port = self.ports.get( intf )
-        if port is not None:
-            del self.intfs[ port ]
-            del self.ports[ intf ]
-            del self.nameToIntf[ intf.name ]
+        with self.stateLock:
+            port = self.ports.get( intf )
+            if port is not None:
+                del self.intfs[ port ]
+                del self.ports[ intf ]
+                del self.nameToIntf[ intf.name ]
+                self.delPeer( intf )
+
+    @staticmethod
+    def peerIntf( intf ):
+        "Return the intf at the other end of intf's link, or None"
+        link = intf.link
+        if not link:
+            return None
+        return link.intf2 if link.intf1 is intf else link.intf1
+
+    def addPeer( self, intf ):
+        """Internal method: index intf's link in self.peers and in the
+           peer node's peers, once both ends of the link exist"""
+        peer = self.peerIntf( intf )
+        if peer is None or peer.node is None:
+            return
+        self.peers.setdefault( peer.node, {} )[ intf ] = peer
+        peer.node.peers.setdefault( self, {} )[ peer ] = intf
+
+    def delPeer( self, intf ):
+        "Internal method: remove intf's link from both nodes' peers"
+        peer = self.peerIntf( intf )
+        if peer is None or peer.node is None:
+            return
+        for node, other, ours in ( ( self, peer.node, intf ),
+                                   ( peer.node, self, peer ) ):
+            intfs = node.peers.get( other, {} )
+            intfs.pop( ours, None )
+            if not intfs:
+                node.peers.pop( other, None )
 
     def defaultIntf( self ):
         "Return interface for lowest port"
@@ -500,17 +1427,11 @@ def intf( self, intf=None ):
 
     def connectionsTo( self, node):
         "Return [ intf1, intf2... ] for all intfs that connect self to node."
-        # We could optimize this if it is important
-        connections = []
-        for intf in self.intfList():
-            link = intf.link
-            if link:
-                node1, node2 = link.intf1.node, link.intf2.node
-                if node1 == self and node2 == node:
-                    connections += [ ( intf, link.intf2 ) ]
-                elif node1 == node and node2 == self:
-                    connections += [ ( intf, link.intf1 ) ]
-        return connections
+        # Intfs may have been moved to other nodes behind our back
+        # (e.g. examples/mobility.py), so we check ownership as well
+        return [ ( intf, peer )
+                 for intf, peer in self.peers.get( node, {} ).items()
+                 if intf.node is self and peer.node is node ]
 
     def deleteIntfs( self, checkName=True ):
         """Delete all of our interfaces.
@@ -570,10 +1491,43 @@ def setIP( self, ip, prefixLen=8, intf=None, **kwargs ):
            kwargs: any additional arguments for intf.setIP"""
         return self.intf( intf ).setIP( ip, prefixLen, **kwargs )
 
+    def setIP6( self, ip, prefixLen=64, intf=None ):
+        """Set the (global) IPv6 address for an interface.
+           intf: intf or intf name
+           ip: IPv6 address as a string
+           prefixLen: prefix length, e.g. 64 for /64"""
+        return self.intf( intf ).setIP6( ip, prefixLen )
+
+    def configIPv6( self, dad=False, rs=False ):
+        """Configure IPv6 autoconfiguration in our namespace.
+           Call before links are added, since the sysctls apply
+           to interfaces which are created or moved in later.
+           dad: do duplicate address detection? (False)
+           rs: send router solicitations? (False)"""
+        if not self.inNamespace:
+            # Don't change settings for the root namespace
+            return None
+        prefix = 'net.ipv6.conf.%s.'
+        settings = []
+        for conf in 'all', 'default':
+            if not dad:
+                settings += [ prefix % conf + 'accept_dad=0',
+                              prefix % conf + 'dad_transmits=0' ]
+            if not rs:
+                settings += [ prefix % conf + 'router_solicitations=0',
+                              prefix % conf + 'router_solicitation_delay=0' ]
+        if not settings:
+            return None
+        return self.cmd( 'sysctl -q -e -w', *settings )
+
     def IP( self, intf=None, update=False ):
         "Return IP address of a node or specific interface."
         return self.intf( intf ).IP(update)
 
+    def IP6( self, intf=None, update=False ):
+        "Return (global) IPv6 address of a node or specific interface."
+        return self.intf( intf ).IP6( update )
+
     def MAC( self, intf=None, update=False ):
         "Return MAC address of a node or specific interface."
         return self.intf( intf ).MAC(update)
@@ -609,11 +1563,12 @@ def setParam( self, results, method, **param ):
         results[ name ] = result
         return result
 
-    def config( self, mac=None, ip=None,
+    def config( self, mac=None, ip=None, ip6=None,
                 defaultRoute=None, lo='up', **_params ):
         """Configure Node according to (optional) parameters:
            mac: MAC address for default interface
            ip: IP address for default interface
+           ip6: IPv6 address for default interface
            defaultRoute: set defaultRoute for node
            Subclasses should override this method and call
            the parent class's config(**params)"""
@@ -623,6 +1578,7 @@ def config( self, mac=None, ip=None,
         r = {}
         self.setParam( r, 'setMAC', mac=mac )
         self.setParam( r, 'setIP', ip=ip )
+        self.setParam( r, 'setIP6', ip6=ip6 )
         self.setParam( r, 'setDefaultRoute', defaultRoute=defaultRoute )
         # This should be examined
         self.cmd( 'ip link set dev lo ' + lo)
@@ -679,6 +1635,30 @@ def setup( cls ):
         "Make sure our class dependencies are available"
         pathCheck( 'mnexec', 'ip', moduleName='Mininet')
 
+class Channel( Node ):
+    """An auxiliary shell in the namespaces of another node, for
+       running commands while that node's own shell is busy"""
+
+    def __init__( self, node, index ):
+        """node: Node whose namespaces we share
+           index: our channel number"""
+        self.node, self.index = node, index
+        Node.__init__( self, '%s.%d' % ( node.name, index ),
+                       inNamespace=node.inNamespace, nsPid=node.pid )
+        # node's namespaces aren't ours to release
+        self.holder = None
+
+    def channel( self, index=None ):
+        "Channels other than our own shell are shared with our node"
+        if index == 0:
+            return self
+        return self.node.channel( index )
+
+    def unmountPrivateDirs( self ):
+        "Our node's private directories are not ours to unmount"
+        pass
+
+
 class Host( Node ):
     "A host is simply a Node"
     pass
@@ -687,6 +1667,12 @@ class CPULimitedHost( Host ):
 
     "CPU limited host"
 
+    # Our shell joins our cgroup, so it can't be shared; nor can we
+    # have auxiliary shells, whose commands would escape our cgroup and
+    # scheduling, so commands from other threads queue up for ours
+    shareShell = False
+    maxChannels = 0
+
     def __init__( self, name, sched='cfs', **params ):
         Host.__init__( self, name, **params )
         # BL: Setting the correct period/quota is tricky, particularly
@@ -697,6 +1683,9 @@ def __init__( self, name, sched='cfs', **params ):
         self.sched = sched
         self.cgroupsInited = False
         self.cgroup, self.rtprio = None, None
+        if self.nsPid:
+            # Move our new shell into our existing cgroup
+            self.initCgroups()
 
     def initCgroups( self ):
         "Deferred cgroup initialization"
@@ -708,6 +1697,7 @@ def initCgroups( self ):
         # Create a cgroup and move shell into it
         self.cgroup = 'cpu,cpuacct,cpuset:/' + self.name
         errFail( 'cgcreate -g ' + self.cgroup )
+        journal.add( 'cgroup', self.cgroup )
         # We don't add ourselves to a cpuset because you must
         # specify the cpu and memory placement first
         errFail( 'cgclassify -g cpu,cpuacct:/%s %s' % ( self.name, self.pid ) )
@@ -738,24 +1728,42 @@ def cgroupDel( self ):
         _out, _err, exitcode = errRun( 'cgdelete -r ' + self.cgroup )
         # Sometimes cgdelete returns a resource busy error but still
         # deletes the group; next attempt will give "no such file"
-        return exitcode == 0 or ( 'no such file' in _err.lower() )
+        if exitcode == 0 or ( 'no such file' in _err.lower() ):
+            journal.remove( 'cgroup', self.cgroup )
+            return True
+        return False
 
-    def popen( self, *args, **kwargs ):
-        """Return a Popen() object in node's namespace
-           args: Popen() args, single list, or string
-           kwargs: Popen() keyword args"""
-        # Tell mnexec to execute command in our cgroup
-        mncmd = kwargs.pop( 'mncmd', [ 'mnexec', '-g', self.name,
-                                       '-da', str( self.pid ) ] )
+    def popenRtprio( self ):
+        """Return the SCHED_RR priority for processes started by
+           popen(), or None to use the cfs scheduler"""
+        if self.sched != 'rt':
+            return None
         # if our cgroup is not given any cpu time,
         # we cannot assign the RR Scheduler.
-        if self.sched == 'rt':
-            if int( self.cgroupGet( 'rt_runtime_us', 'cpu' ) ) <= 0:
-                mncmd += [ '-r', str( self.rtprio ) ]
-            else:
-                debug( '*** error: not enough cpu time available for %s.' %
-                       self.name, 'Using cfs scheduler for subprocess\n' )
-        return Host.popen( self, *args, mncmd=mncmd, **kwargs )
+        path = '/sys/fs/cgroup/cpu/%s/cpu.rt_runtime_us' % self.name
+        try:
+            # Read it directly rather than running cgget
+            with open( path ) as f:
+                runtime = int( f.read() )
+        except ( IOError, OSError, ValueError ):
+            runtime = int( self.cgroupGet( 'rt_runtime_us', 'cpu' ) )
+        if runtime <= 0:
+            return self.rtprio
+        debug( '*** error: not enough cpu time available for %s.' %
+               self.name, 'Using cfs scheduler for subprocess\n' )
+        return None
+
+    def mncmd( self ):
+        "Tell mnexec to execute command in our cgroup"
+        mncmd = [ 'mnexec', '-g', self.name, '-da', str( self.pid ) ]
+        rtprio = self.popenRtprio()
+        if rtprio:
+            mncmd += [ '-r', str( rtprio ) ]
+        return mncmd
+
+    def spawnParams( self ):
+        "Start processes in our cgroup"
+        return { 'cgroup': self.name, 'rtprio': self.popenRtprio() }
 
     def cleanup( self ):
         "Clean up Node, then clean up our cgroup"
@@ -1065,6 +2073,10 @@ def start( self, controllers ):
                             for c in controllers ] )
         ofdlog = '/tmp/' + self.name + '-ofd.log'
         ofplog = '/tmp/' + self.name + '-ofp.log'
+        for path in ofdlog, ofplog, '/tmp/' + self.name:
+            journal.add( 'file', path )
+        if not self.listenPort:
+            journal.add( 'file', '/tmp/%s.listen' % self.name )
         intfs = [ str( i ) for i in self.intfList() if not i.IP() ]
         self.cmd( 'ofdatapath -i ' + ','.join( intfs ) +
                   ' punix:/tmp/' + self.name + ' -d %s ' % self.dpid +
@@ -1257,6 +2269,7 @@ def start( self, controllers ):
                     ' -- set bridge %s controller=[%s]' % ( self, cids  ) +
                     self.bridgeOpts() +
                     intfs )
+        journal.add( 'ovs', self.name )
         # If necessary, restore TC config overwritten by OVS
         if not self.batch:
             for intf in self.intfList():
@@ -1301,6 +2314,7 @@ def stop( self, deleteIntfs=True ):
         self.cmd( 'ovs-vsctl del-br', self )
         if self.datapath == 'user':
             self.cmd( 'ip link del', self )
+        journal.remove( 'ovs', self.name )
         super( OVSSwitch, self ).stop( deleteIntfs )
 
     @classmethod
@@ -1312,9 +2326,14 @@ def batchShutdown( cls, switches, run=errRun ):
         # First, delete them all from ovsdb
         run( 'ovs-vsctl ' +
              ' -- '.join( delcmd % s for s in switches ) )
-        # Next, shut down all of the processes
-        pids = ' '.join( str( switch.pid ) for switch in switches )
-        run( 'kill -HUP ' + pids )
+        for switch in switches:
+            journal.remove( 'ovs', switch.name )
+        # Next, shut down all of the processes (switches which share
+        # the root namespace shell have none of their own)
+        pids = ' '.join( str( switch.pid ) for switch in switches
+                         if switch.shell )
+        if pids:
+            run( 'kill -HUP ' + pids )
         for switch in switches:
             switch.terminate()
         return switches
@@ -1389,6 +2408,7 @@ def start( self, controllers ):
         args.append( self.opts )
 
         logfile = '/tmp/ivs.%s.log' % self.name
+        journal.add( 'file', logfile )
 
         self.cmd( ' '.join(args) + ' >' + logfile + ' 2>&1 </dev/null &' )
 
@@ -1461,6 +2481,7 @@ def start( self ):
            Log to /tmp/cN.log"""
         pathCheck( self.command )
         cout = '/tmp/' + self.name + '.log'
+        journal.add( 'file', cout )
         if self.cdir is not None:
             self.cmd( 'cd ' + self.cdir )
         self.cmd( self.command + ' ' + self.cargs % self.port +
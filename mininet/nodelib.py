@@ -4,10 +4,19 @@
 This contains additional Node types which you may find to be useful.
 """
 
-from mininet.node import Node, Switch
-from mininet.log import info, warn
+import os
+import re
+import select
+import signal
+from collections import deque
+from subprocess import PIPE, STDOUT
+
+from mininet.node import Node, Host, Switch
+from mininet.log import info, warn, error, debug
+from mininet.journal import journal
 from mininet.moduledeps import pathCheck
-from mininet.util import quietRun
+from mininet.util import ( quietRun, decode, encode, isShellBuiltin,
+                           BaseString )
 
 
 class LinuxBridge( Switch ):
@@ -38,6 +47,7 @@ def start( self, _controllers ):
         self.cmd( 'ip link set dev', self, 'down' )
         self.cmd( 'ip link del', self )
         self.cmd( 'ip link add name', self, 'type bridge' )
+        journal.add( 'bridge', self.name )
         if self.stp:
             self.cmd( 'ip link set', self, 'type bridge priority', self.prio)
             self.cmd( 'ip link set', self, 'type bridge stp_state 1')
@@ -51,6 +61,7 @@ def stop( self, deleteIntfs=True ):
            deleteIntfs: delete interfaces? (True)"""
         self.cmd( 'ip link set dev', self, 'down' )
         self.cmd( 'ip link del', self )
+        journal.remove( 'bridge', self.name )
         super( LinuxBridge, self ).stop( deleteIntfs )
 
     def dpctl( self, *args ):
@@ -123,31 +134,341 @@ def config( self, **params ):
             self.cmd( 'iptables -P FORWARD DROP' )
 
         # Install NAT rules
-        self.cmd( 'iptables -I FORWARD',
-                  '-i', self.localIntf, '-d', self.subnet, '-j DROP' )
-        self.cmd( 'iptables -A FORWARD',
-                  '-i', self.localIntf, '-s', self.subnet, '-j ACCEPT' )
-        self.cmd( 'iptables -A FORWARD',
-                  '-o', self.localIntf, '-d', self.subnet, '-j ACCEPT' )
-        self.cmd( 'iptables -t nat -A POSTROUTING',
-                  '-s', self.subnet, "'!'", '-d', self.subnet,
-                  '-j MASQUERADE' )
+        for table, op, rule in self.natRules():
+            self.cmd( 'iptables -t', table, op, rule )
+            if not self.inNamespace:
+                journal.add( 'iptables', self.natRuleDel( table, rule ) )
 
         # Instruct the kernel to perform forwarding
         self.cmd( 'sysctl net.ipv4.ip_forward=1' )
 
+    def natRules( self ):
+        "Return our NAT rules as ( table, add option, rule ) tuples"
+        return [
+            ( 'filter', '-I', 'FORWARD -i %s -d %s -j DROP' %
+              ( self.localIntf, self.subnet ) ),
+            ( 'filter', '-A', 'FORWARD -i %s -s %s -j ACCEPT' %
+              ( self.localIntf, self.subnet ) ),
+            ( 'filter', '-A', 'FORWARD -o %s -d %s -j ACCEPT' %
+              ( self.localIntf, self.subnet ) ),
+            ( 'nat', '-A', "POSTROUTING -s %s '!' -d %s -j MASQUERADE" %
+              ( self.subnet, self.subnet ) ) ]
+
+    @staticmethod
+    def natRuleDel( table, rule ):
+        "Return command to delete an iptables rule"
+        return 'iptables -t %s -D %s' % ( table, rule )
+
     def terminate( self ):
         "Stop NAT/forwarding between Mininet and external network"
-        # Remote NAT rules
-        self.cmd( 'iptables -D FORWARD',
-                   '-i', self.localIntf, '-d', self.subnet, '-j DROP' )
-        self.cmd( 'iptables -D FORWARD',
-                  '-i', self.localIntf, '-s', self.subnet, '-j ACCEPT' )
-        self.cmd( 'iptables -D FORWARD',
-                  '-o', self.localIntf, '-d', self.subnet, '-j ACCEPT' )
-        self.cmd( 'iptables -t nat -D POSTROUTING',
-                  '-s', self.subnet, '\'!\'', '-d', self.subnet,
-                  '-j MASQUERADE' )
+        # Remove NAT rules
+        for table, _op, rule in self.natRules():
+            cmd = self.natRuleDel( table, rule )
+            self.cmd( cmd )
+            journal.remove( 'iptables', cmd )
         # Put the forwarding state back to what it was
         self.cmd( 'sysctl net.ipv4.ip_forward=%s' % self.forwardState )
         super( NAT, self ).terminate()
+
+
+class NamespaceHost( Host ):
+    """A host without a shell: its namespaces are held by a sleeping
+       process, and each command runs in a short-lived bash, spawned
+       in our namespaces (see Node.popen()). This saves a shell and a
+       pty per host, which adds up for large topologies.
+       Plain configuration commands (ip, tc, sysctl and ethtool, as
+       used to configure hosts and links) are exec'd directly rather
+       than through bash, and the ip commands issued by config() are
+       run as a single ip -batch.
+       Differences from Host: there is no shell state (variables, cwd,
+       jobs) between commands, output lines end with \\n rather than
+       \\r\\n, and the output of background commands is discarded
+       (use startJob() to keep it)."""
+
+    # Our commands' output comes from a pipe rather than a pty
+    _pidRegex = re.compile( br'\x01(\d+)\r?\n' )
+
+    # Configuration commands without any shell syntax, which don't
+    # need bash
+    _configCmdRegex = re.compile(
+        r'(ip|tc|sysctl|ethtool)\s[^;&|<>()$`\'"\\*?\[\]{}#~\n]*$' )
+
+    # Auxiliary shells would defeat the purpose, and commands are
+    # short-lived processes anyway
+    maxChannels = 0
+
+    def __init__( self, name, **params ):
+        self.proc = None  # bash running our current sendCmd()
+        self.sessions = []  # sessions of background commands
+        self.ipBatch = None  # ip commands queued by config()
+        Host.__init__( self, name, **params )
+
+    def startShell( self, mnopts=None ):
+        "Start a process which holds our namespaces, in place of a shell"
+        if self.shell:
+            error( "%s: shell is already running\n" % self.name )
+            return
+        opts = '-cd' if mnopts is None else mnopts
+        args = []
+        if self.nsPid:
+            opts += 'a'
+            args = [ str( self.nsPid ) ]
+        elif self.inNamespace:
+            opts += 'n'
+        # -p: print pid once our namespaces exist
+        # exec -a: name it so that it can be identified in ps
+        cmd = [ 'mnexec', opts ] + args + [
+            '-p', 'bash', '-c', 'exec -a mininet:%s sleep infinity' %
+            self.name ]
+        with open( os.devnull, 'r+' ) as devnull:
+            self.shell = self._popen( cmd, stdin=devnull, stdout=PIPE,
+                                      stderr=devnull )
+        self.pid = self.shell.pid
+        self.shell.stdout.readline()
+        self.shell.stdout.close()
+        self.stdin, self.stdout, self.pollOut = None, None, None
+        self.execed = False
+        self.lastCmd = None
+        self.lastPid = None
+        self.readbuf, self.scanPos = bytearray(), 0
+        self.pending = deque()
+        self.closeNsFds()
+        self.waiting = False
+        self.journalShell()
+
+    def configArgs( self, args ):
+        """Return a plain configuration command as a list, or None
+           args: command and arguments, or string"""
+        cmd = self.cmdString( args ).strip()
+        if not self._configCmdRegex.match( cmd ):
+            return None
+        return cmd.split()
+
+    def runConfig( self, cmd, stderr=True, data=None ):
+        """Run a configuration command in our namespaces, without a bash
+           cmd: command as a list
+           stderr: return stderr separately? (True; else merge it)
+           data: input for cmd (default: none)
+           returns: out, err, exitcode"""
+        popen = self.popen( cmd, stdin=PIPE, stdout=PIPE,
+                            stderr=PIPE if stderr else STDOUT )
+        out, err = popen.communicate( encode( data ) if data else None )
+        return ( decode( out ), decode( err ) if stderr else '',
+                 popen.returncode )
+
+    def flushIp( self ):
+        "Run any ip commands queued by config(), as one ip -batch"
+        batch = self.ipBatch
+        if not batch:
+            return
+        self.ipBatch = []
+        debug( '*** %s : ip -batch of %d commands\n' % (
+            self.name, len( batch ) ) )
+        out, err, exitcode = self.runConfig(
+            [ 'ip', '-force', '-batch', '-' ],
+            data=''.join( ' '.join( args ) + '\n' for args in batch ) )
+        if exitcode:
+            error( '*** %s: ip -batch failed: %s\n' %
+                   ( self.name, out + err ) )
+
+    def cmd( self, *args, **kwargs ):
+        """Run a command and return its output, as for Node.cmd().
+           Plain configuration commands are exec'd directly, and ip
+           commands are queued during config()"""
+        cmd = self.configArgs( args )
+        if cmd is None:
+            self.flushIp()
+            return Host.cmd( self, *args, **kwargs )
+        debug( '*** %s : %s\n' % ( self.name, args ) )
+        # Lines of a batch can't have options (e.g. ip -6 ...)
+        if ( self.ipBatch is not None and cmd[ 0 ] == 'ip' and
+             not cmd[ 1 ].startswith( '-' ) ):
+            self.ipBatch.append( cmd[ 1: ] )
+            return ''
+        self.flushIp()
+        return self.runConfig( cmd, stderr=False )[ 0 ]
+
+    def config( self, **params ):
+        """Configure as for Host.config(), running the ip commands
+           this issues as a single ip -batch"""
+        self.ipBatch = []
+        try:
+            result = Host.config( self, **params )
+            self.flushIp()
+        finally:
+            self.ipBatch = None
+        return result
+
+    def setDefaultRoute( self, intf=None ):
+        """Set the default route to go through intf, as a single ip
+           command (see Node.setDefaultRoute())"""
+        if isinstance( intf, BaseString ) and ' ' in intf:
+            params = intf
+        else:
+            params = 'dev %s' % intf
+        self.cmd( 'ip route replace default', params )
+
+    @staticmethod
+    def background( cmd ):
+        """Return cmd, rewritten to print the PID of a trailing
+           background command as for Node.sendCmd(), and whether it
+           has one. Its output is discarded, since nothing will read
+           it once the bash running cmd exits."""
+        if not cmd.rstrip().endswith( '&' ):
+            return cmd, False
+        return ( '( %s ) </dev/null >/dev/null 2>&1 & '
+                 'printf "\\001%%d\\012" $!' % cmd.rstrip()[ :-1 ], True )
+
+    def sendCmd( self, *args, **kwargs ):
+        """Start a command in a new bash, and return without waiting
+           for it to complete.
+           args: command and arguments, or string
+           printPid: print command's PID? (False)"""
+        assert self.shell and not self.waiting
+        printPid = kwargs.get( 'printPid', False )
+        cmd = self.cmdString( args )
+        self.lastCmd = cmd
+        cmd, background = self.background( cmd )
+        if not background and printPid and not isShellBuiltin( cmd ):
+            cmd = 'mnexec -p ' + cmd
+        # The sentinel goes on its own line, in case cmd ends
+        # with a comment
+        self.proc = self.popen( [ 'bash', '-c', cmd + '\nprintf "\\177"' ],
+                                stdin=PIPE, stdout=PIPE, stderr=STDOUT )
+        if background:
+            with self.stateLock:
+                self.sessions.append( self.proc.pid )
+        self.stdin, self.stdout = self.proc.stdin, self.proc.stdout
+        self.pollOut = select.poll()
+        self.pollOut.register( self.stdout, select.POLLIN )
+        with self.fdLock:
+            self.outToNode[ self.stdout.fileno() ] = self
+        self.lastPid = None
+        self.waiting = True
+
+    def finishCmd( self ):
+        "Internal method: reap the bash which ran our last command"
+        with self.fdLock:
+            if self.outToNode.get( self.stdout.fileno() ) is self:
+                del self.outToNode[ self.stdout.fileno() ]
+        self.stdin.close()
+        self.stdout.close()
+        self.proc.wait()
+        self.proc, self.stdin, self.stdout, self.pollOut = (
+            None, None, None, None )
+        self.readbuf, self.scanPos = bytearray(), 0
+
+    def monitorBytes( self, timeoutms=None, findPid=True ):
+        """Monitor and return the raw output of a command, as for
+           Node.monitorBytes()"""
+        data = Node.monitorBytes( self, timeoutms, findPid )
+        if self.waiting and not data and self.proc.poll() is not None:
+            # Our bash exited without printing the sentinel, e.g.
+            # after sendInt(), so there is nothing more to wait for
+            self.waiting = False
+        if not self.waiting and self.proc:
+            self.finishCmd()
+        return data
+
+    def write( self, data ):
+        """Write data to the stdin of our running command.
+           data: string"""
+        if not self.proc:
+            raise Exception( '%s: no command is running' % self.name )
+        os.write( self.stdin.fileno(), encode( data ) )
+
+    def sendInt( self, intr=chr( 3 ) ):
+        "Interrupt running command, by sending SIGINT to its session"
+        debug( 'sendInt: interrupting %s\n' % self.lastCmd )
+        if self.proc and self.proc.poll() is None:
+            os.killpg( self.proc.pid, signal.SIGINT )
+
+    def killCmd( self ):
+        "Send SIGKILL to our running command's session"
+        if self.proc and self.proc.poll() is None:
+            os.killpg( self.proc.pid, signal.SIGKILL )
+
+    def restartShell( self ):
+        "Kill our running command; we have no shell to restart"
+        if self.proc:
+            self.killCmd()
+            self.finishCmd()
+        self.waiting = False
+
+    def run( self, *args, **kwargs ):
+        """Run a command in a new bash, and return its output and exit
+           status. As for Node.run(), nothing is inferred from output.
+           args: command and arguments, or string
+           stderr: return stderr separately? (True; else merge it)
+           returns: out, err, exitcode"""
+        kwargs.pop( 'channel', None )
+        separate = kwargs.get( 'stderr', True )
+        cmd = self.configArgs( args )
+        if cmd is not None:
+            self.flushIp()
+            return self.runConfig( cmd, stderr=separate )
+        if len( args ) == 1 and isinstance( args[ 0 ], list ):
+            args = args[ 0 ]
+        cmd = ' '.join( str( arg ) for arg in args )
+        if not re.search( r'\w', cmd ):
+            cmd = 'true'
+        debug( '*** %s : run %s\n' % ( self.name, cmd ) )
+        self.flushIp()
+        cmd, background = self.background( cmd )
+        with open( os.devnull ) as devnull:
+            popen = self.popen( [ 'bash', '-c', cmd ], stdin=devnull,
+                                stdout=PIPE,
+                                stderr=PIPE if separate else STDOUT )
+        out, err = popen.communicate()
+        out, err = decode( out ), decode( err ) if separate else ''
+        if background:
+            with self.stateLock:
+                self.sessions.append( popen.pid )
+            match = re.search( r'\x01(\d+)\n', out )
+            if match:
+                self.lastPid = int( match.group( 1 ) )
+                out = out[ :match.start() ] + out[ match.end(): ]
+        return out, err, popen.returncode
+
+    def cmds( self, cmds, **kwargs ):
+        """Run a list of commands, one after the other
+           cmds: list of commands (each a string or list)
+           stderr: return stderr separately? (True; else merge it)
+           returns: list of ( out, err, exitcode ), as for run()"""
+        kwargs.pop( 'channel', None )
+        return [ self.run( cmd, **kwargs ) for cmd in cmds ]
+
+    def submit( self, *args, **kwargs ):
+        """Queue a command for collect(), which runs queued commands
+           in order
+           args: command and arguments, or string
+           stderr: return stderr separately? (True; else merge it)"""
+        with self.lock:
+            self.pending.append( ( args, kwargs ) )
+
+    def collect( self ):
+        """Run all submitted commands
+           returns: list of ( out, err, exitcode ) in submission order"""
+        with self.lock:
+            pending, self.pending = self.pending, deque()
+        return [ self.run( *args, **kwargs ) for args, kwargs in pending ]
+
+    def hangup( self ):
+        """Send SIGHUP to our running command, our background commands
+           and the process holding our namespaces"""
+        with self.stateLock:
+            sessions, self.sessions = self.sessions, []
+        if self.proc and self.proc.poll() is None:
+            sessions.append( self.proc.pid )
+        for session in sessions:
+            try:
+                os.killpg( session, signal.SIGHUP )
+            except OSError:
+                pass
+        Node.hangup( self )
+
+    def cleanup( self ):
+        "Reap our running command, if any, and clean up"
+        if self.proc:
+            self.finishCmd()
+        Node.cleanup( self )
@@ -0,0 +1,294 @@
+"""
+Ring files for capturing command output
+
+Long-running commands (pings, iperf servers, traffic generators) can
+produce a lot of output, of which we usually want only the most
+recent part. A RingFile is a fixed-size, memory-mapped file which
+holds the last size bytes written to it:
+
+    pinger = h1.startJob( 'ping', h2.IP(), ring=65536 )
+    ...
+    print( pinger.output() )
+    for job, line in follow( [ pinger, ... ], seconds=10 ):
+        ...
+
+Jobs started with ring=size write to a pipe, and a single capture
+thread copies the output of every such pipe into its job's ring file,
+so no tail or other helper processes are needed.
+
+Readers map the same file (which may be opened by path from another
+process), so checking for new output is a memory read rather than a
+system call per line or per file. Each reader keeps its own position,
+as an offset into the stream of everything which has been written;
+output which has been overwritten before it was read is skipped.
+
+File layout: a header containing a magic string, the data size and
+the total number of bytes written so far (the head), padded to
+headerSize bytes, followed by size bytes of data, in which byte n of
+the stream is stored at offset n % size.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from time import sleep, time as now
+
+from mininet.util import Reactor, Encoding, Python3
+
+
+class RingFile( object ):
+    "A fixed-size, memory-mapped file holding recent output"
+
+    magic = b'MNRING1\0'
+    headerFormat = '<8sQQ'  # magic, size, head
+    headerSize = 64
+
+    def __init__( self, path, size=None ):
+        """path: file path
+           size: data size in bytes, to create (or truncate) path
+                 for writing (default: open existing path for reading)"""
+        self.path, self.writable = path, size is not None
+        if self.writable:
+            fd = os.open( path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644 )
+            try:
+                os.ftruncate( fd, self.headerSize + size )
+                self.map = mmap.mmap( fd, self.headerSize + size )
+            finally:
+                os.close( fd )
+            struct.pack_into( self.headerFormat, self.map, 0,
+                              self.magic, size, 0 )
+        else:
+            with open( path, 'rb' ) as f:
+                self.map = mmap.mmap( f.fileno(), 0,
+                                      access=mmap.ACCESS_READ )
+            magic, size, _head = struct.unpack_from( self.headerFormat,
+                                                     self.map, 0 )
+            if magic != self.magic:
+                self.map.close()
+                raise Exception( '%s is not a ring file' % path )
+        self.size = size
+
+    def __repr__( self ):
+        return '<RingFile %s size=%d head=%s>' % (
+            self.path, self.size, 'closed' if self.map is None
+            else self.head() )
+
+    def head( self ):
+        "Return the total number of bytes written so far"
+        return struct.unpack_from( '<Q', self.map, 16 )[ 0 ]
+
+    def write( self, data ):
+        """Append data, overwriting the oldest data if we are full
+           (there should only be one writer)
+           data: bytes"""
+        if not data:
+            return
+        head = self.head()
+        if len( data ) > self.size:
+            head += len( data ) - self.size
+            data = data[ -self.size: ]
+        pos, base = head % self.size, self.headerSize
+        first = min( len( data ), self.size - pos )
+        self.map[ base + pos: base + pos + first ] = data[ :first ]
+        self.map[ base: base + len( data ) - first ] = data[ first: ]
+        # Publish the data only once it has been written
+        struct.pack_into( '<Q', self.map, 16, head + len( data ) )
+
+    def read( self, start=0 ):
+        """Read the data written since start
+           start: stream offset, e.g. a previous head()
+           returns: data (bytes), offset of its first byte, new head;
+                    the offset is greater than start if data was
+                    overwritten before it was read"""
+        head = self.head()
+        start = max( start, head - self.size )
+        pos, base = start % self.size, self.headerSize
+        count = head - start
+        first = min( count, self.size - pos )
+        data = ( self.map[ base + pos: base + pos + first ] +
+                 self.map[ base: base + count - first ] )
+        # Anything overwritten while we were copying is unreliable
+        lost = self.head() - self.size - start
+        if lost > 0:
+            data, start = data[ lost: ], start + lost
+        return data, start, head
+
+    def recent( self ):
+        "Return our data as text, starting with the oldest complete line"
+        data, start, _head = self.read()
+        if start > 0:
+            # The oldest line has probably lost its beginning
+            data = data[ data.find( b'\n' ) + 1: ] if b'\n' in data else b''
+        return toText( data )
+
+    def close( self ):
+        "Unmap our file"
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+def toText( data ):
+    "Decode data, replacing any characters which have been cut in two"
+    return data.decode( Encoding, 'replace' ) if Python3 else data
+
+
+class RingReader( object ):
+    "Read new lines from a RingFile"
+
+    def __init__( self, ring, start=None ):
+        """ring: RingFile, or path of a ring file
+           start: stream offset to start at (default: oldest data)"""
+        self.ring = ring if isinstance( ring, RingFile ) else RingFile( ring )
+        self.pos = start or 0
+        self.partial = b''  # unterminated last line (None: skip it)
+        self.lost = 0  # bytes overwritten before we read them
+
+    def lines( self ):
+        "Return list of complete lines written since our last call"
+        if self.ring.head() == self.pos:
+            return []
+        data, start, head = self.ring.read( self.pos )
+        if start > self.pos:
+            self.lost += start - self.pos
+            self.partial = None
+        self.pos = head
+        if self.partial is None:
+            # Output was overwritten before we read it: skip to the
+            # next complete line
+            nl = data.find( b'\n' )
+            if nl < 0:
+                return []
+            data, self.partial = data[ nl + 1: ], b''
+        lines = ( self.partial + data ).split( b'\n' )
+        self.partial = lines.pop()
+        return [ toText( line ) for line in lines ]
+
+
+def ringOf( item ):
+    "Return the RingFile of a Job, RingFile or ring file path"
+    ring = getattr( item, 'ring', item )
+    if ring is None:
+        raise Exception( '%s is not capturing to a ring file' % item )
+    return ring if isinstance( ring, RingFile ) else RingFile( ring )
+
+
+def snapshot( items, lines=None ):
+    """Return the recent output of many jobs at once
+       items: Jobs started with ring=size, RingFiles or ring file paths
+       lines: number of lines to return for each (default: all)
+       returns: dict of item to list of complete lines"""
+    result = {}
+    for item in items:
+        capture.flush( item )
+        ring = ringOf( item )
+        text = ring.recent().split( '\n' )[ :-1 ]
+        if ring is not getattr( item, 'ring', item ):
+            ring.close()
+        result[ item ] = text[ -lines: ] if lines else text
+    return result
+
+
+def follow( items, seconds=None, interval=.1, start=None ):
+    """Yield new lines of output from many jobs as they arrive
+       items: Jobs started with ring=size, RingFiles or ring file paths
+       seconds: how long to follow them (default: indefinitely)
+       interval: seconds between checks for new output
+       start: 'end' to skip output written before we were called
+              (default: start with the oldest output in each ring)
+       yields: ( item, line ), or ( None, '' ) after each interval
+               without any new output, as for util.pmonitor()"""
+    readers = {}
+    for item in items:
+        ring = ringOf( item )
+        readers[ item ] = RingReader(
+            ring, ring.head() if start == 'end' else None )
+    end = None if seconds is None else now() + seconds
+    while end is None or now() < end:
+        idle = True
+        for item, reader in readers.items():
+            for line in reader.lines():
+                idle = False
+                yield item, line
+        if idle:
+            yield None, ''
+            sleep( interval )
+    for item, reader in readers.items():
+        if reader.ring is not getattr( item, 'ring', item ):
+            reader.ring.close()
+
+
+class Capture( object ):
+    """Copy the output of many pipes into RingFiles, using a single
+       background thread, which runs while there is anything to copy"""
+
+    def __init__( self ):
+        self.streams = {}  # fds to ( pipe, ring, lock )
+        self.reactor = None
+        self.thread = None
+        self.lock = threading.Lock()  # protects streams and thread
+
+    def add( self, pipe, ring ):
+        """Start copying pipe's output to ring
+           pipe: file object, e.g. Popen.stdout
+           ring: writable RingFile"""
+        with self.lock:
+            if self.reactor is None:
+                self.reactor = Reactor()
+            fd = self.reactor.register( pipe.fileno(), edge=True )
+            self.streams[ fd ] = ( pipe, ring, threading.Lock() )
+            if self.thread is None:
+                self.thread = threading.Thread( target=self.run,
+                                                name='capture' )
+                self.thread.daemon = True
+                self.thread.start()
+
+    def copy( self, fd, done=False ):
+        """Copy everything available from fd to its ring
+           done: stop copying from fd afterwards?"""
+        with self.lock:
+            stream = self.streams.get( fd )
+        if stream is None:
+            return
+        pipe, ring, lock = stream
+        with lock:
+            if pipe.closed:
+                return
+            data, eof = Reactor.readAvailable( fd )
+            ring.write( data )
+            if eof or done:
+                with self.lock:
+                    self.reactor.unregister( fd )
+                    del self.streams[ fd ]
+                pipe.close()
+
+    def flush( self, item, done=False ):
+        """Copy anything which is waiting in a job's pipe to its ring,
+           so that it can be read at once
+           item: Job, or anything else (which is ignored)
+           done: stop copying its output afterwards?"""
+        popen = getattr( item, 'popen', None )
+        if popen is not None and popen.stdout is not None:
+            try:
+                fd = popen.stdout.fileno()
+            except ValueError:
+                # already closed
+                return
+            self.copy( fd, done )
+
+    def run( self ):
+        "Copy output until we have no more pipes"
+        while True:
+            with self.lock:
+                if not self.streams:
+                    self.reactor.close()
+                    self.reactor, self.thread = None, None
+                    return
+                reactor = self.reactor
+            for fd, _events in reactor.poll( 100 ):
+                self.copy( fd )
+
+
+# Our capture thread, shared by all nodes
+capture = Capture()
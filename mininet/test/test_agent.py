@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test exec agents, which run commands in nodes for other programs."""
+
+import os
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from mininet.net import Mininet
+from mininet.node import Node
+from mininet.agent import AgentClient
+from mininet.log import setLogLevel
+
+
+class testAgent( unittest.TestCase ):
+    "Test running commands and reading files through an agent"
+
+    def setUp( self ):
+        self.node = Node( 'h1' )
+        self.path = '/tmp/mininet-test-%d.sock' % os.getpid()
+        self.job = self.node.startAgent( self.path )
+        self.client = AgentClient( self.path )
+
+    def tearDown( self ):
+        self.client.close()
+        self.node.terminate()
+
+    def testExec( self ):
+        "Commands run in our namespaces, with stdin, stdout and stderr"
+        self.assertEqual( self.client.ping(), self.job.pid )
+        self.assertEqual( self.client.run( 'readlink /proc/self/ns/net' ),
+                          ( self.node.netns + '\n', '', 0 ) )
+        self.assertEqual( self.client.run( 'echo out; echo err >&2; exit 3' ),
+                          ( 'out\n', 'err\n', 3 ) )
+        self.assertEqual( self.client.run( [ 'cat' ], stdin='in' ),
+                          ( 'in', '', 0 ) )
+        self.assertEqual( self.client.run( 'pwd', cwd='/' )[ 0 ], '/\n' )
+        self.assertEqual( self.client.run( 'sleep 10 & sleep 10',
+                                           timeout=.2 ), ( '', '', None ) )
+        self.assertRaises( Exception, self.client.run, [ '/nonexistent' ] )
+
+    def testRead( self ):
+        "Files can be read in whole or in part"
+        data = self.client.read( '/proc/self/mountinfo' )
+        self.assertTrue( len( data ) > 0 )
+        with open( __file__, 'rb' ) as f:
+            self.assertEqual( self.client.read( __file__, 2, 3 ),
+                              f.read()[ 2:5 ] )
+
+    def testConcurrent( self ):
+        "Many clients can run commands at once"
+        def run( i ):
+            "Run a command with a new client"
+            client = AgentClient( self.path )
+            try:
+                return client.run( 'sleep .2; echo %d' % i )[ 0 ]
+            finally:
+                client.close()
+        pool = ThreadPool( 10 )
+        try:
+            self.assertEqual( pool.map( run, range( 10 ) ),
+                              [ '%d\n' % i for i in range( 10 ) ] )
+        finally:
+            pool.close()
+
+    def testStop( self ):
+        "Agents and their sockets go away along with their nodes"
+        self.node.terminate()
+        self.assertIsNotNone( self.job.exitcode )
+        self.assertFalse( os.path.exists( self.path ) )
+
+
+class testAgents( unittest.TestCase ):
+    "Test starting agents for a whole network"
+
+    def testNet( self ):
+        "Each node gets an agent in the network's run directory"
+        net = Mininet( controller=None, agents=True )
+        for name in 'h1', 'h2':
+            net.addHost( name )
+        r1 = net.addHost( 'r1', inNamespace=False )
+        r2 = net.addHost( 'r2', inNamespace=False )
+        net.start()
+        runDir = net.runDir
+        try:
+            # Nodes in the root namespace share r1's agent
+            self.assertEqual( r2.agentPath, r1.agentPath )
+            self.assertIn( 'agent', r1.jobs )
+            self.assertNotIn( 'agent', r2.jobs )
+            self.assertEqual( len( os.listdir( runDir ) ), 3 )
+            client = AgentClient( r2.agentPath )
+            self.assertEqual( client.run( 'readlink /proc/self/ns/net' )[ 0 ],
+                              os.readlink( '/proc/self/ns/net' ) + '\n' )
+            client.close()
+            # Later root nodes join it too
+            r3 = net.addHost( 'r3', inNamespace=False )
+            net.startAgents( [ r3 ] )
+            self.assertEqual( r3.agentPath, r1.agentPath )
+            for host in net.get( 'h1', 'h2' ):
+                self.assertEqual( host.agentPath,
+                                  os.path.join( runDir, host.name + '.sock' ) )
+                client = AgentClient( host.agentPath )
+                self.assertEqual( client.run( 'readlink /proc/self/ns/net' ),
+                                  ( host.netns + '\n', '', 0 ) )
+                client.close()
+        finally:
+            net.stop()
+        self.assertFalse( os.path.exists( runDir ) )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
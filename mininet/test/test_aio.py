@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the asyncio API for nodes and networks."""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from mininet.net import Mininet
+from mininet.node import Node
+from mininet.log import setLogLevel
+
+
+class testAsyncio( unittest.TestCase ):
+    "Test Node.acmd(), Node.apopen() and Mininet.gatherCmd()"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+        for i in range( 1, 21 ):
+            self.net.addHost( 'h%d' % i )
+        self.net.start()
+
+    def tearDown( self ):
+        self.net.stop()
+
+    def testGather( self ):
+        "Commands on many nodes overlap"
+        start = time.time()
+        outputs = asyncio.run( self.net.gatherCmd( 'sleep .5; echo $$' ) )
+        self.assertLess( time.time() - start, 5 )
+        self.assertEqual( outputs, [ '%d\r\n' % host.pid
+                                     for host in self.net.hosts ] )
+        h1, h2 = self.net.hosts[ :2 ]
+        self.assertEqual( asyncio.run( self.net.gatherCmd(
+            'echo', '$$', nodes=[ h2, h1 ] ) ),
+            [ '%d\r\n' % h2.pid, '%d\r\n' % h1.pid ] )
+
+    def testTimeout( self ):
+        "Commands which time out are interrupted"
+        h1 = self.net.hosts[ 0 ]
+        with self.assertRaises( asyncio.TimeoutError ):
+            asyncio.run( h1.acmd( 'sleep 100', timeout=.2 ) )
+        self.assertFalse( h1.waiting )
+        self.assertEqual( h1.cmd( 'echo ok' ), 'ok\r\n' )
+
+    def testEscalate( self ):
+        "Commands which ignore SIGINT are stopped as cmd() stops them"
+        h1 = self.net.hosts[ 0 ]
+        with self.assertRaises( asyncio.TimeoutError ):
+            asyncio.run( h1.acmd( "bash -c 'trap \"\" INT; sleep 10'",
+                                  timeout=.2, channel=0 ) )
+        self.assertFalse( h1.waiting )
+        self.assertEqual( h1.cmd( 'echo ok' ), 'ok\r\n' )
+
+    def testIdle( self ):
+        "We are woken when a busy shell becomes idle"
+        h1 = self.net.hosts[ 0 ]
+        h1.sendCmd( 'sleep .3; echo sent' )
+        thread = threading.Thread( target=lambda: results.append(
+            h1.waitOutput() ) )
+        results = []
+        thread.start()
+        start = time.time()
+        self.assertEqual( asyncio.run( h1.acmd( 'echo async', channel=0,
+                                                timeout=5 ) ),
+                          'async\r\n' )
+        self.assertLess( time.time() - start, 2 )
+        thread.join()
+        self.assertEqual( results, [ 'sent\r\n' ] )
+
+    def testShells( self ):
+        "acmd() uses shells the way cmd() does, and takes their locks"
+        s1 = self.net.addSwitch( 's1', cls=Node, inNamespace=False )
+        shared = s1.sharedShell
+        self.assertEqual( asyncio.run( s1.acmd( 'echo $$' ) ),
+                          '%d\r\n' % shared.pid )
+        self.assertIs( s1.sharedShell, shared )
+        h1 = self.net.hosts[ 0 ]
+        # A cmd() from another thread holds our shell's lock...
+        thread = threading.Thread( target=lambda: results.append(
+            h1.cmd( 'sleep .3; echo thread' ) ) )
+        results = []
+        thread.start()
+        time.sleep( .1 )
+        # ...so we wait for it rather than interleaving with it
+        self.assertEqual( asyncio.run( h1.acmd( 'echo async',
+                                                channel=0 ) ),
+                          'async\r\n' )
+        thread.join()
+        self.assertEqual( results, [ 'thread\r\n' ] )
+        # Background commands leave their PID, not markers
+        self.assertEqual( asyncio.run( h1.acmd( 'sleep 10 &' ) ), '' )
+        self.assertIn( str( h1.lastPid ), h1.cmd( 'jobs -p' ) )
+
+    def testPopen( self ):
+        "apopen() runs processes in our namespace"
+        h1 = self.net.hosts[ 0 ]
+
+        async def netns():
+            proc = await h1.apopen( 'readlink /proc/self/ns/net' )
+            out, _err = await proc.communicate()
+            return out.decode()
+
+        self.assertEqual( asyncio.run( netns() ).strip(), h1.netns )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
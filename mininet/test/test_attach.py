@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test reattaching to a network started by another process."""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from subprocess import check_call
+from time import sleep
+
+from mininet.net import Mininet
+from mininet.clean import cleanup, procGone, procStat
+from mininet.log import setLogLevel
+
+
+# Start a network and exit without stopping it
+startScript = """
+from mininet.net import Mininet
+net = Mininet( controller=None, statefile=%r )
+h1, h2, h3 = [ net.addHost( h ) for h in ( 'h1', 'h2', 'h3' ) ]
+net.addLink( h1, h2 )
+net.addLink( h2, h3, intfName1='h2-right' )
+net.start()
+h1.cmd( 'ip link set lo down' )
+"""
+
+
+class testAttach( unittest.TestCase ):
+    "Test Mininet.attach()"
+
+    def setUp( self ):
+        fd, self.statefile = tempfile.mkstemp( suffix='.state' )
+        os.close( fd )
+
+    def tearDown( self ):
+        if os.path.exists( self.statefile ):
+            os.unlink( self.statefile )
+        cleanup()
+
+    def testAttach( self ):
+        "Attached network has the same nodes, links and namespaces"
+        check_call( [ sys.executable, '-c', startScript % self.statefile ] )
+        net = Mininet.attach( self.statefile )
+        h1, h2, h3 = net.get( 'h1', 'h2', 'h3' )
+        self.assertEqual( len( net.links ), 2 )
+        self.assertEqual( net.linksBetween( h2, h3 )[ 0 ].intf1.name,
+                          'h2-right' )
+        self.assertEqual( h1.IP(), '10.0.0.1' )
+        # Our new shells run in the old namespaces
+        self.assertIn( 'state DOWN', h1.cmd( 'ip link show lo' ) )
+        self.assertIn( 'h2-right', h2.cmd( 'ip link show' ) )
+        holder = h2.nsPid
+        net.stop()
+        self.assertFalse( os.path.exists( self.statefile ) )
+        # Namespace holders are killed, but aren't our children
+        for _ in range( 100 ):
+            if procGone( holder ):
+                break
+            sleep( .01 )
+        self.assertTrue( procGone( holder ) )
+
+    def setOwner( self, pid, start ):
+        "Rewrite the owner of the network in our state file"
+        with open( self.statefile ) as f:
+            state = json.load( f )
+        state.update( pid=pid, start=start )
+        with open( self.statefile, 'w' ) as f:
+            json.dump( state, f )
+
+    def testReusedPid( self ):
+        "A live process only owns the network if its start time matches"
+        check_call( [ sys.executable, '-c', startScript % self.statefile ] )
+        pid = os.getpid()
+        self.setOwner( pid, procStat( pid )[ 19 ] )
+        self.assertRaises( Exception, Mininet.attach, self.statefile )
+        # Same pid, but a different start time: the pid has been reused
+        self.setOwner( pid, '0' )
+        net = Mininet.attach( self.statefile )
+        self.assertEqual( len( net.hosts ), 3 )
+        net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test that a dual-stack network is usable as soon as it has started."""
+
+import sys
+import unittest
+from subprocess import PIPE
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from mininet.clean import cleanup
+
+# Accept one TCP connection on port 6633 and answer it
+server = """
+import socket, sys
+s = socket.socket( socket.AF_INET6 )
+s.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+s.bind( ( '::', 6633 ) )
+s.listen( 1 )
+print( 'ready' )
+sys.stdout.flush()
+s.settimeout( 10 )
+conn, _addr = s.accept()
+conn.sendall( b'hello' )
+conn.close()
+"""
+
+# Connect to a server and print what it says
+client = ( "import socket, sys; "
+           "s = socket.create_connection( ( sys.argv[ 1 ], 6633 ), 5 ); "
+           "print( s.recv( 5 ).decode() )" )
+
+
+class testDualStack( unittest.TestCase ):
+    "Test IPv6 addressing of hosts"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None, ip6Base='fc00::/64' )
+        self.h1, self.h2 = self.net.addHost( 'h1' ), self.net.addHost( 'h2' )
+        self.net.addLink( self.h1, self.h2 )
+        self.net.start()
+
+    def tearDown( self ):
+        self.net.stop()
+        if sys.exc_info() != ( None, None, None ):
+            cleanup()
+
+    def testAddresses( self ):
+        "Hosts have both addresses, and none of them are tentative"
+        for host, ip6 in ( self.h1, 'fc00::1' ), ( self.h2, 'fc00::2' ):
+            self.assertEqual( host.IP6(), ip6 )
+            self.assertEqual( host.IP6( update=True ), ip6 )
+            self.assertTrue( host.IP() )
+            addrs = host.cmd( 'ip -6 addr show dev', host.intf() )
+            self.assertIn( 'inet6 %s/64' % ip6, addrs )
+            self.assertIn( 'scope link', addrs )
+            self.assertNotIn( 'tentative', addrs )
+
+    def testConnect( self ):
+        "Hosts can talk to each other over IPv6 right after start()"
+        proc = self.h2.popen( [ sys.executable, '-c', server ],
+                              stdout=PIPE )
+        try:
+            self.assertEqual( proc.stdout.readline().strip(), b'ready' )
+            out = self.h1.cmd( sys.executable, '-c', "'%s'" % client,
+                               self.h2.IP6() )
+            self.assertEqual( out.strip(), 'hello' )
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
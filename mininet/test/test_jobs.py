@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test background jobs."""
+
+import os
+import unittest
+
+from mininet.node import Node
+from mininet.jobs import waitJobs, stopJobs
+from mininet.clean import procGone
+from mininet.journal import journal
+from mininet.log import setLogLevel
+
+
+class testJobs( unittest.TestCase ):
+    "Test Node.startJob() and the Job table"
+
+    def setUp( self ):
+        self.node = Node( 'h1' )
+
+    def tearDown( self ):
+        self.node.terminate()
+
+    def testExit( self ):
+        "Jobs run in our namespace, log their output and exit status"
+        job = self.node.startJob( 'readlink /proc/self/ns/net; exit 3' )
+        self.assertEqual( job.wait(), 3 )
+        self.assertEqual( job.output().strip(), self.node.netns )
+        self.assertEqual( self.node.jobs, { 'job1': job } )
+        self.assertNotIn( ( 'node', str( job.pid ) ), journal.outstanding )
+
+    def testStop( self ):
+        "Jobs are stopped with SIGTERM, then SIGKILL"
+        polite = self.node.startJob( [ 'sleep', 100 ], name='polite' )
+        stubborn = self.node.startJob( 'trap "" TERM; sleep 100 & wait' )
+        self.assertEqual( waitJobs( [ polite, stubborn ], timeout=.1 ),
+                          [ polite, stubborn ] )
+        self.assertEqual( stopJobs( [ polite, stubborn ], timeout=.5 ),
+                          [ stubborn ] )
+        self.assertEqual( polite.exitcode, -15 )
+        self.assertEqual( stubborn.exitcode, -9 )
+
+    def testCleanup( self ):
+        "Jobs and their logs are removed along with their node"
+        job = self.node.startJob( 'sleep 100 & sleep 100' )
+        self.node.terminate()
+        self.assertTrue( procGone( job.pid ) )
+        self.assertFalse( os.path.exists( job.log ) )
+        self.assertEqual( self.node.jobs, {} )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the resource journal and its replay by cleanup()."""
+
+import os
+import tempfile
+import unittest
+from subprocess import Popen
+
+from mininet.journal import Journal, procStat
+from mininet.net import Mininet
+from mininet.clean import cleanup
+from mininet.log import setLogLevel
+from mininet.util import quietRun
+
+
+class testJournal( unittest.TestCase ):
+    "Test journal records"
+
+    def setUp( self ):
+        fd, self.path = tempfile.mkstemp( suffix='.journal' )
+        os.close( fd )
+        self.journal = Journal( path=self.path )
+
+    def tearDown( self ):
+        self.journal.reset( unlink=True )
+
+    def testOutstanding( self ):
+        "Only resources which haven't been removed are outstanding"
+        self.journal.add( 'intf', 'r1-eth0' )
+        self.journal.add( 'node', 42, node='h1', netns=None )
+        self.journal.add( 'file', '/tmp/c0.log' )
+        self.journal.remove( 'intf', 'r1-eth0' )
+        self.journal.remove( 'intf', 'unknown' )
+        records = Journal.read( self.path )
+        self.assertEqual( [ ( r[ 'kind' ], r[ 'name' ] ) for r in records ],
+                          [ ( 'node', '42' ), ( 'file', '/tmp/c0.log' ) ] )
+        self.assertEqual( records[ 0 ][ 'node' ], 'h1' )
+
+    def testUnlink( self ):
+        "Journal is removed once everything has been released"
+        self.journal.add( 'cgroup', 'cpu:/h1' )
+        self.journal.remove( 'cgroup', 'cpu:/h1' )
+        self.assertFalse( os.path.exists( self.path ) )
+
+    def testPartialWrite( self ):
+        "A truncated last record is ignored"
+        self.journal.add( 'ovs', 's1' )
+        with open( self.path, 'a' ) as f:
+            f.write( '{"kind": "ovs", "na' )
+        self.assertEqual( len( Journal.read( self.path ) ), 1 )
+
+
+class testReplay( unittest.TestCase ):
+    "Test that cleanup() removes journaled resources"
+
+    def testReplay( self ):
+        "Replaying a journal kills orphaned nodes and root links"
+        net = Mininet( controller=None )
+        h1 = net.addHost( 'h1' )
+        r1 = net.addHost( 'r1', inNamespace=False )
+        r2 = net.addHost( 'r2', inNamespace=False )
+        net.addLink( h1, r1 )
+        net.addLink( r1, r2 )
+        net.start()
+        # r1 and r2 share a root namespace shell
+        self.assertIs( r1.sharedShell, r2.sharedShell )
+        shells = [ h1.shell, r1.sharedShell.shell ]
+        cleanup()
+        for shell in shells:
+            self.assertEqual( shell.wait(), -9 )
+        self.assertFalse( os.path.exists( '/sys/class/net/r1-eth1' ) )
+        self.assertEqual( Journal.paths(), [] )
+        # The shells are gone, so just release their ptys
+        for host in net.hosts:
+            host.cleanup()
+
+    def testLive( self ):
+        "Journals of running processes are left alone"
+        if not os.path.isdir( Journal.journalDir ):
+            os.makedirs( Journal.journalDir )
+        # pid 1 is running, but was started at a different time
+        live = os.path.join( Journal.journalDir,
+                             '1-%s.journal' % procStat( 1 )[ 19 ] )
+        stale = os.path.join( Journal.journalDir, '1-0.journal' )
+        for path in live, stale:
+            Journal( path=path ).add( 'file', path + '.log' )
+        try:
+            cleanup()
+            self.assertTrue( Journal.isLive( live ) )
+            self.assertFalse( Journal.isLive( stale ) )
+            self.assertEqual( Journal.paths(), [ live ] )
+        finally:
+            for path in live, stale:
+                if os.path.exists( path ):
+                    os.unlink( path )
+
+    def testSweep( self ):
+        "Sweeping leaves the resources of running networks alone"
+        # A node of another network, which is its own journal's owner
+        node = Popen( [ 'setsid', 'bash', '-c',
+                        'exec -a mininet:x9 sleep 3141' ] )
+        live = os.path.join( Journal.journalDir, '%d-%s.journal' % (
+            node.pid, procStat( node.pid )[ 19 ] ) )
+        liveJournal = Journal( path=live )
+        liveJournal.add( 'node', node.pid, node='x9', netns=None )
+        liveJournal.add( 'intf', 'x9-eth0' )
+        liveJournal.add( 'file', '/tmp/x9.log' )
+        for name in 'x9', 'y9':
+            quietRun( 'ip link add {0}-eth0 type veth peer name {0}-eth1'
+                      .format( name ) )
+        for path in '/tmp/x9.log', '/tmp/y9.log':
+            open( path, 'w' ).close()
+        try:
+            cleanup( sweep=True )
+            self.assertIsNone( node.poll() )
+            self.assertEqual( Journal.paths(), [ live ] )
+            for intf in 'x9-eth0', 'x9-eth1':
+                self.assertTrue( os.path.exists( '/sys/class/net/' + intf ) )
+            self.assertFalse( os.path.exists( '/sys/class/net/y9-eth0' ) )
+            self.assertTrue( os.path.exists( '/tmp/x9.log' ) )
+            self.assertFalse( os.path.exists( '/tmp/y9.log' ) )
+        finally:
+            node.kill()
+            node.wait()
+            liveJournal.reset( unlink=True )
+            for intf in 'x9-eth0', 'y9-eth0':
+                quietRun( 'ip link del ' + intf )
+            for path in '/tmp/x9.log', '/tmp/y9.log':
+                if os.path.exists( path ):
+                    os.unlink( path )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
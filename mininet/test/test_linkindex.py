@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test port allocation and link lookup indexes in Node and Mininet."""
+
+import unittest
+
+from mininet.net import Mininet
+from mininet.log import setLogLevel
+from mininet.clean import cleanup
+
+
+class testLinkIndex( unittest.TestCase ):
+    "Verify that link indexes track topology changes"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+        self.h1, self.h2, self.h3 = [ self.net.addHost( h )
+                                      for h in ( 'h1', 'h2', 'h3' ) ]
+
+    def tearDown( self ):
+        self.net.stop()
+
+    def testNewPort( self ):
+        "Port numbers count up and are not reused"
+        self.net.addLink( self.h1, self.h2 )
+        self.net.addLink( self.h1, self.h3, port1=5 )
+        self.assertEqual( self.h1.newPort(), 6 )
+        self.net.delLinkBetween( self.h1, self.h3 )
+        self.assertEqual( self.h1.newPort(), 6 )
+
+    def testLinksBetween( self ):
+        "linksBetween() and connectionsTo() follow addLink/delLink"
+        link1 = self.net.addLink( self.h1, self.h2 )
+        link2 = self.net.addLink( self.h2, self.h1 )
+        self.net.addLink( self.h2, self.h3 )
+        self.assertEqual( self.net.linksBetween( self.h1, self.h2 ),
+                          [ link1, link2 ] )
+        self.assertEqual( self.net.linksBetween( self.h2, self.h1 ),
+                          [ link1, link2 ] )
+        self.assertEqual( self.h1.connectionsTo( self.h2 ),
+                          [ ( link1.intf1, link1.intf2 ),
+                            ( link2.intf2, link2.intf1 ) ] )
+        self.net.delLinkBetween( self.h1, self.h2 )
+        self.assertEqual( self.net.linksBetween( self.h1, self.h2 ),
+                          [ link2 ] )
+        self.assertEqual( self.h2.connectionsTo( self.h1 ),
+                          [ ( link2.intf1, link2.intf2 ) ] )
+        self.net.delLinkBetween( self.h1, self.h2, allLinks=True )
+        self.assertEqual( self.net.linksBetween( self.h1, self.h2 ), [] )
+        self.assertEqual( self.h1.connectionsTo( self.h2 ), [] )
+
+    def testDelNode( self ):
+        "Deleting a node drops its links from the index"
+        self.net.addLink( self.h1, self.h3 )
+        self.net.delHost( self.h3 )
+        self.assertNotIn( 'h3', self.net )
+        self.assertEqual( self.net.linksBetween( self.h1, self.h3 ), [] )
+        self.assertEqual( self.h1.connectionsTo( self.h3 ), [] )
+
+    def testMove( self ):
+        "linksBetween() follows intfs which move to other nodes"
+        link = self.net.addLink( self.h1, self.h2 )
+        intf = link.intf2
+        self.h2.delIntf( intf )
+        intf.node = self.h3
+        self.h3.addIntf( intf, moveIntfFn=lambda *_args: None )
+        self.assertEqual( self.net.linksBetween( self.h1, self.h2 ), [] )
+        self.assertEqual( self.net.linksBetween( self.h3, self.h1 ),
+                          [ link ] )
+        self.net.delLinkBetween( self.h1, self.h3 )
+        self.assertEqual( list( self.net.links ), [] )
+
+    def testMembership( self ):
+        "Nodes and links are plain lists, kept in order"
+        link1 = self.net.addLink( self.h1, self.h2 )
+        link2 = self.net.addLink( self.h2, self.h3 )
+        self.assertIs( type( self.net.hosts ), list )
+        self.assertIs( type( self.net.links ), list )
+        self.assertEqual( self.net.hosts, [ self.h1, self.h2, self.h3 ] )
+        self.net.delHost( self.h2 )
+        self.assertEqual( self.net.hosts, [ self.h1, self.h3 ] )
+        self.net.delLink( link1 )
+        self.assertEqual( self.net.links, [ link2 ] )
+        self.assertEqual( self.net.linkSet, { link2 } )
+        self.assertRaises( ValueError, self.net.delLink, link1 )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
+    cleanup()
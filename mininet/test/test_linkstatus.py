@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test Mininet.linkStatus() and Intf/Link status."""
+
+import time
+import unittest
+
+from mininet.net import Mininet
+from mininet.node import Node
+from mininet.log import setLogLevel
+
+
+class testLinkStatus( unittest.TestCase ):
+    "Test reading the state of many links at once"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+        self.h1, self.h2 = self.net.addHost( 'h1' ), self.net.addHost( 'h2' )
+        self.net.build()
+
+    def tearDown( self ):
+        self.net.stop()
+
+    def testStatus( self ):
+        "linkStatus() reports state and counters for both ends"
+        link = self.net.addLink( self.h1, self.h2 )
+        link.intf1.config( ip='10.1.0.1/24' )
+        link.intf2.config( ip='10.1.0.2/24' )
+        self.h2.cmd( 'ip link set', link.intf2, 'mtu 1400' )
+        self.h1.cmd( 'echo hi > /dev/udp/10.1.0.2/9' )
+        states = self.net.linkStatus( [ link ] )
+        state1, state2 = states[ link ]
+        self.assertEqual( ( state1.operstate, state1.carrier, state1.mtu ),
+                          ( 'UP', True, 1500 ) )
+        self.assertEqual( state2.mtu, 1400 )
+        self.assertTrue( state1.txPackets > 0 )
+        self.assertEqual( link.status( states[ link ] ), '(OK OK)' )
+        self.assertEqual( link.intf2.state()[ :3 ], state2[ :3 ] )
+        link.intf2.delete()
+        self.assertEqual( self.net.linkStatus( [ link ] )[ link ][ 1 ],
+                          None )
+        self.assertEqual( link.status(), '(MISSING MISSING)' )
+
+    def testManyLinks( self ):
+        "Links between root namespace nodes need only one dump"
+        s1 = self.net.addSwitch( 's1', cls=Node, inNamespace=False )
+        s2 = self.net.addSwitch( 's2', cls=Node, inNamespace=False )
+        links = [ self.net.addLink( s1, s2 ) for _ in range( 200 ) ]
+        links.append( self.net.addLink( self.h1, s1 ) )
+        start = time.time()
+        states = self.net.linkStatus()
+        self.assertTrue( time.time() - start < 1 )
+        self.assertEqual( set( states ), set( self.net.links ) )
+        for link in links:
+            self.assertTrue( all( states[ link ] ) )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
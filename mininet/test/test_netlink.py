@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test LinkMonitor, which follows interface changes using netlink."""
+
+import time
+import unittest
+
+from mininet.net import Mininet
+from mininet.netlink import parseLinkMessages, dumpRequest
+from mininet.log import setLogLevel
+
+
+class testLinkMonitor( unittest.TestCase ):
+    "Test waiting for and reporting interface changes"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+        self.h1, self.h2 = self.net.addHost( 'h1' ), self.net.addHost( 'h2' )
+        self.link = self.net.addLink( self.h1, self.h2 )
+        self.net.build()
+        self.monitor = self.net.monitorLinks()
+
+    def tearDown( self ):
+        self.net.stop()
+        self.assertIsNone( self.net.linkMonitor )
+
+    def testState( self ):
+        "Initial states match linkStatus()"
+        state1, state2 = self.net.linkStatus()[ self.link ]
+        self.assertEqual( self.monitor.state( self.link.intf1 )[ :3 ],
+                          state1[ :3 ] )
+        self.assertEqual( self.monitor.state( self.link.intf2 )[ :3 ],
+                          state2[ :3 ] )
+        self.assertEqual( self.monitor.state( self.link.intf1 ).operstate,
+                          'UP' )
+        self.assertEqual( parseLinkMessages( dumpRequest ), ( [], False ) )
+
+    def testWait( self ):
+        "Waits and callbacks follow changes as they happen"
+        events = []
+        self.monitor.addCallback(
+            lambda node, name, state: events.append(
+                ( node, name, state and state.operstate ) ) )
+        intf1, intf2 = self.link.intf1, self.link.intf2
+        self.h2.cmd( 'ip link set', intf2, 'down' )
+        start = time.time()
+        self.assertTrue( self.monitor.waitFor( intf2, 'DOWN', timeout=5 ) )
+        self.assertTrue( time.time() - start < .5 )
+        # The kernel may delay carrier changes by up to a second
+        self.assertTrue( self.monitor.waitFor( intf1, 'DOWN', timeout=5 ) )
+        self.assertIn( ( self.h1, 'h1-eth0', 'DOWN' ), events )
+        self.assertIn( ( self.h2, 'h2-eth0', 'DOWN' ), events )
+        self.assertFalse( self.monitor.waitFor( intf1, 'UP', timeout=.1 ) )
+        self.h2.cmd( 'ip link set', intf2, 'up' )
+        self.assertTrue( self.monitor.waitFor( intf1, 'UP', timeout=5 ) )
+        intf1.delete()
+        self.assertTrue( self.monitor.waitFor( intf2, None, timeout=5 ) )
+        self.assertIsNone( self.monitor.state( intf2 ) )
+
+    def testRemove( self ):
+        "Deleted nodes are no longer monitored"
+        self.net.delHost( self.h2 )
+        self.assertEqual( len( self.monitor.sockets ), 1 )
+        self.assertIsNone( self.monitor.state( self.link.intf2 ) )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
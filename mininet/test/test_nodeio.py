@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test reading command output from Node shells."""
+
+import os
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from mininet.node import Node
+from mininet.log import setLogLevel
+
+
+class testNodeIO( unittest.TestCase ):
+    "Test Node.cmd(), monitor() and readline()"
+
+    def setUp( self ):
+        self.node = Node( 'h1' )
+
+    def tearDown( self ):
+        self.node.terminate()
+
+    def testLargeOutput( self ):
+        "Large outputs are returned intact"
+        out = self.node.cmd( 'seq 200000' )
+        lines = out.split( '\r\n' )
+        self.assertEqual( len( lines ), 200001 )
+        self.assertEqual( lines[ -2 ], '200000' )
+
+    def testSmallReads( self ):
+        "Markers and multibyte characters may be split across reads"
+        self.node.readSize = 3
+        self.assertEqual( self.node.cmd( 'echo héllo wörld' ),
+                          'héllo wörld\r\n' )
+        self.node.cmd( 'sleep 10 &' )
+        self.assertTrue( self.node.lastPid > 0 )
+        self.assertIn( str( self.node.lastPid ),
+                       self.node.cmd( 'jobs -p' ) )
+
+    def testReadline( self ):
+        "readline() returns complete lines"
+        self.node.sendCmd( 'echo one; echo two' )
+        self.node.waitReadable()
+        lines = []
+        while len( lines ) < 2:
+            line = self.node.readline()
+            if line is not None:
+                lines.append( line )
+        self.assertEqual( lines, [ 'one\r', 'two\r' ] )
+        self.assertEqual( self.node.waitOutput(), '' )
+
+    def testRun( self ):
+        "run() separates stdout and stderr and returns the exit status"
+        self.assertEqual( self.node.run( 'echo out; echo err >&2; false' ),
+                          ( 'out\n', 'err\n', 1 ) )
+        self.assertEqual( self.node.run( [ 'exit_() { return 7; }; exit_' ] ),
+                          ( '', '', 7 ) )
+        self.assertEqual( self.node.run( 'echo err >&2', stderr=False ),
+                          ( 'err\n', '', 0 ) )
+        self.assertEqual( self.node.run( 'sleep 10 &' ), ( '', '', 0 ) )
+        # Comments, newlines, trailing semicolons and NULs are all fine
+        self.assertEqual( self.node.run( 'echo a # comment' ),
+                          ( 'a\n', '', 0 ) )
+        self.assertEqual( self.node.run( 'echo a;\necho b;' ),
+                          ( 'a\nb\n', '', 0 ) )
+        self.assertEqual( self.node.run( r"printf 'x\0y' >&2" ),
+                          ( '', 'x\0y', 0 ) )
+        self.assertIn( str( self.node.lastPid ),
+                       self.node.cmd( 'jobs -p' ) )
+
+    def testCmds( self ):
+        "cmds() and submit() return results in order"
+        cmds = [ 'echo %d; echo e%d >&2; (exit %d)' % ( i, i, i % 3 )
+                 for i in range( 300 ) ]
+        results = self.node.cmds( cmds )
+        self.assertEqual( results, [ ( '%d\n' % i, 'e%d\n' % i, i % 3 )
+                                     for i in range( 300 ) ] )
+        self.node.submit( 'echo one' )
+        self.node.submit( [ 'seq', 3 ] )
+        self.node.submit( 'echo two >&2', stderr=False )
+        self.assertEqual( self.node.collect(),
+                          [ ( 'one\n', '', 0 ), ( '1\n2\n3\n', '', 0 ),
+                            ( 'two\n', '', 0 ) ] )
+        self.assertEqual( self.node.cmd( 'echo done' ), 'done\r\n' )
+
+    def testStdin( self ):
+        "Queued commands aren't read by the commands before them"
+        results = self.node.cmds( [ 'echo 1', 'cat', 'read x; echo $?',
+                                    'head -c 10', 'echo 2' ] )
+        self.assertEqual( results, [ ( '1\n', '', 0 ), ( '', '', 0 ),
+                                     ( '1\n', '', 0 ), ( '', '', 0 ),
+                                     ( '2\n', '', 0 ) ] )
+        self.node.submit( 'cat' )
+        self.node.submit( 'echo 3' )
+        self.assertEqual( self.node.collect(),
+                          [ ( '', '', 0 ), ( '3\n', '', 0 ) ] )
+
+    def testChannels( self ):
+        "Commands use an auxiliary shell while our own shell is busy"
+        self.node.cmd( 'export MARK=1' )
+        self.node.sendCmd( 'read line; echo got $line' )
+        # Auxiliary shells share our namespaces, but not our variables
+        self.assertEqual( self.node.cmd( 'readlink /proc/self/ns/net' ),
+                          os.readlink( '/proc/%d/ns/net' % self.node.pid ) +
+                          '\r\n' )
+        self.assertEqual( self.node.run( 'echo $MARK' ), ( '\n', '', 0 ) )
+        self.assertEqual( len( self.node.channels ), 1 )
+        channel = self.node.channels[ 0 ]
+        channel.sendCmd( 'sleep 10' )
+        self.assertEqual( self.node.cmd( 'echo hi' ), 'hi\r\n' )
+        self.assertEqual( len( self.node.channels ), 2 )
+        self.node.write( 'x\n' )
+        self.assertEqual( self.node.waitOutput(), 'got x\r\n' )
+        self.assertEqual( self.node.cmd( 'echo $MARK', channel=0 ),
+                          '1\r\n' )
+        shells = [ c.shell for c in self.node.channels ]
+        self.node.terminate()
+        self.assertEqual( self.node.channels, [] )
+        for shell in shells:
+            self.assertIsNotNone( shell.poll() )
+
+    def testNoChannels( self ):
+        "Without channels, commands from other threads queue up"
+        class Unchanneled( Node ):
+            "Node without channels, like CPULimitedHost"
+            maxChannels = 0
+        node = Unchanneled( 'h2' )
+        try:
+            pool = ThreadPool( 4 )
+            outs = pool.map( lambda i: node.cmd( 'sleep .1; echo', i ),
+                             range( 4 ) )
+            pool.close()
+            self.assertEqual( outs, [ '%d\r\n' % i for i in range( 4 ) ] )
+            self.assertEqual( node.channels, [] )
+            self.assertRaises( Exception, node.cmd, 'true', channel=1 )
+        finally:
+            node.terminate()
+
+    def testPopen( self ):
+        "popen() starts processes in our namespaces without mnexec"
+        netns = os.readlink( '/proc/self/ns/net' )
+        popen = self.node.popen( [ 'cat', '/proc/self/stat' ] )
+        # We run in our own session, like mnexec -d
+        self.assertEqual( int( popen.communicate()[ 0 ].split()[ 5 ] ),
+                          popen.pid )
+        out, _err, code = self.node.pexec( 'readlink /proc/self/ns/net' )
+        self.assertEqual( ( out.strip(), code ), ( self.node.netns, 0 ) )
+        self.assertEqual( self.node.pexec( 'pwd' )[ 0 ].strip(),
+                          os.getcwd() )
+        # Failures, e.g. a missing cwd, don't leave us in the namespace
+        self.assertRaises( OSError, self.node.popen, 'true',
+                           cwd='/nonexistent' )
+        # The spawner's thread has left our namespace
+        for tid in os.listdir( '/proc/self/task' ):
+            self.assertEqual( os.readlink( '/proc/self/task/%s/ns/net' %
+                                           tid ), netns )
+
+
+class testSharedShell( unittest.TestCase ):
+    "Test the shell shared by root namespace nodes"
+
+    def testShare( self ):
+        "Root namespace nodes share a shell until they need their own"
+        s1, s2 = Node( 's1', inNamespace=False ), Node( 's2',
+                                                        inNamespace=False )
+        shared = s1.sharedShell
+        self.assertIs( shared, s2.sharedShell )
+        self.assertEqual( ( s1.shell, s1.pid ), ( None, shared.pid ) )
+        self.assertEqual( s1.cmd( 'echo $$' ), '%d\r\n' % shared.pid )
+        self.assertEqual( s2.run( 'echo hi' ), ( 'hi\n', '', 0 ) )
+        # Commands can't change shared state for other nodes...
+        cwd = os.getcwd() + '\r\n'
+        self.assertEqual( s1.cmd( 'eval cd /; pwd # comment' ), '/\r\n' )
+        self.assertEqual( s2.cmd( 'pwd' ), cwd )
+        self.assertIs( s1.sharedShell, shared )
+        # ...and those which change our own state get our own shell
+        s1.cmd( 'cd /; export MARK=1' )
+        self.assertIsNone( s1.sharedShell )
+        self.assertEqual( s1.cmd( 'pwd; echo $MARK' ), '/\r\n1\r\n' )
+        self.assertEqual( s2.cmd( 'pwd; echo $MARK' ), cwd + '\r\n' )
+        # Background commands (and their job specs) need our own shell
+        s2.cmd( 'sleep 10 &' )
+        self.assertIsNone( s2.sharedShell )
+        self.assertNotEqual( s2.pid, shared.pid )
+        self.assertEqual( s2.cmd( 'kill %sleep' ), '' )
+        s1.terminate()
+        s2.terminate()
+        self.assertIsNone( Node.rootShell )
+        self.assertIsNone( shared.shell )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test NamespaceHost, which has no shell."""
+
+import os
+import time
+import unittest
+
+from mininet.net import Mininet
+from mininet.nodelib import NamespaceHost
+from mininet.log import setLogLevel
+
+
+def readStat( pid ):
+    "Return the state of process pid, or None if it has gone"
+    try:
+        with open( '/proc/%d/stat' % pid ) as f:
+            return f.read().rsplit( ')', 1 )[ 1 ].split()[ 0 ]
+    except IOError:
+        return None
+
+
+class testNamespaceHost( unittest.TestCase ):
+    "Test running commands on a NamespaceHost"
+
+    def setUp( self ):
+        self.host = NamespaceHost( 'h1' )
+
+    def tearDown( self ):
+        self.host.terminate()
+
+    def testCmd( self ):
+        "Commands run in our namespaces, with output as for cmd()"
+        self.assertEqual( self.host.cmd( 'readlink /proc/self/ns/net' ),
+                          self.host.netns + '\n' )
+        self.assertNotEqual( self.host.netns,
+                             os.readlink( '/proc/self/ns/net' ) )
+        self.assertEqual( self.host.cmd( 'echo out; echo err >&2' ),
+                          'out\nerr\n' )
+        self.assertFalse( self.host.waiting )
+        self.host.cmd( 'sleep 10 &' )
+        pid = self.host.lastPid
+        self.assertTrue( pid > 0 )
+        self.assertEqual( self.host.cmd( 'ps -o pid=', pid ).strip(),
+                          str( pid ) )
+
+    def testInteractive( self ):
+        "sendCmd(), write() and sendInt() work without a shell"
+        self.host.sendCmd( 'read line; echo got $line' )
+        self.host.write( 'x\n' )
+        self.assertEqual( self.host.waitOutput(), 'got x\n' )
+        self.host.sendCmd( 'sleep 10' )
+        self.host.sendInt()
+        self.host.waitOutput()
+        self.assertEqual( self.host.cmd( 'echo ok' ), 'ok\n' )
+
+    def testRun( self ):
+        "run(), cmds() and submit() return output and exit status"
+        self.assertEqual( self.host.run( 'echo out; echo err >&2; false' ),
+                          ( 'out\n', 'err\n', 1 ) )
+        self.assertEqual( self.host.cmds( [ 'echo 1', [ 'exit', 2 ] ] ),
+                          [ ( '1\n', '', 0 ), ( '', '', 2 ) ] )
+        self.host.submit( 'echo err >&2', stderr=False )
+        self.assertEqual( self.host.collect(), [ ( 'err\n', '', 0 ) ] )
+
+    def testTerminate( self ):
+        "terminate() stops background commands and our namespace holder"
+        self.host.cmd( 'sleep 100 &' )
+        pid, holder = self.host.lastPid, self.host.pid
+        self.host.terminate()
+        # pid may take a moment to exit, and linger as a zombie,
+        # since it isn't our child
+        for _ in range( 100 ):
+            if readStat( pid ) in ( None, 'Z' ):
+                break
+            time.sleep( .01 )
+        self.assertIn( readStat( pid ), ( None, 'Z' ) )
+        self.assertIsNone( readStat( holder ) )
+
+
+class CountingHost( NamespaceHost ):
+    "A NamespaceHost which records the commands it spawns"
+
+    def __init__( self, name, **params ):
+        self.spawned = []
+        NamespaceHost.__init__( self, name, **params )
+
+    def popen( self, *args, **kwargs ):
+        "Record and spawn a command"
+        self.spawned.append( args[ 0 ] )
+        return NamespaceHost.popen( self, *args, **kwargs )
+
+
+class testNamespaceHostNet( unittest.TestCase ):
+    "Test a network of NamespaceHosts"
+
+    def testConfig( self ):
+        "Hosts are configured without bash, with one ip -batch each"
+        net = Mininet( host=CountingHost, controller=None )
+        h1 = net.addHost( 'h1' )
+        h2 = net.addHost( 'h2', defaultRoute='h2-eth0' )
+        net.addLink( h1, h2 )
+        net.build()
+        try:
+            for host in h1, h2:
+                self.assertNotIn( 'bash', [ cmd[ 0 ] for cmd in
+                                            host.spawned ] )
+                self.assertEqual( host.spawned.count(
+                    [ 'ip', '-force', '-batch', '-' ] ), 1 )
+            self.assertIn( 'default dev h2-eth0', h2.cmd( 'ip route' ) )
+            self.assertEqual( h1.IP( update=True ), '10.0.0.1' )
+            # Commands with shell syntax still need bash
+            self.assertEqual( h1.cmd( 'ip link show lo | grep -c LOOPBACK' ),
+                              '1\n' )
+            self.assertEqual( h1.spawned[ -1 ][ 0 ], 'bash' )
+        finally:
+            net.stop()
+
+    def testNet( self ):
+        "Hosts are configured and linked like other hosts"
+        net = Mininet( host=NamespaceHost, controller=None )
+        h1, h2 = net.addHost( 'h1' ), net.addHost( 'h2' )
+        net.addLink( h1, h2 )
+        net.build()
+        try:
+            for host in net.hosts:
+                self.assertIn( host.IP(),
+                               host.cmd( 'ip -4 addr show', host.intf() ) )
+                self.assertEqual( host.shell.args[ -1 ],
+                                  'exec -a mininet:%s sleep infinity' %
+                                  host.name )
+        finally:
+            net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -4,11 +4,15 @@
 Regression test for pty leak in Node()
 """
 
+import os
 import unittest
 
 from mininet.net import Mininet
+from mininet.node import Node
 from mininet.clean import cleanup
 from mininet.topo import SingleSwitchTopo
+from mininet.leaks import LeakTracker
+from mininet.util import quietRun
 
 class TestPtyLeak( unittest.TestCase ):
     "Verify that there is no pty leakage"
@@ -26,6 +30,60 @@ def testPtyLeak():
             assert ( host.slave, host.master ) == oldptys
         net.stop()
 
+    def testCycles( self ):
+        "Repeatedly building and stopping a network leaks nothing"
+        def cycle( fast ):
+            "Build, start and stop a network"
+            net = Mininet( controller=None, fastStop=fast )
+            h1, h2 = net.addHost( 'h1' ), net.addHost( 'h2' )
+            r1 = net.addHost( 'r1', inNamespace=False )
+            r2 = net.addHost( 'r2', inNamespace=False )
+            net.addLink( h1, h2 )
+            net.addLink( h1, r1 )
+            net.addLink( r1, r2 )
+            net.start()
+            net.stop()
+            return net
+        # Warm up (e.g. lazily imported modules and cached state)
+        cycle( fast=False )
+        tracker = LeakTracker()
+        for fast in ( False, True ) * 5:
+            net = cycle( fast )
+        self.assertEqual( tracker.leaks( net ), [], tracker.report( net ) )
+        self.assertEqual( Node.outToNode, {} )
+
+    def testSurvivor( self ):
+        "Fast stop deletes links whose namespaces outlive their nodes"
+        net = Mininet( controller=None, fastStop=True )
+        h1 = net.addHost( 'h1' )
+        r1 = net.addHost( 'r1', inNamespace=False )
+        link = net.addLink( h1, r1 )
+        net.start()
+        # This keeps h1's namespace, and our link, alive
+        h1.cmd( 'setsid sleep 3141 &' )
+        try:
+            net.stop()
+            self.assertFalse( os.path.exists( '/sys/class/net/' +
+                                              link.intf2.name ) )
+        finally:
+            quietRun( [ 'pkill', '-f', '^sleep 3141$' ] )
+
+    def testOtherNets( self ):
+        "Processes of other Mininet instances aren't our leaks"
+        tracker = LeakTracker()
+        net = Mininet( controller=None )
+        net.addHost( 'h1' )
+        net.start()
+        # A namespace holder which belongs to nobody we know of
+        quietRun( [ 'bash', '-c', '( exec -a mininet:other sleep 2718'
+                    ' </dev/null >/dev/null 2>&1 & )' ] )
+        try:
+            net.stop()
+            self.assertEqual( tracker.leaks( net ), [],
+                              tracker.report( net ) )
+        finally:
+            quietRun( [ 'pkill', '-f', '^mininet:other 2718$' ] )
+
 
 if __name__ == '__main__':
     unittest.main()
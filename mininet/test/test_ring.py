@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test capturing output to ring files."""
+
+import os
+import tempfile
+import unittest
+
+from mininet.node import Node
+from mininet.ring import RingFile, RingReader, snapshot, follow, capture
+from mininet.log import setLogLevel
+
+
+class testRingFile( unittest.TestCase ):
+    "Test RingFile and RingReader"
+
+    def setUp( self ):
+        fd, self.path = tempfile.mkstemp( suffix='.ring' )
+        os.close( fd )
+        self.ring = RingFile( self.path, 16 )
+
+    def tearDown( self ):
+        self.ring.close()
+        os.unlink( self.path )
+
+    def testWrap( self ):
+        "Rings hold the most recent size bytes, from any reader"
+        self.ring.write( b'0123456789' )
+        self.assertEqual( self.ring.read(), ( b'0123456789', 0, 10 ) )
+        self.ring.write( b'abcdefghij' )
+        self.assertEqual( self.ring.read( 8 ), ( b'89abcdefghij', 8, 20 ) )
+        self.assertEqual( self.ring.read(), ( b'456789abcdefghij', 4, 20 ) )
+        self.ring.write( b'x' * 40 + b'yz' )
+        reader = RingFile( self.path )
+        self.assertEqual( reader.read(), ( b'x' * 14 + b'yz', 46, 62 ) )
+        reader.close()
+        self.assertRaises( Exception, RingFile, __file__ )
+
+    def testReader( self ):
+        "Readers return complete lines, skipping any they have missed"
+        reader = RingReader( self.path )
+        self.ring.write( b'one\ntw' )
+        self.assertEqual( reader.lines(), [ 'one' ] )
+        self.ring.write( b'o\n' )
+        self.assertEqual( reader.lines(), [ 'two' ] )
+        self.assertEqual( reader.lines(), [] )
+        self.ring.write( b'three\nfour\nfive\nsix\n' )
+        self.assertEqual( reader.lines(), [ 'four', 'five', 'six' ] )
+        self.assertEqual( reader.lost, 4 )
+        self.assertEqual( self.ring.recent(), 'four\nfive\nsix\n' )
+        reader.ring.close()
+
+
+class testRingJobs( unittest.TestCase ):
+    "Test jobs which capture their output in ring files"
+
+    def setUp( self ):
+        self.node = Node( 'h1' )
+
+    def tearDown( self ):
+        self.node.terminate()
+
+    def testOutput( self ):
+        "Ring jobs keep their most recent output"
+        job = self.node.startJob( 'seq 10000; echo err >&2', ring=4096 )
+        self.assertEqual( job.wait(), 0 )
+        self.assertTrue( job.log.endswith( '.ring' ) )
+        out = job.output()
+        self.assertTrue( len( out ) <= 4096 )
+        self.assertTrue( out.endswith( '9999\n10000\nerr\n' ) )
+        self.assertEqual( snapshot( [ job ], lines=2 ),
+                          { job: [ '10000', 'err' ] } )
+        self.node.terminate()
+        self.assertFalse( os.path.exists( job.log ) )
+        self.assertEqual( capture.streams, {} )
+
+    def testFollow( self ):
+        "follow() returns new lines from many jobs"
+        jobs = [ self.node.startJob( 'for i in 1 2 3; do echo %d$i; '
+                                     'sleep .1; done' % j, ring=1024 )
+                 for j in range( 2 ) ]
+        lines = {}
+        for job, line in follow( jobs, seconds=1, interval=.05 ):
+            if job:
+                lines.setdefault( job, [] ).append( line )
+        self.assertEqual( lines, { jobs[ 0 ]: [ '01', '02', '03' ],
+                                   jobs[ 1 ]: [ '11', '12', '13' ] } )
+        # Other processes can read ring files by path
+        self.assertEqual( snapshot( [ jobs[ 1 ].log ] ),
+                          { jobs[ 1 ].log: [ '11', '12', '13' ] } )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test TCIntf configuration with tc -batch."""
+
+import unittest
+
+from mininet.net import Mininet
+from mininet.node import Node
+from mininet.link import TCLink, TCIntf, TCBatch
+from mininet.topo import Topo
+from mininet.log import setLogLevel
+
+
+class testTCBatch( unittest.TestCase ):
+    "Test batched tc configuration of links"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+        self.h1, self.h2 = self.net.addHost( 'h1' ), self.net.addHost( 'h2' )
+
+    def tearDown( self ):
+        self.net.stop()
+
+    def qdiscs( self, intf ):
+        "Return the qdisc kinds of intf"
+        out = intf.node.cmd( 'tc qdisc show dev', intf )
+        return [ line.split()[ 1 ] for line in out.splitlines() ]
+
+    def testConfig( self ):
+        "Links are configured immediately, and can be reconfigured"
+        link = self.net.addLink( self.h1, self.h2, cls=TCLink, bw=10 )
+        intf = link.intf1
+        self.assertEqual( self.qdiscs( intf ), [ 'htb' ] )
+        result = intf.config( bw=5, use_tbf=True )
+        self.assertEqual( result[ 'tcoutputs' ], [ '', '' ] )
+        self.assertEqual( self.qdiscs( intf ), [ 'tbf' ] )
+        self.assertIn( 'rate 5Mbit', self.h1.cmd( 'tc qdisc show dev', intf ) )
+        # Same kind of root qdisc, so its classes must be replaced too
+        result = intf.config( bw=20 )
+        self.assertEqual( result[ 'tcoutputs' ], [ '', '', '' ] )
+        self.assertEqual( self.qdiscs( intf ), [ 'htb' ] )
+        result = intf.config( bw=30 )
+        self.assertEqual( result[ 'tcoutputs' ], [ '', '', '' ] )
+        self.assertIn( 'rate 30Mbit',
+                       self.h1.cmd( 'tc class show dev', intf ) )
+
+    def testBadParams( self ):
+        "Rejected parameters are logged and ignored, as they were"
+        link = self.net.addLink( self.h1, self.h2, cls=TCLink, bw=2000 )
+        self.assertEqual( self.qdiscs( link.intf1 ), [ 'noqueue' ] )
+        result = link.intf1.config( bw=2000 )
+        self.assertEqual( result[ 'tcoutputs' ], [] )
+        self.assertEqual( self.qdiscs( link.intf1 ), [ 'noqueue' ] )
+
+    def testErrors( self ):
+        "Failed commands are reported for their intf"
+        link = self.net.addLink( self.h1, self.h2, cls=TCLink, bw=10 )
+        batch = TCBatch()
+        batch.add( link.intf1, [ 'qdisc replace dev %s root pfifo' %
+                                 link.intf1 ] )
+        batch.add( link.intf2, [ 'qdisc replace dev %s root pfifo' %
+                                 link.intf2,
+                                 'qdisc add dev nonexistent root pfifo' ] )
+        outputs = batch.run()
+        self.assertEqual( outputs[ link.intf1 ], [ '' ] )
+        self.assertEqual( outputs[ link.intf2 ][ 0 ], '' )
+        self.assertIn( 'nonexistent', outputs[ link.intf2 ][ 1 ] )
+        self.assertEqual( self.qdiscs( link.intf2 ), [ 'pfifo' ] )
+
+    def testBatch( self ):
+        "Links between root namespace nodes share one batch"
+        s1 = self.net.addSwitch( 's1', cls=Node, inNamespace=False )
+        s2 = self.net.addSwitch( 's2', cls=Node, inNamespace=False )
+        with TCBatch() as batch:
+            links = [ self.net.addLink( s1, s2, cls=TCLink, bw=10 )
+                      for _ in range( 20 ) ]
+            links.append( self.net.addLink( self.h1, s1, cls=TCLink,
+                                            bw=10, use_tbf=True ) )
+            self.assertEqual( self.qdiscs( links[ 0 ].intf1 ), [ 'noqueue' ] )
+            self.assertEqual( len( batch.entries ), 2 )
+            self.assertEqual( len( batch.entries[ TCBatch.nsKey( s1 ) ][ 2 ] ),
+                              20 * 2 * 2 + 1 )
+        self.assertIsNone( TCBatch.active() )
+        for link in links[ :-1 ]:
+            self.assertEqual( self.qdiscs( link.intf2 ), [ 'htb' ] )
+        self.assertEqual( self.qdiscs( links[ -1 ].intf1 ), [ 'tbf' ] )
+
+
+class testTopo( unittest.TestCase ):
+    "Test building a network with tc links"
+
+    def testBuild( self ):
+        "Topo links are configured when the network is built"
+        topo = Topo()
+        h1, h2 = topo.addHost( 'h1' ), topo.addHost( 'h2' )
+        topo.addLink( h1, h2, bw=10, use_tbf=True )
+        net = Mininet( topo, controller=None, link=TCLink )
+        try:
+            net.build()
+            intf = net[ 'h1' ].intf()
+            self.assertIsInstance( intf, TCIntf )
+            self.assertIn( 'rate 10Mbit', net[ 'h1' ].cmd(
+                'tc qdisc show dev', intf ) )
+        finally:
+            net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
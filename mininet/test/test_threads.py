@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test using nodes and networks from multiple threads."""
+
+import unittest
+
+from mininet.net import Mininet
+from mininet.node import Host
+from mininet.link import Link
+from mininet.log import setLogLevel
+
+
+class testThreads( unittest.TestCase ):
+    "Test Node locking, atomic allocation and Mininet.parallel()"
+
+    def setUp( self ):
+        self.net = Mininet( controller=None )
+
+    def tearDown( self ):
+        self.net.stop()
+
+    def testAddHosts( self ):
+        "Hosts added concurrently get unique addresses"
+        hosts = self.net.parallel(
+            lambda i: self.net.addHost( 'h%d' % i ), range( 1, 33 ),
+            workers=8 )
+        ips = set( self.net.nodeParams[ host.name ][ 'ip' ]
+                   for host in hosts )
+        self.assertEqual( len( ips ), 32 )
+        self.assertEqual( sorted( self.net.hosts, key=str ),
+                          sorted( hosts, key=str ) )
+
+    def testCmd( self ):
+        "Commands on one node from many threads don't get mixed up"
+        h1 = self.net.addHost( 'h1' )
+        outputs = self.net.parallel(
+            lambda i: h1.cmd( 'echo %d' % i ), range( 100 ), workers=20 )
+        self.assertEqual( outputs, [ '%d\r\n' % i for i in range( 100 ) ] )
+        results = self.net.parallel(
+            lambda i: h1.run( 'echo %d' % i ), range( 100 ), workers=20 )
+        self.assertEqual( results, [ ( '%d\n' % i, '', 0 )
+                                     for i in range( 100 ) ] )
+
+    def testLinks( self ):
+        "Links created concurrently get unique ports"
+        s1 = self.net.addHost( 's1', cls=Host, inNamespace=False )
+        hosts = [ self.net.addHost( 'h%d' % i ) for i in range( 1, 11 ) ]
+        self.net.parallel( lambda h: self.net.addLink( h, s1, cls=Link ),
+                           hosts )
+        self.assertEqual( sorted( s1.ports.values() ), list( range( 10 ) ) )
+        self.assertEqual( len( s1.intfList() ), 10 )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test timeouts for Node.cmd(), waitOutput() and pexec()."""
+
+import os
+import unittest
+
+from mininet.node import Node, CmdTimeout
+from mininet.nodelib import NamespaceHost
+from mininet.log import setLogLevel
+
+
+class testTimeout( unittest.TestCase ):
+    "Test stopping commands which time out"
+
+    def setUp( self ):
+        self.node = Node( 'h1' )
+
+    def tearDown( self ):
+        self.node.terminate()
+
+    def timeout( self, *args, **kwargs ):
+        "Run a command which should time out, and return the CmdTimeout"
+        with self.assertRaises( CmdTimeout ) as context:
+            self.node.cmd( *args, **kwargs )
+        self.assertFalse( self.node.waiting )
+        return context.exception
+
+    def testInterrupt( self ):
+        "Commands are interrupted, and their output so far is returned"
+        e = self.timeout( 'echo partial; sleep 10', timeout=.2 )
+        self.assertEqual( ( e.recovery, e.node, e.timeout ),
+                          ( 'interrupt', self.node, .2 ) )
+        self.assertIn( 'partial', e.output )
+        self.assertEqual( self.node.cmd( 'echo ok' ), 'ok\r\n' )
+
+    def testKill( self ):
+        "Commands which ignore SIGINT are killed, but earlier jobs aren't"
+        self.node.cmd( 'sleep 100 &' )
+        job = self.node.lastPid
+        e = self.timeout( "bash -c 'trap \"\" INT; sleep 10'",
+                          timeout=.2 )
+        self.assertEqual( e.recovery, 'kill' )
+        self.assertTrue( os.path.exists( '/proc/%d' % job ) )
+        self.assertEqual( self.node.cmd( 'echo ok' ), 'ok\r\n' )
+
+    def testRestart( self ):
+        "Restarted shells keep our namespaces"
+        pid, netns = self.node.pid, self.node.netns
+        e = self.timeout( 'sleep 10', timeout=.2, escalation=[ 'restart' ] )
+        self.assertEqual( e.recovery, 'restart' )
+        self.assertNotEqual( self.node.pid, pid )
+        self.assertEqual( self.node.cmd( 'readlink /proc/self/ns/net' ),
+                          netns + '\r\n' )
+        self.assertIsNone( self.node.holder )
+
+    def testUnstoppable( self ):
+        "Shells are restarted if no escalation step stops a command"
+        pid = self.node.pid
+        e = self.timeout( "trap '' INT; sleep 10", timeout=.2,
+                          escalation=[ 'interrupt' ] )
+        self.assertEqual( e.recovery, 'restart' )
+        self.assertNotEqual( self.node.pid, pid )
+        self.assertEqual( self.node.cmd( 'echo ok' ), 'ok\r\n' )
+
+    def testPexec( self ):
+        "pexec() stops commands which time out"
+        with self.assertRaises( CmdTimeout ) as context:
+            self.node.pexec( 'sleep 10', timeout=.2 )
+        self.assertEqual( context.exception.recovery, 'interrupt' )
+
+    def testNamespaceHost( self ):
+        "NamespaceHost commands can also time out"
+        host = NamespaceHost( 'h2' )
+        try:
+            with self.assertRaises( CmdTimeout ) as context:
+                host.cmd( 'sleep 10', timeout=.2 )
+            self.assertEqual( context.exception.recovery, 'interrupt' )
+            self.assertEqual( host.cmd( 'echo ok' ), 'ok\n' )
+        finally:
+            host.terminate()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -3,9 +3,16 @@
 """Package: mininet
    Test functions defined in mininet.util."""
 
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from subprocess import Popen, PIPE, STDOUT
 
-from mininet.util import quietRun
+from mininet.util import ( quietRun, ip6Add, ip6Parse, ip6Str, net6Parse,
+                           pwait, pmonitor, Reactor, errRun, runMany,
+                           CmdResult, monitorFiles )
 
 class testQuietRun( unittest.TestCase ):
     """Test quietRun that runs a command and returns its merged output from
@@ -35,6 +42,141 @@ def testMultipleReads( self ):
             output = quietRun(testQuietRun.getEchoCmd( n ) )
             self.assertEqual( n, len( output ) )
 
+class testErrRun( unittest.TestCase ):
+    "Test errRun() and runMany()"
+
+    def testErrRun( self ):
+        "Output is returned intact, and strings are split on whitespace"
+        out, err, ret = errRun( 'seq  100000' )
+        self.assertEqual( ( out.split(), err, ret ),
+                          ( [ str( i ) for i in range( 1, 100001 ) ],
+                            '', 0 ) )
+        self.assertEqual( errRun( 'echo out; echo err >&2; exit 3',
+                                  shell=True ),
+                          ( 'out\n', 'err\n', 3 ) )
+        self.assertEqual( errRun( [ 'sh', '-c', 'echo err >&2' ],
+                                  stderr=STDOUT ),
+                          ( 'err\n', '', 0 ) )
+
+    def testRunMany( self ):
+        "Commands run concurrently, and results are returned in order"
+        start = time.time()
+        results = runMany( [ 'sleep .2; echo %d' % i for i in range( 10 ) ],
+                           shell=True )
+        self.assertLess( time.time() - start, 1 )
+        self.assertEqual( results, [ CmdResult( '%d\n' % i, '', 0 )
+                                     for i in range( 10 ) ] )
+        self.assertEqual( runMany( [ 'true', 'false' ], parallel=1 ),
+                          [ ( '', '', 0 ), ( '', '', 1 ) ] )
+
+
+class testIP6( unittest.TestCase ):
+    "Test IPv6 address allocation helpers"
+
+    def testParse( self ):
+        "Round-trip IPv6 addresses through ints"
+        for ip in [ '::', 'fc00::1', '2001:db8::ff:0:1' ]:
+            self.assertEqual( ip6Str( ip6Parse( ip ) ), ip )
+        self.assertEqual( net6Parse( 'fc00::/48' ),
+                          ( 0xfc00 << 112, 48 ) )
+        self.assertEqual( net6Parse( 'fc00::' )[ 1 ], 64 )
+
+    def testAdd( self ):
+        "Allocate host addresses within an IPv6 subnet"
+        self.assertEqual( ip6Add( 1 ), 'fc00::1' )
+        self.assertEqual( ip6Add( 0x102,
+                                  ip6BaseNum=ip6Parse( '2001:db8:1::5' ) ),
+                          '2001:db8:1::102' )
+        self.assertRaises( AssertionError, ip6Add, 256, prefixLen=120 )
+
+class testPwait( unittest.TestCase ):
+    "Test pwait that waits for many processes concurrently"
+
+    def testExit( self ):
+        "Wait for processes to exit"
+        popens = [ Popen( [ 'sleep', '0.1' ] ) for _ in range( 10 ) ]
+        self.assertEqual( pwait( popens ), [] )
+        for popen in popens:
+            self.assertEqual( popen.returncode, 0 )
+
+    def testTimeout( self ):
+        "Return processes which are still running after timeout"
+        popen = Popen( [ 'sleep', '10' ] )
+        self.assertEqual( pwait( [ popen ], timeout=.1 ), [ popen ] )
+        popen.kill()
+        self.assertEqual( pwait( [ popen ] ), [] )
+
+
+class testReactor( unittest.TestCase ):
+    "Test Reactor and pmonitor(), which uses it"
+
+    def testPoll( self ):
+        "poll() returns registered objects which are ready"
+        reactor = Reactor()
+        pipes = [ os.pipe() for _ in range( 3 ) ]
+        fds = [ reactor.register( r, key=i, edge=( i == 2 ) )
+                for i, ( r, _w ) in enumerate( pipes ) ]
+        self.assertEqual( reactor.poll( 0 ), [] )
+        for _r, w in pipes[ 1: ]:
+            os.write( w, b'data' )
+        self.assertEqual( sorted( key for key, _events
+                                  in reactor.poll( 0 ) ), [ 1, 2 ] )
+        # Edge-triggered fds are only reported once per write
+        self.assertEqual( [ key for key, _events in reactor.poll( 0 ) ],
+                          [ 1 ] )
+        self.assertEqual( Reactor.readAvailable( fds[ 2 ] ),
+                          ( b'data', False ) )
+        os.close( pipes[ 2 ][ 1 ] )
+        self.assertEqual( Reactor.readAvailable( fds[ 2 ] ), ( b'', True ) )
+        reactor.unregister( fds[ 1 ] )
+        self.assertEqual( len( reactor ), 2 )
+        reactor.close()
+        for r, w in pipes:
+            for fd in r, w:
+                try:
+                    os.close( fd )
+                except OSError:
+                    pass
+
+    def testPmonitor( self ):
+        "pmonitor() returns complete lines from each process"
+        popens = { i: Popen( [ 'bash', '-c', 'for i in 1 2 3; do '
+                               'echo -n $i; sleep .01; echo; done; '
+                               'echo -n end' ], stdout=PIPE )
+                   for i in range( 10 ) }
+        lines = {}
+        for key, line in pmonitor( dict( popens ), timeoutms=1000 ):
+            if key is not None:
+                lines.setdefault( key, [] ).append( line )
+        for key, popen in popens.items():
+            popen.wait()
+            self.assertEqual( lines[ key ], [ '1\n', '2\n', '3\n', 'end' ] )
+
+
+class testMonitorFiles( unittest.TestCase ):
+    "Test monitorFiles(), which uses inotify"
+
+    def testMonitor( self ):
+        "New lines are returned as files are written, created and truncated"
+        tmpdir = tempfile.mkdtemp()
+        paths = { i: os.path.join( tmpdir, '%d.out' % i ) for i in range( 3 ) }
+        with open( paths[ 0 ], 'w' ) as f:
+            f.write( 'old\n' )
+        writer = Popen( [ 'bash', '-c',
+                          'sleep .1; for i in 1 2; do for f in 0 1 2; do '
+                          'echo -n $i >> %s/$f.out; echo >> %s/$f.out; '
+                          'done; done; sleep .1; echo new > %s/0.out' %
+                          ( tmpdir, tmpdir, tmpdir ) ] )
+        lines, start = {}, time.time()
+        for key, line in monitorFiles( paths, seconds=1, timeoutms=100 ):
+            if key is not None:
+                lines.setdefault( key, [] ).append( line )
+        writer.wait()
+        shutil.rmtree( tmpdir )
+        self.assertTrue( time.time() - start < 2 )
+        self.assertEqual( lines, { 0: [ 'old', '1', '2', 'new' ],
+                                   1: [ '1', '2' ], 2: [ '1', '2' ] } )
+
 
 if __name__ == "__main__":
     unittest.main()
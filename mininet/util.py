@@ -1,22 +1,33 @@
 "Utility functions for Mininet."
 
 import codecs
+import errno
 import os
 import re
+import socket
+import struct
 import sys
 import random
+import select
+import threading
 
 from collections import namedtuple
 from fcntl import fcntl, F_GETFL, F_SETFL
 from functools import partial
+from multiprocessing.pool import ThreadPool
 from os import O_NONBLOCK
 from resource import getrlimit, setrlimit, RLIMIT_NPROC, RLIMIT_NOFILE
 from select import poll, POLLIN, POLLHUP
 from subprocess import call, check_call, Popen, PIPE, STDOUT
 from sys import exit  # pylint: disable=redefined-builtin
-from time import sleep
+from time import sleep, time as now
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 
 from mininet.log import output, info, error, warn, debug
+from mininet.journal import journal
 
 # pylint: disable=too-many-arguments
 
@@ -130,7 +141,8 @@ def oldQuietRun( *cmd ):
 
 CmdResult = namedtuple( 'CmdResult', 'out err ret' )
 
-# pylint: disable=too-many-branches,too-many-statements
+cmdReadSize = 65536  # bytes per read in errRun()
+
 def errRun( *cmd, **kwargs ):
     """Run a command and return stdout, stderr and return code
        cmd: string or list of command and args
@@ -148,51 +160,39 @@ def errRun( *cmd, **kwargs ):
         cmd = cmd[ 0 ]
     # Allow passing in a list or a string
     if isinstance( cmd, BaseString ) and not shell:
-        cmd = cmd.split( ' ' )
-        cmd = [ str( arg ) for arg in cmd ]
+        cmd = [ str( arg ) for arg in cmd.split() ]
     elif isinstance( cmd, list ) and shell:
         cmd = " ".join( arg for arg in cmd )
     debug( '*** errRun:', cmd, '\n' )
     # pylint: disable=consider-using-with
     popen = Popen( cmd, stdout=PIPE, stderr=stderr, shell=shell )
     # We use poll() because select() doesn't work with large fd numbers,
-    # and thus communicate() doesn't work either
-    out, err = '', ''
-    poller = poll()
-    poller.register( popen.stdout, POLLIN )
-    fdToFile = { popen.stdout.fileno(): popen.stdout }
-    fdToDecoder = { popen.stdout.fileno(): getincrementaldecoder() }
-    outDone, errDone = False, True
+    # and thus communicate() doesn't work either (in Python 2).
+    # Output is accumulated as bytes, and only decoded at the end.
+    chunks = { popen.stdout.fileno(): [] }
     if popen.stderr:
-        fdToFile[ popen.stderr.fileno() ] = popen.stderr
-        fdToDecoder[ popen.stderr.fileno() ] = getincrementaldecoder()
-        poller.register( popen.stderr, POLLIN )
-        errDone = False
-    while not outDone or not errDone:
-        readable = poller.poll()
-        for fd, event in readable:
-            f = fdToFile[ fd ]
-            decoder = fdToDecoder[ fd ]
-            if event & ( POLLIN | POLLHUP ):
-                data = decoder.decode( f.read( 1024 ) )
+        chunks[ popen.stderr.fileno() ] = []
+    decoders = { fd: getincrementaldecoder() for fd in chunks }
+    poller = poll()
+    for fd in chunks:
+        poller.register( fd, POLLIN )
+    remaining = len( chunks )
+    while remaining:
+        for fd, event in poller.poll():
+            data = ( os.read( fd, cmdReadSize )
+                     if event & ( POLLIN | POLLHUP ) else b'' )
+            if data:
+                chunks[ fd ].append( data )
                 if echo:
-                    output( data )
-                if f == popen.stdout:
-                    out += data
-                    if data == '':
-                        outDone = True
-                elif f == popen.stderr:
-                    err += data
-                    if data == '':
-                        errDone = True
-            else:  # something unexpected
-                if f == popen.stdout:
-                    outDone = True
-                elif f == popen.stderr:
-                    errDone = True
+                    output( decoders[ fd ].decode( data ) )
+            else:
+                # EOF, or something unexpected
                 poller.unregister( fd )
-
+                remaining -= 1
     returncode = popen.wait()
+    out = decode( b''.join( chunks[ popen.stdout.fileno() ] ) )
+    err = ( decode( b''.join( chunks[ popen.stderr.fileno() ] ) )
+            if popen.stderr else '' )
     # Python 3 complains if we don't explicitly close these
     popen.stdout.close()
     if stderr == PIPE:
@@ -200,7 +200,26 @@ def errRun( *cmd, **kwargs ):
     debug( out, err, returncode )
     return CmdResult( out, err, returncode )
 
-# pylint: enable=too-many-branches
+def runMany( cmds, parallel=None, **kwargs ):
+    """Run independent commands concurrently using errRun()
+       cmds: list of commands (each a string or list)
+       parallel: maximum number of commands at once
+                 (default: all of them, up to 64)
+       kwargs: as for errRun()
+       returns: list of CmdResults, in the order of cmds"""
+    cmds = list( cmds )
+    if not cmds:
+        return []
+    parallel = min( parallel or 64, len( cmds ) )
+    if parallel == 1:
+        return [ errRun( cmd, **kwargs ) for cmd in cmds ]
+    pool = ThreadPool( parallel )
+    try:
+        return pool.map( lambda cmd: errRun( cmd, **kwargs ), cmds )
+    finally:
+        pool.close()
+        pool.join()
+
 
 def errFail( *cmd, **kwargs ):
     "Run a command using errRun and raise exception on nonzero exit"
@@ -282,6 +301,11 @@ def makeIntfPair( intf1, intf2, addr1=None, addr2=None, node1=None, node2=None,
     if cmdOutput:
         raise Exception( "Error creating interface pair (%s,%s): %s " %
                          ( intf1, intf2, cmdOutput ) )
+    # Pairs with an end in a private namespace vanish along with it,
+    # but a pair in the root namespace must be deleted explicitly
+    if not ( ( node1 and node1.inNamespace ) or
+             ( node2 and node2.inNamespace ) ):
+        journal.add( 'intf', intf1 )
 
 def retry( retries, delaySecs, fn, *args, **keywords ):
     """Try something several times before giving up.
@@ -453,6 +477,56 @@ def netParse( ipstr ):
         prefixLen = 24
     return ipParse( ip ), prefixLen
 
+def ip6Str( ip ):
+    """Generate IPv6 address string from an unsigned int.
+       ip: unsigned 128-bit int
+       returns: compressed IPv6 address string, e.g. fc00::1"""
+    packed = struct.pack( '!QQ', ip >> 64, ip & 0xffffffffffffffff )
+    return socket.inet_ntop( socket.AF_INET6, packed )
+
+def ip6Parse( ip ):
+    "Parse an IPv6 address and return an unsigned int."
+    hi, lo = struct.unpack( '!QQ', socket.inet_pton( socket.AF_INET6, ip ) )
+    return ( hi << 64 ) | lo
+
+def ip6Add( i, prefixLen=64, ip6BaseNum=0xfc00 << 112 ):
+    """Return IPv6 address string from ints
+       i: int to be added to ip6base
+       prefixLen: optional IPv6 prefix length
+       ip6BaseNum: option base IPv6 address as int
+       returns IPv6 address as string"""
+    imax = ( 1 << ( 128 - prefixLen ) ) - 1
+    assert i <= imax, 'Not enough IPv6 addresses in the subnet'
+    mask = ( ( 1 << 128 ) - 1 ) ^ imax
+    return ip6Str( ( ip6BaseNum & mask ) + i )
+
+def net6Parse( ip6str ):
+    """Parse an IPv6 network specification, returning
+       address and prefix len as unsigned ints"""
+    if '/' in ip6str:
+        ip, pf = ip6str.split( '/' )
+        prefixLen = int( pf )
+    # if no prefix is specified, set the prefix to 64
+    else:
+        ip = ip6str
+        prefixLen = 64
+    return ip6Parse( ip ), prefixLen
+
+def isIp6Valid( ip ):
+    """Validator for IPv6 address"""
+    try:
+        socket.inet_pton( socket.AF_INET6, ip )
+    except ( socket.error, ValueError, TypeError ):
+        return False
+    return True
+
+def isPrefix6Valid( prefix ):
+    """Validator for IPv6 address prefix"""
+    try:
+        return 0 <= int( prefix ) <= 128
+    except ( ValueError, TypeError ):
+        return False
+
 def checkInt( s ):
     "Check if input string is an int"
     try:
@@ -478,6 +552,125 @@ def makeNumeric( s ):
     else:
         return s
 
+
+def listRemove( items, item ):
+    """Remove item from list items, which is cheapest (and common, e.g.
+       when nodes are added and deleted in turn) if it is the last one
+       raises ValueError if item is missing"""
+    if items and items[ -1 ] is item:
+        items.pop()
+    else:
+        items.remove( item )
+
+
+# Event monitoring
+
+class Reactor( object ):
+    """An epoll-based event loop for monitoring many nodes and
+       processes at once. Objects are registered once, along with
+       their fds, and poll() returns the objects which are ready:
+
+           reactor = Reactor()
+           for host in hosts:
+               reactor.register( host.stdout, host )
+           for host, events in reactor.poll( timeoutms ):
+               ...
+
+       Edge-triggered objects are only returned when new data arrives,
+       so their fds are made non-blocking and should be drained with
+       readAvailable(). Regular files, which epoll doesn't support, are
+       always ready, as they are for poll()."""
+
+    readSize = 65536  # bytes per read in readAvailable()
+
+    def __init__( self ):
+        self.epoller = select.epoll()
+        self.keys = {}  # registered fds to objects
+        self.files = set()  # registered fds which epoll doesn't support
+        self.lock = threading.Lock()  # protects keys
+
+    def __len__( self ):
+        return len( self.keys )
+
+    def register( self, f, key=None, edge=False ):
+        """Register (or re-register) an fd for reading
+           f: fd or object with fileno()
+           key: object to return from poll() (default: f)
+           edge: edge-triggered?
+           returns: fd"""
+        fd = f if isinstance( f, int ) else f.fileno()
+        mask = select.EPOLLIN
+        if edge:
+            mask |= select.EPOLLET
+            fcntl( fd, F_SETFL, fcntl( fd, F_GETFL ) | O_NONBLOCK )
+        with self.lock:
+            try:
+                if fd in self.keys and fd not in self.files:
+                    self.epoller.modify( fd, mask )
+                else:
+                    self.epoller.register( fd, mask )
+            except ( IOError, OSError ) as e:
+                if e.errno != errno.EPERM:
+                    raise
+                self.files.add( fd )
+            self.keys[ fd ] = f if key is None else key
+        return fd
+
+    def unregister( self, fd ):
+        """Unregister an fd, which may already have been closed
+           fd: fd returned by register()"""
+        with self.lock:
+            if self.keys.pop( fd, None ) is None:
+                return
+            if fd in self.files:
+                self.files.remove( fd )
+                return
+            try:
+                self.epoller.unregister( fd )
+            except ( IOError, OSError, ValueError ):
+                # (closed fds are removed automatically)
+                pass
+
+    def poll( self, timeoutms=None ):
+        """Wait for registered fds to be ready
+           timeoutms: timeout in ms (None or negative: wait indefinitely)
+           returns: list of ( key, epoll events ), empty on timeout"""
+        timeout = ( -1 if timeoutms is None or timeoutms < 0
+                    else timeoutms / 1000.0 )
+        files = [ ( fd, select.EPOLLIN ) for fd in self.files ]
+        try:
+            ready = self.epoller.poll( 0 if files else timeout ) + files
+        except ( IOError, OSError ) as e:
+            # Python 2 doesn't retry after signals
+            if e.errno != errno.EINTR:
+                raise
+            return []
+        with self.lock:
+            return [ ( self.keys[ fd ], events ) for fd, events in ready
+                     if fd in self.keys ]
+
+    @classmethod
+    def readAvailable( cls, fd ):
+        """Read everything available from a non-blocking fd
+           returns: data (bytes), EOF reached?"""
+        chunks = []
+        while True:
+            try:
+                data = os.read( fd, cls.readSize )
+            except ( IOError, OSError ) as e:
+                if e.errno in ( errno.EAGAIN, errno.EWOULDBLOCK ):
+                    return b''.join( chunks ), False
+                # e.g. EIO from a pty whose other end is closed
+                return b''.join( chunks ), True
+            if not data:
+                return b''.join( chunks ), True
+            chunks.append( data )
+
+    def close( self ):
+        "Release our epoll fd"
+        self.epoller.close()
+
+
 # Popen support
 
 def pmonitor(popens, timeoutms=500, readline=True,
@@ -488,40 +681,365 @@ def pmonitor(popens, timeoutms=500, readline=True,
        readline: return single line of output
        yields: host, line/output (if any)
        terminates: when all EOFs received"""
-    poller = poll()
-    fdToHost = {}
-    fdToDecoder = {}
+    reactor = Reactor()
+    fds, decoders, partials = {}, {}, {}
     for host, popen in popens.items():
-        fd = popen.stdout.fileno()
-        fdToHost[ fd ] = host
-        fdToDecoder[ fd ] = getincrementaldecoder()
-        poller.register( fd, POLLIN )
-        flags = fcntl( fd, F_GETFL )
-        fcntl( fd, F_SETFL, flags | O_NONBLOCK )
-    # pylint: disable=too-many-nested-blocks
-    while popens:
-        fds = poller.poll( timeoutms )
-        if fds:
-            for fd, event in fds:
-                host = fdToHost[ fd ]
-                decoder = fdToDecoder[ fd ]
-                popen = popens[ host ]
-                if event & ( POLLIN | POLLHUP ):
-                    while True:
-                        try:
-                            f = popen.stdout
-                            line = decoder.decode( f.readline() if readline
-                                                   else f.read( readmax ) )
-                        except IOError:
-                            line = ''
-                        if line == '':
-                            break
-                        yield host, line
-                if event & POLLHUP:
-                    poller.unregister( fd )
+        fds[ host ] = reactor.register( popen.stdout, host, edge=True )
+        decoders[ host ] = getincrementaldecoder()
+        partials[ host ] = ''
+    try:
+        while popens:
+            ready = reactor.poll( timeoutms )
+            if not ready:
+                yield None, ''
+            for host, _events in ready:
+                data, eof = reactor.readAvailable( fds[ host ] )
+                text = decoders[ host ].decode( data )
+                if readline:
+                    # Hold on to partial lines until they are complete
+                    lines = ( partials[ host ] + text ).split( '\n' )
+                    partials[ host ] = lines.pop()
+                    for line in lines:
+                        yield host, line + '\n'
+                    if eof and partials[ host ]:
+                        yield host, partials[ host ]
+                else:
+                    for i in range( 0, len( text ), readmax ):
+                        yield host, text[ i : i + readmax ]
+                if eof:
+                    reactor.unregister( fds[ host ] )
                     del popens[ host ]
-        else:
-            yield None, ''
+    finally:
+        reactor.close()
+
+def pwait( popens, timeout=None, pidfds=None ):
+    """Wait for a collection of Popen objects to exit, concurrently.
+       Uses pidfds and epoll where available (Python 3.9+, Linux 5.3+)
+       and falls back to polling otherwise.
+       popens: iterable of Popen objects
+       timeout: overall timeout in seconds (None: wait indefinitely)
+       pidfds: optional dict of Popen objects to pidfds to use, which
+               are left open
+       returns: list of Popens which are still running"""
+    running = [ popen for popen in popens if popen.poll() is None ]
+    deadline = None if timeout is None else now() + timeout
+    pidfds = pidfds or {}
+    fdToPopen, ours = {}, set()
+    pidfdOpen = getattr( os, 'pidfd_open', None )
+    if running and ( pidfdOpen or pidfds ) and hasattr( select, 'epoll' ):
+        epoller = select.epoll()
+        for popen in running:
+            fd = pidfds.get( popen )
+            if fd is None and pidfdOpen:
+                try:
+                    fd = pidfdOpen( popen.pid )
+                    ours.add( fd )
+                except OSError:
+                    continue
+            if fd is None:
+                continue
+            fdToPopen[ fd ] = popen
+            epoller.register( fd, select.EPOLLIN )
+        try:
+            while fdToPopen:
+                remaining = -1 if deadline is None else deadline - now()
+                if deadline is not None and remaining <= 0:
+                    break
+                for fd, _event in epoller.poll( remaining ):
+                    fdToPopen.pop( fd ).wait()
+                    epoller.unregister( fd )
+        finally:
+            for fd in ours:
+                os.close( fd )
+            epoller.close()
+    # Poll anything we couldn't get a pidfd for
+    delay = .001
+    running = [ popen for popen in running if popen.poll() is None ]
+    while running and ( deadline is None or now() < deadline ):
+        sleep( delay )
+        delay = min( delay * 2, .1 )
+        running = [ popen for popen in running if popen.poll() is None ]
+    return running
+
+
+# Monitoring output files
+
+# inotify event masks, and struct inotify_event (wd, mask, cookie, len)
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+IN_Q_OVERFLOW = 0x4000
+inotifyEvent = struct.Struct( 'iIII' )
+
+def monitorFiles( outfiles, seconds=None, timeoutms=500, start=None ):
+    """Monitor many output files (e.g. of background commands) for
+       new lines, using a single inotify fd rather than a tail process
+       for each file. Files are watched through their directories, so
+       they may be created, truncated or replaced while we run.
+       outfiles: dict of host (or any key) to file path
+       seconds: how long to monitor (default: indefinitely)
+       timeoutms: time to wait for output before yielding ( None, '' )
+       start: 'end' to skip existing output (default: read it first)
+       yields: ( host, line ) for each new line, without its newline"""
+    init, addWatch = libcFn( 'inotify_init1' ), libcFn( 'inotify_add_watch' )
+    if not init or not addWatch:
+        raise Exception( 'monitorFiles: inotify is not available' )
+    hosts, files, partials = {}, {}, {}  # paths to hosts, files, last lines
+    names, dirs = {}, {}  # ( dir, name ) to path, watch to dir
+    for host, path in outfiles.items():
+        path = os.path.abspath( path )
+        hosts.setdefault( path, [] ).append( host )
+        names[ os.path.split( path ) ] = path
+    ifd = init( O_NONBLOCK | getattr( os, 'O_CLOEXEC', 0 ) )
+    poller = poll()
+    poller.register( ifd, POLLIN )
+
+    def reopen( path ):
+        "(Re)open path, which may have been replaced"
+        if files.get( path ):
+            files[ path ].close()
+        try:
+            # pylint: disable=consider-using-with
+            files[ path ] = open( path, 'rb' )
+        except IOError:
+            files[ path ] = None
+        partials[ path ] = b''
+
+    def readLines( path ):
+        "Return new lines from path"
+        f = files[ path ]
+        if f is None:
+            return []
+        if os.fstat( f.fileno() ).st_size < f.tell():
+            # Truncated: start again
+            f.seek( 0 )
+            partials[ path ] = b''
+        lines = ( partials[ path ] + f.read() ).split( b'\n' )
+        partials[ path ] = lines.pop()
+        return [ decode( line ) for line in lines ]
+
+    try:
+        for dirname in set( dirname for dirname, _name in names ):
+            wd = addWatch( ifd, encode( dirname ),
+                           IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE |
+                           IN_MOVED_TO )
+            dirs[ wd ] = dirname
+        for path in hosts:
+            reopen( path )
+            if start == 'end' and files[ path ]:
+                files[ path ].seek( 0, os.SEEK_END )
+        changed = list( hosts )
+        end = None if seconds is None else now() + seconds
+        while True:
+            for path in changed:
+                for line in readLines( path ):
+                    for host in hosts[ path ]:
+                        yield host, line
+            if end is not None and now() >= end:
+                break
+            wait = ( timeoutms if end is None else
+                     min( timeoutms, max( 0, end - now() ) * 1000 ) )
+            changed = []
+            if not poller.poll( wait ):
+                yield None, ''
+                continue
+            data = Reactor.readAvailable( ifd )[ 0 ]
+            offset = 0
+            while offset < len( data ):
+                wd, mask, _cookie, size = inotifyEvent.unpack_from(
+                    data, offset )
+                offset += inotifyEvent.size
+                name = data[ offset: offset + size ].rstrip( b'\0' )
+                offset += size
+                if mask & IN_Q_OVERFLOW:
+                    # We missed some events, so check everything
+                    changed = list( hosts )
+                    continue
+                path = names.get( ( dirs.get( wd ), decode( name ) ) )
+                if path is None:
+                    continue
+                if mask & ( IN_CREATE | IN_MOVED_TO ):
+                    reopen( path )
+                if path not in changed:
+                    changed.append( path )
+    finally:
+        for f in files.values():
+            if f:
+                f.close()
+        os.close( ifd )
+
+
+# Spawning processes in node namespaces without mnexec
+
+CLONE_FS, CLONE_NEWNS, CLONE_NEWNET = 0x00000200, 0x00020000, 0x40000000
+
+def libcFn( name ):
+    """Return a wrapper for libc function name which returns its
+       result and raises OSError on failure (when it returns -1), e.g.
+       setns() for Python < 3.12, or None if it isn't available"""
+    try:
+        import ctypes
+        fn = getattr( ctypes.CDLL( None, use_errno=True ), name )
+    except ( ImportError, OSError, AttributeError ):
+        return None
+
+    def wrapper( *args ):
+        "Call libc function, raising OSError on failure"
+        result = fn( *args )
+        if result == -1:
+            err = ctypes.get_errno()
+            raise OSError( err, os.strerror( err ) )
+        return result
+    return wrapper
+
+
+setns = getattr( os, 'setns', None ) or libcFn( 'setns' )
+unshare = getattr( os, 'unshare', None ) or libcFn( 'unshare' )
+
+def nsOpen( pid ):
+    """Open the network and mount namespaces of pid
+       pid: process id, or e.g. 'thread-self'
+       returns: ( netfd, mntfd )"""
+    flags = os.O_RDONLY | getattr( os, 'O_CLOEXEC', 0 )
+    return tuple( os.open( '/proc/%s/ns/%s' % ( pid, ns ), flags )
+                  for ns in ( 'net', 'mnt' ) )
+
+class NamespaceSpawner( object ):
+    """Start processes in other namespaces and cgroups, as mnexec -da
+       (and -g, -r) would, without exec'ing mnexec.
+       Namespaces (and v1 cgroups and scheduling policy) can belong to
+       a single thread, and are inherited by its children, so we keep
+       a thread of our own, with its own root and cwd, which moves into
+       the target namespaces and then starts the process using Popen()
+       (which can use vfork(), unlike Popen( preexec_fn=setns ))."""
+
+    cgroupDir = '/sys/fs/cgroup'
+
+    def __init__( self ):
+        self.requests = Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.home = {}  # cgroup controller to our thread's cgroup
+        self.homeFds = None  # our own namespaces
+
+    @staticmethod
+    def available():
+        "Can we spawn processes without mnexec?"
+        return bool( setns and unshare and
+                     hasattr( threading, 'get_native_id' ) )
+
+    def call( self, fn, *args, **kwargs ):
+        """Call fn( *args, **kwargs ) in our thread
+           returns: result of fn"""
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread( target=self.serve,
+                                                name='NamespaceSpawner' )
+                self.thread.daemon = True
+                self.thread.start()
+        reply = Queue( 1 )
+        self.requests.put( ( fn, args, kwargs, reply ) )
+        result, exception = reply.get()
+        if exception:
+            raise exception
+        return result
+
+    def serve( self ):
+        "Our thread: handle requests from call()"
+        # Don't share our root and cwd with the rest of the process
+        unshare( CLONE_FS )
+        self.homeFds = nsOpen( 'thread-self' )
+        with open( '/proc/thread-self/cgroup' ) as f:
+            for line in f:
+                _id, controllers, path = line.strip().split( ':', 2 )
+                for controller in controllers.split( ',' ):
+                    self.home[ controller ] = path
+        while True:
+            fn, args, kwargs, reply = self.requests.get()
+            try:
+                reply.put( ( fn( *args, **kwargs ), None ) )
+            except Exception as e:  # pylint: disable=broad-except
+                reply.put( ( None, e ) )
+
+    def joinCgroups( self, groups ):
+        """Move our thread into cgroups
+           groups: list of ( controller, path )
+           returns: number of cgroups joined"""
+        count = 0
+        tid = str( threading.get_native_id() )
+        for controller, path in groups:
+            try:
+                with open( '%s/%s%s/tasks' % ( self.cgroupDir, controller,
+                                               path ), 'w' ) as f:
+                    f.write( tid )
+                count += 1
+            except ( IOError, OSError ):
+                pass
+        return count
+
+    def spawn( self, nsfds, cmd, cwd, cgroup, rtprio, params ):
+        "Internal method: start process in our thread"
+        groups = [ ( controller, '/' + cgroup ) for controller in
+                   ( 'cpu', 'cpuacct', 'cpuset' ) ] if cgroup else []
+        # We must always return home, even if we fail half way
+        try:
+            self.enter( nsfds )
+            # Our root and cwd are now those of the mount namespace
+            os.chdir( cwd )
+            if groups and not self.joinCgroups( groups ):
+                raise Exception( 'could not add to cgroup %s' % cgroup )
+            if rtprio:
+                os.sched_setscheduler( 0, os.SCHED_RR,
+                                       os.sched_param( rtprio ) )
+            return Popen( cmd, start_new_session=True, **params )
+        finally:
+            if rtprio:
+                os.sched_setscheduler( 0, os.SCHED_OTHER,
+                                       os.sched_param( 0 ) )
+            if groups:
+                self.joinCgroups( [ ( controller, self.home.get(
+                    controller, '/' ) ) for controller, _path in groups ] )
+            # Don't keep the namespaces (and their interfaces) alive
+            self.enter( self.homeFds )
+            os.chdir( '/' )
+
+    def nsSocket( self, nsfds, args ):
+        "Internal method: create socket in our thread"
+        try:
+            self.enter( nsfds )
+            return socket.socket( *args )
+        finally:
+            self.enter( self.homeFds )
+
+    @staticmethod
+    def enter( nsfds ):
+        "Move our thread into namespaces nsfds"
+        netfd, mntfd = nsfds
+        setns( netfd, CLONE_NEWNET )
+        setns( mntfd, CLONE_NEWNS )
+
+    def popen( self, nsfds, cmd, cwd=None, cgroup=None, rtprio=None,
+               **params ):
+        """Start a process in the namespaces nsfds, as Popen( cmd )
+           nsfds: ( netfd, mntfd ) from nsOpen()
+           cmd: command (list)
+           cwd: working directory (default: ours)
+           cgroup: name of cgroup to add process to (optional)
+           rtprio: SCHED_RR priority to run with (optional)
+           params: other Popen() keyword args
+           returns: Popen object"""
+        cwd = cwd or os.getcwd()
+        return self.call( self.spawn, nsfds, cmd, cwd, cgroup, rtprio,
+                          params )
+
+    def socket( self, nsfds, *args ):
+        """Create a socket in the network namespace of nsfds, to which
+           it then belongs (e.g. a netlink socket)
+           nsfds: ( netfd, mntfd ) from nsOpen()
+           args: socket.socket() args
+           returns: socket"""
+        return self.call( self.nsSocket, nsfds, args )
+
+
+spawner = NamespaceSpawner()
 
 # Other stuff we use
 def sysctlTestAndSet( name, limit ):